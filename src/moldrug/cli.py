@@ -18,6 +18,13 @@ from rdkit import Chem
 from moldrug import __version__, constraintconf, utils
 
 
+def _load_checkpoint(file: str):
+    # The run log (cpt.runlog) or a pickled object (cpt.pbz2 and the *_result.pbz2 files)
+    if file.endswith('.runlog'):
+        return utils.RunLog(file).load()
+    return utils.decompress_pickle(file)
+
+
 class CommandLineHelper:
     def __init__(self, parser) -> None:
         self.args = parser.parse_args()
@@ -135,7 +142,8 @@ class CommandLineHelper:
                 # Add default value in case it is not provided for keyword arguments
                 list_of_keywords = [
                     'beta', 'pc', 'get_similar', 'mutate_crem_kwargs',
-                    'save_pop_every_gen', 'checkpoint', 'deffnm',
+                    'save_pop_every_gen', 'checkpoint', 'deffnm', 'mode', 'parallel_mutation',
+                    'crem_cache', 'mcs_timeout', 'selection', 'tournament_size', 'early_exit',
                 ]
                 for param in inspect.signature(self.TypeOfRun).parameters.values():
                     if (param.kind == param.POSITIONAL_OR_KEYWORD and
@@ -157,6 +165,13 @@ class CommandLineHelper:
                     'save_pop_every_gen': InitArgs['save_pop_every_gen'],
                     'checkpoint': InitArgs['checkpoint'],
                     'deffnm': InitArgs['deffnm'],
+                    'mode': InitArgs['mode'],
+                    'parallel_mutation': InitArgs['parallel_mutation'],
+                    'crem_cache': InitArgs['crem_cache'],
+                    'mcs_timeout': InitArgs['mcs_timeout'],
+                    'selection': InitArgs['selection'],
+                    'tournament_size': InitArgs['tournament_size'],
+                    'early_exit': InitArgs['early_exit'],
                 }
 
             # Sanity check
@@ -197,14 +212,16 @@ class CommandLineHelper:
                     pbz2 = f"{self.configuration[job]['deffnm']}_result.pbz2"
 
             # If there is a continuation file, use this
-            if os.path.isfile("cpt.pbz2"):
-                pbz2 = 'cpt.pbz2'
-                iter_done = utils.decompress_pickle(pbz2).NumGens
+            if os.path.isfile("cpt.runlog") or os.path.isfile("cpt.pbz2"):
+                # cpt.pbz2 is the checkpoint of previous versions of moldrug
+                pbz2 = 'cpt.runlog' if os.path.isfile("cpt.runlog") else 'cpt.pbz2'
+                iter_done = _load_checkpoint(pbz2).NumGens
                 total_iter = 0
                 for job in self.configuration:
                     total_iter += self.configuration[job]['maxiter']
                     if total_iter >= iter_done:
-                        del self.FollowConfig[job]
+                        # The main job is not part of FollowConfig
+                        self.FollowConfig.pop(job, None)
                         break
             elif pbz2:
                 iter_done = utils.decompress_pickle(pbz2).NumGens
@@ -226,7 +243,7 @@ class CommandLineHelper:
         self._get_continuation_point()
 
         if self.pbz2:
-            self.moldrugClass = utils.decompress_pickle(self.pbz2)
+            self.moldrugClass = _load_checkpoint(self.pbz2)
             self.moldrugClass.maxiter = self.new_maxiter
         else:
             # Initialize the class from scratch
@@ -334,8 +351,9 @@ def __moldrug_cmd():
             print(f'The job {job} finished!')
 
     # Clean checkpoint on normal end
-    if os.path.isfile('cpt.pbz2'):
-        os.remove('cpt.pbz2')
+    for cpt in ['cpt.runlog', 'cpt.pbz2']:
+        if os.path.isfile(cpt):
+            os.remove(cpt)
 
 
 def __constraintconf_cmd():
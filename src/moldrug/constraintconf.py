@@ -19,6 +19,7 @@ and the class ProteinLigandClashFilter:
     * Fix handling of some possible exceptions.
 """
 import os
+import time
 from copy import deepcopy
 from typing import Optional, Union
 
@@ -59,7 +60,7 @@ def duplicate_conformers(m: Chem.rdchem.Mol, new_conf_idx: int, rms_limit: float
     return any(i < rms_limit for i in rmslist)
 
 
-def get_mcs(mol_one: Chem.rdchem.Mol, mol_two: Chem.rdchem.Mol) -> str:
+def get_mcs(mol_one: Chem.rdchem.Mol, mol_two: Chem.rdchem.Mol, timeout: Union[int, None] = None) -> str:
     """
     Code to find the maximum common substructure between two molecules.
 
@@ -69,14 +70,17 @@ def get_mcs(mol_one: Chem.rdchem.Mol, mol_two: Chem.rdchem.Mol) -> str:
         The first molecule.
     mol_two : Chem.rdchem.Mol
         The second molecule.
+    timeout : Union[int, None], optional
+        Maximum time (in seconds) for rdkit.Chem.rdFMCS.FindMCS, by default None (no limit)
 
     Returns
     -------
     str
         The SMILES string of the Maximum Common Substructure (MCS).
     """
+    mcs_kwargs = {'timeout': max(1, int(timeout))} if timeout is not None else {}
     mcs_smarts = Chem.MolFromSmarts(
-        rdFMCS.FindMCS([mol_one, mol_two], completeRingsOnly=True, matchValences=True).smartsString)
+        rdFMCS.FindMCS([mol_one, mol_two], completeRingsOnly=True, matchValences=True, **mcs_kwargs).smartsString)
     mcs_smi = Chem.MolToSmiles(mcs_smarts)
     # Workaround in case of fails
     if not Chem.MolFromSmiles(mcs_smi):
@@ -129,7 +133,8 @@ def generate_conformers(mol: Chem.rdchem.Mol,
                         num_conf: int,
                         ref_smi: str = None,
                         minimum_conf_rms: Optional[float] = None,
-                        randomseed: Union[int, None] = None
+                        randomseed: Union[int, None] = None,
+                        timeout: Union[float, None] = None
                         ) -> Chem.rdchem.Mol:
     """
     Generate constrained conformers
@@ -151,6 +156,10 @@ def generate_conformers(mol: Chem.rdchem.Mol,
        Provide a seed for the random number generator so that
        the same coordinates can be obtained for a molecule on multiple runs.
        If None, the RNG will not be seeded, by default None
+    timeout : Union[float, None], optional
+        Maximum wall-clock time (in seconds). It is checked between embeddings (a soft limit, one embedding
+        is never interrupted), when it is reached no more conformers are generated and the ones already
+        generated are returned, by default None (no limit)
 
     Returns
     -------
@@ -160,15 +169,15 @@ def generate_conformers(mol: Chem.rdchem.Mol,
         current directory generate_conformers_error.log with the nature of the Exception.
         The molecule does not have explicit hydrogens.
     """
+    deadline = time.monotonic() + timeout if timeout is not None else None
     # Creating the error directory if needed
-    if not os.path.isdir('error'):
-        os.makedirs('error')
+    os.makedirs('error', exist_ok=True)
     # if SMILES to be fixed are not given, assume to the MCS
     if ref_smi:
         if not Chem.MolFromSmiles(ref_smi):
             raise ValueError("The provided ref_smi is not valid.")
     else:
-        ref_smi = get_mcs(mol, ref_mol)
+        ref_smi = get_mcs(mol, ref_mol, timeout=timeout)
         if not Chem.MolFromSmiles(ref_smi):
             raise ValueError("generate_conformers fails generating ref_smi based on the MCS between mol and ref_mol")
 
@@ -186,6 +195,8 @@ def generate_conformers(mol: Chem.rdchem.Mol,
         # Generate conformers with constrained embed
         dup_count = 0
         for i in range(num_conf):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
             temp_mol = Chem.Mol(mol_wh)  # copy to avoid inplace changes
             try:
                 AllChem.ConstrainedEmbed(temp_mol, core1, randomseed=i)
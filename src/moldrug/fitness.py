@@ -1,7 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import glob
+import hashlib
+import json
 import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from functools import partial
+from multiprocessing import util as mp_util
 from typing import Dict, List, Union
 
 import numpy as np
@@ -198,8 +211,8 @@ def __get_mol_cost(mol: Chem.rdchem.Mol,
                 results['vina_score'] = float(line.split(':')[1].split()[0])
                 break
     else:
-        best_energy = utils.VINA_OUT(os.path.join(wd, 'ligand_out.pdbqt')).BestEnergy()
-        results['vina_score'] = best_energy.freeEnergy
+        vina_output = utils.VinaOutput.from_file(os.path.join(wd, 'ligand_out.pdbqt'))
+        results['vina_score'] = float(vina_output.energies[vina_output.best()])
         pdbqt_mol = PDBQTMolecule.from_file(os.path.join(wd, 'ligand_out.pdbqt'), skip_typing=True)
         with Chem.SDWriter(os.path.join(wd, 'ligand_out.sdf')) as w:
             w.write(RDKitMolCreate.from_pdbqt_mol(pdbqt_mol)[0])
@@ -225,6 +238,291 @@ def __get_mol_cost(mol: Chem.rdchem.Mol,
     return results
 
 
+class DockingCache:
+    """On-disk cache of docking results based on SQLite. Every entry is identified by a
+    key built from the canonical SMILES of the molecule, the content of the receptor file(s),
+    the box and the parameters of the docking (see :meth:`moldrug.fitness.DockingCache.key`).
+    It stores the vina score and the pdbqt string of the best pose.
+    The Least Recently Used entries are removed when the database is bigger than ``max_size``.
+    Several processes (e.g. the workers of :meth:`moldrug.utils.WorkerPool`) can safely share the same
+    cache directory because SQLite locks the database during the writing operations.
+
+    Attributes
+    ----------
+    path : str
+        The path of the SQLite database.
+    max_size : float
+        Maximum size (in MB) of the stored data.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug.fitness import DockingCache
+        import tempfile
+        tmp_path = tempfile.TemporaryDirectory()
+        cache = DockingCache(tmp_path.name)
+        key = cache.key('CCO', exhaustiveness=8, boxcenter=[0, 0, 0], boxsize=[10, 10, 10])
+        print(cache.get(key))
+        cache.put(key, -3.5, 'MODEL 1\\nENDMDL\\n')
+        print(cache.get(key))
+    """
+    def __init__(self, cache_dir: str = '.moldrug_cache', max_size: float = 1024) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        cache_dir : str, optional
+            Directory where the database is stored, by default '.moldrug_cache'
+        max_size : float, optional
+            Maximum size (in MB) of the stored data, by default 1024
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(os.path.abspath(cache_dir), 'docking.sqlite')
+        self.max_size = max_size
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # Connections can not be shared between processes, therefore it is created on the first use
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=120)
+            # The rows replaced by INSERT OR REPLACE also fire the delete trigger
+            self._connection.execute("PRAGMA recursive_triggers = ON")
+            # The total size of the stored data is kept up to date by the triggers (also for the other
+            # processes that share the database), so it is not calculated on every put.
+            # Everything is created in one transaction, the rows of other processes are not missed
+            self._connection.executescript("""
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS docking
+                    (key TEXT PRIMARY KEY, smiles TEXT, score REAL, pdbqt BLOB, size INTEGER, last_access REAL);
+                CREATE INDEX IF NOT EXISTS docking_last_access ON docking (last_access);
+                CREATE TABLE IF NOT EXISTS docking_size (total INTEGER);
+                INSERT INTO docking_size SELECT TOTAL(size) FROM docking WHERE NOT EXISTS (SELECT 1 FROM docking_size);
+                CREATE TRIGGER IF NOT EXISTS docking_insert AFTER INSERT ON docking
+                    BEGIN UPDATE docking_size SET total = total + NEW.size; END;
+                CREATE TRIGGER IF NOT EXISTS docking_delete AFTER DELETE ON docking
+                    BEGIN UPDATE docking_size SET total = total - OLD.size; END;
+                COMMIT;
+            """)
+        return self._connection
+
+    @staticmethod
+    def key(smiles: str, **parameters) -> str:
+        """Build the key of an entry.
+
+        Parameters
+        ----------
+        smiles : str
+            The canonical SMILES of the molecule.
+        **parameters
+            Everything that could change the result of the docking (receptor hash, box, seed, etc.).
+            The values must be JSON serializable.
+
+        Returns
+        -------
+        str
+            A SHA-256 hex digest.
+        """
+        parameters['smiles'] = smiles
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> Union[None, tuple]:
+        """Retrieve an entry.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+
+        Returns
+        -------
+        Union[None, tuple]
+            None if the entry does not exist; otherwise (vina score, pdbqt string)
+        """
+        with self.connection as con:
+            row = con.execute("SELECT score, pdbqt FROM docking WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            con.execute("UPDATE docking SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0], zlib.decompress(row[1]).decode()
+
+    def put(self, key: str, score: float, pdbqt: str, smiles: str = None):
+        """Store an entry and remove the least recently used ones if max_size is exceeded.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+        score : float
+            The vina score.
+        pdbqt : str
+            The pdbqt string of the pose.
+        smiles : str, optional
+            The SMILES of the molecule. It is only stored as information, by default None
+        """
+        data = zlib.compress(pdbqt.encode())
+        with self.connection as con:
+            con.execute("INSERT OR REPLACE INTO docking VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, smiles, score, data, len(data), time.time()))
+            excess = con.execute("SELECT total FROM docking_size").fetchone()[0] - self.max_size * 1024**2
+            if excess > 0:
+                to_delete = []
+                for old_key, size in con.execute("SELECT key, size FROM docking ORDER BY last_access"):
+                    to_delete.append((old_key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                con.executemany("DELETE FROM docking WHERE key = ?", to_delete)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM docking").fetchone()[0]
+
+    def __getstate__(self):
+        # The connection is not picklable
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+
+# Caches, file hashes, Vina objects and staging directories already used by the process
+_docking_caches = dict()
+_file_hashes = dict()
+_vina_objects = dict()
+_memory_dirs = dict()
+_receptor_executors = dict()
+_prefilter_results = dict()
+
+
+def _memory_dir() -> str:
+    """Per-process (and per-thread) directory on a RAM-backed file system (/dev/shm if available,
+    otherwise the temporary directory of the system) used by io_mode = 'memory'.
+    It is removed when the process exits.
+    """
+    key = (os.getpid(), threading.get_ident())
+    if key not in _memory_dirs:
+        base_dir = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None
+        _memory_dirs[key] = tempfile.mkdtemp(prefix='moldrug_vina_', dir=base_dir)
+        # Finalize (instead of atexit) is also executed by the workers of multiprocessing
+        mp_util.Finalize(None, shutil.rmtree, args=(_memory_dirs[key],), kwargs={'ignore_errors': True}, exitpriority=0)
+    return _memory_dirs[key]
+
+
+def _remove_files(*paths):
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def _get_docking_cache(cache_dir: str, max_size: float) -> DockingCache:
+    # One instance (one connection) per process and thread, SQLite connections can not be shared
+    key = (os.getpid(), threading.get_ident(), os.path.abspath(cache_dir), max_size)
+    if key not in _docking_caches:
+        _docking_caches[key] = DockingCache(cache_dir, max_size=max_size)
+    return _docking_caches[key]
+
+
+def _file_hash(path: Union[None, str]) -> Union[None, str]:
+    """SHA-256 of the content of a file. If path is a prefix (e.g. the ad4 maps),
+    the hash of all the files that start with it is returned.
+    The results are reused while the files do not change.
+    """
+    if not path:
+        return None
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(glob.glob(f"{path}*"))
+    stamp = tuple((os.path.abspath(p), os.path.getmtime(p), os.path.getsize(p)) for p in paths)
+    if stamp not in _file_hashes:
+        sha = hashlib.sha256()
+        for p in paths:
+            with open(p, 'rb') as f:
+                sha.update(f.read())
+        _file_hashes[stamp] = sha.hexdigest()
+    return _file_hashes[stamp]
+
+
+def _get_vina(
+        receptor_pdbqt_path: str = None,
+        boxcenter: List[float] = None,
+        boxsize: List[float] = None,
+        ad4map: str = None,
+        ncores: int = 1,
+        vina_seed: Union[int, None] = None):
+    """Get a Vina object (Vina python bindings) with the receptor
+    and the affinity maps already loaded. The objects are kept by the process, therefore
+    the maps are computed only the first time that a docking setup is used.
+    """
+    key = (
+        os.getpid(),
+        _file_hash(receptor_pdbqt_path),
+        _file_hash(ad4map),
+        None if boxcenter is None else tuple(boxcenter),
+        None if boxsize is None else tuple(boxsize),
+        ncores,
+        vina_seed)
+    if key not in _vina_objects:
+        try:
+            from vina import Vina
+        except ImportError as e:
+            raise ImportError("backend = 'python' needs the Vina python bindings. "
+                              "Install them with: pip install vina") from e
+        # seed = 0 means random seed for Vina
+        if ad4map:
+            vina_object = Vina(sf_name='ad4', cpu=ncores, seed=vina_seed or 0, verbosity=0)
+            vina_object.load_maps(os.path.abspath(ad4map))
+        else:
+            vina_object = Vina(sf_name='vina', cpu=ncores, seed=vina_seed or 0, verbosity=0)
+            vina_object.set_receptor(os.path.abspath(receptor_pdbqt_path))
+            vina_object.compute_vina_maps(center=list(boxcenter), box_size=list(boxsize))
+        _vina_objects[key] = vina_object
+    return _vina_objects[key]
+
+
+def _prefilter(Individual: utils.Individual, gates: Dict) -> Union[None, str]:
+    # :meth:`moldrug.utils.prefilter` with the results kept by the process
+    key = (Individual.smiles, json.dumps(gates, sort_keys=True))
+    if key not in _prefilter_results:
+        if len(_prefilter_results) >= 100000:
+            _prefilter_results.clear()
+        _prefilter_results[key] = utils.prefilter(Individual.mol, gates)
+    return _prefilter_results[key]
+
+
+def _time_left(deadline: Union[float, None]) -> Union[float, None]:
+    """Seconds left before deadline (a :func:`time.monotonic` value).
+
+    Parameters
+    ----------
+    deadline : Union[float, None]
+        The deadline. None means that there is no limit.
+
+    Returns
+    -------
+    Union[float, None]
+        The remaining time or None if deadline is None.
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        If the deadline was already reached.
+    """
+    if deadline is None:
+        return None
+    time_left = deadline - time.monotonic()
+    if time_left <= 0:
+        raise subprocess.TimeoutExpired('_vinadock', 0)
+    return time_left
+
+
+def _docking_output(vina_score_pdbqt: tuple, keep_modes: bool, docking: utils.DockingResult = None) -> tuple:
+    # The output of _vinadock, with the DockingResult only if it was requested
+    if keep_modes:
+        return vina_score_pdbqt + (docking,)
+    return vina_score_pdbqt
+
+
 def _vinadock(
         Individual: utils.Individual,
         wd: str = '.vina_jobs',
@@ -242,7 +540,16 @@ def _vinadock(
         constraint_ref: Chem.rdchem.Mol = None,
         constraint_receptor_pdb_path: str = None,
         constraint_num_conf: int = 100,
-        constraint_minimum_conf_rms: int = 0.01):
+        constraint_minimum_conf_rms: int = 0.01,
+        cache_dir: Union[None, str] = None,
+        cache_max_size: float = 1024,
+        backend: str = 'executable',
+        io_mode: str = 'disk',
+        timeout: float = None,
+        num_conf: int = 1,
+        minimum_conf_rms: float = 0.5,
+        keep_modes: bool = False,
+        receptor_id: int = None):
     """
     This function is intend to be used to perform docking
     for all the cost functions implemented on :mod:`moldrug.fitness`
@@ -293,28 +600,129 @@ def _vinadock(
         Maximum number of conformer to be generated internally by moldrug , by default 100
     constraint_minimum_conf_rms : int, optional
         RMS to filter duplicate conformers, by default 0.01
+    cache_dir : Union[None, str], optional
+        Directory of a :meth:`moldrug.fitness.DockingCache`. If provided, the results are retrieved
+        from the cache if the same molecule was already docked with the same receptor and parameters
+        (also in previous runs); and the new results are stored, by default None (no cache)
+    cache_max_size : float, optional
+        Maximum size (in MB) of the cache, by default 1024
+    backend : str, optional
+        How Vina is invoked. Could be executable (a new vina_executable process is
+        launched for every docking) or python (the Vina python bindings are used
+        inside the current process; the receptor and affinity maps are loaded only once
+        per process and reused for all the ligands), by default 'executable'
+    io_mode : str, optional
+        Where the input and output files of Vina are kept. Could be disk (inside wd, they are kept
+        for inspection) or memory (a per-process directory on a RAM-backed file system, /dev/shm if available;
+        wd is not used, the outputs are parsed from memory and the files are removed immediately), by default 'disk'
+    timeout : float, optional
+        Maximum wall-clock time (in seconds) for the docking of the Individual, conformer generation
+        included for constraint docking. Runaway vina processes are killed and the Individual gets
+        (np.inf, 'VinaTimeout'). The python backend can not be interrupted inside a Vina call,
+        the limit is only checked between the conformers of a constraint docking. The limit is also soft
+        during the generation of the constrained conformers: it is checked between embeddings and a single
+        slow embedding can exceed it; if it is reached, no conformer is docked, by default None (no limit)
+    num_conf : int, optional
+        Number of starting conformers of the ligand (non constraint docking). If greater than 1,
+        up to num_conf diverse conformers are generated with :meth:`moldrug.utils.confgen_ensemble` (seeded with
+        vina_seed, Individual.pdbqt is not used), all of them are docked in one vina call (``--batch``, vina >= 1.2)
+        and the best pose is kept, by default 1 (Individual.pdbqt is docked)
+    minimum_conf_rms : float, optional
+        RMSD (angstrom) to discard similar starting conformers when num_conf > 1, by default 0.5
+    keep_modes : bool, optional
+        If True, a :meth:`moldrug.utils.DockingResult` with all the docked modes (of all the starting conformers)
+        is also returned. Constraint docking only keeps the best pose, by default False
+    receptor_id : int, optional
+        Index of the receptor when an Individual is docked against several receptors (see
+        :meth:`moldrug.fitness._dock_receptors`). It is added to the names of the error files, so the
+        receptors do not overwrite each other's reports, by default None
 
     Returns
     -------
     tuple
         A tuple with two elements:
         (vina score, pdbqt string)
+        or three if keep_modes is True:
+        (vina score, pdbqt string, DockingResult or None if the docking failed)
 
     Raises
     ------
     Exception
         Inappropriate constraint_type. must be local_only or score_only.
         Only will be checked if constraint is set to True.
+    Exception
+        Inappropriate backend. must be executable or python.
+    Exception
+        Inappropriate io_mode. must be disk or memory.
     """
 
     constraint_type = constraint_type.lower()
+    backend = backend.lower()
+    if backend not in ['executable', 'python']:
+        raise Exception("backend only admit two possible values: executable, python.")
+    io_mode = io_mode.lower()
+    if io_mode not in ['disk', 'memory']:
+        raise Exception("io_mode only admit two possible values: disk, memory.")
+
+    # Wall-clock deadline of the whole docking job
+    deadline = time.monotonic() + timeout if timeout else None
+    # All the modes (keep_modes)
+    docking = None
+
+    if cache_dir:
+        cache = _get_docking_cache(cache_dir, cache_max_size)
+        cache_key_parameters = {
+            'backend': backend,
+            'vina_executable': os.path.basename(vina_executable) if backend == 'executable' else None,
+            'vina_seed': vina_seed,
+            'receptor': _file_hash(receptor_pdbqt_path),
+            'boxcenter': boxcenter,
+            'boxsize': boxsize,
+            'exhaustiveness': exhaustiveness,
+            'ad4map': _file_hash(ad4map),
+            'num_modes': num_modes,
+        }
+        if num_conf > 1 and not constraint:
+            cache_key_parameters.update({
+                'num_conf': num_conf,
+                'minimum_conf_rms': minimum_conf_rms,
+            })
+        if keep_modes and not constraint:
+            # The whole vina output is stored instead of the best pose
+            cache_key_parameters['keep_modes'] = True
+        if constraint:
+            cache_key_parameters.update({
+                'constraint_type': constraint_type,
+                'constraint_ref': Chem.MolToMolBlock(constraint_ref),
+                'constraint_receptor': _file_hash(constraint_receptor_pdb_path),
+                'constraint_num_conf': constraint_num_conf,
+                'constraint_minimum_conf_rms': constraint_minimum_conf_rms,
+            })
+        cache_key = cache.key(Individual.smiles, **cache_key_parameters)
+        vina_score_pdbqt = cache.get(cache_key)
+        if vina_score_pdbqt:
+            if not keep_modes:
+                return vina_score_pdbqt
+            if constraint:
+                docking = utils.DockingResult.from_pose(vina_score_pdbqt[1], vina_score_pdbqt[0])
+            else:
+                docking = utils.DockingResult(vina_score_pdbqt[1])
+                vina_score_pdbqt = (vina_score_pdbqt[0], docking.model(docking.best()))
+            return _docking_output(vina_score_pdbqt, keep_modes, docking)
+
+    if backend == 'python':
+        # The receptor and the maps are only loaded the first time
+        vina_object = _get_vina(receptor_pdbqt_path, boxcenter, boxsize, ad4map, ncores, vina_seed)
 
     # Creating the error directory if needed
-    if not os.path.isdir('error'):
-        os.makedirs('error')
+    os.makedirs('error', exist_ok=True)
+    error_tag = '' if receptor_id is None else f'_receptor_{receptor_id}'
     # Creating the working directory if needed
-    if not os.path.exists(wd):
-        os.makedirs(wd)
+    if io_mode == 'memory':
+        # Files are staged on a RAM-backed directory and removed as soon as they are read
+        wd = _memory_dir()
+    else:
+        os.makedirs(wd, exist_ok=True)
 
     # Converting to absolute path in case that vina_executable points to a file
     if os.path.isfile(vina_executable):
@@ -349,12 +757,17 @@ def _vinadock(
                 num_conf=constraint_num_conf,
                 # ref_smi=Chem.MolToSmiles(constraint_ref),
                 minimum_conf_rms=constraint_minimum_conf_rms,
-                randomseed=vina_seed)
+                randomseed=vina_seed,
+                timeout=_time_left(deadline))
         except Exception as e:
             if verbose:
                 print(f"constraintconf.generate_conformers fails inside moldrug.fitness._vinadock with {e}")
             vina_score_pdbqt = (np.inf, "NonValidConformer")
-            return vina_score_pdbqt
+            return _docking_output(vina_score_pdbqt, keep_modes)
+        # An embedding can not be interrupted, the deadline could be already reached
+        if deadline is not None and time.monotonic() >= deadline:
+            vina_score_pdbqt = (np.inf, "VinaTimeout")
+            return _docking_output(vina_score_pdbqt, keep_modes)
         # Remove conformers that clash with the protein in case of score_only,
         # for local_only vina will handle the clash.
         if constraint_type == 'score_only':
@@ -366,74 +779,139 @@ def _vinadock(
         # Check first if some valid conformer exist
         if len(out_mol.GetConformers()):
             vina_score_pdbqt = (np.inf, None)
-            for conf in out_mol.GetConformers():
-                temp_mol = deepcopy(out_mol)
-                temp_mol.RemoveAllConformers()
-                temp_mol.AddConformer(out_mol.GetConformer(conf.GetId()), assignId=True)
-
-                preparator = MoleculePreparation()
-                mol_setups = preparator.prepare(Chem.AddHs(temp_mol, addCoords=True))
-                with open(os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}.pdbqt'), 'w') as f:
-                    f.write(PDBQTWriterLegacy.write_string(mol_setups[0])[0])
+            # All the conformers are prepared with only one meeko setup
+            conf_pdbqts = utils.conformers_to_pdbqt(Chem.AddHs(out_mol, addCoords=True))
+            for conf, conf_pdbqt in zip(out_mol.GetConformers(), conf_pdbqts):
+                ligand_path = os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}.pdbqt')
+                out_path = os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}_out.pdbqt')
 
                 # Make a copy to the vina command string and add the out (is needed) and ligand options
                 cmd_vina_str_tmp = cmd_vina_str[:]
-                cmd_vina_str_tmp += f" --ligand {os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}.pdbqt')}"
+                cmd_vina_str_tmp += f" --ligand {ligand_path}"
 
                 if constraint_type == 'local_only':
-                    cmd_vina_str_tmp += f" --out {os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}_out.pdbqt')}"
+                    cmd_vina_str_tmp += f" --out {out_path}"
+                # The optimized pose of the python backend, already read
+                conf_out_pdbqt = None
                 try:
-                    cmd_vina_result = utils.run(cmd_vina_str_tmp)
+                    conf_timeout = _time_left(deadline)
+                    if backend == 'python':
+                        vina_object.set_ligand_from_string(conf_pdbqt)
+                        if constraint_type == 'local_only':
+                            vina_score = float(vina_object.optimize()[0])
+                            # Vina.poses only returns the poses of Vina.dock, the optimized pose can only be written
+                            vina_object.write_pose(out_path, overwrite=True)
+                            if io_mode == 'memory':
+                                with open(out_path, 'r') as f:
+                                    conf_out_pdbqt = f.read()
+                                _remove_files(out_path)
+                        else:
+                            vina_score = float(vina_object.score()[0])
+                    else:
+                        with open(ligand_path, 'w') as f:
+                            f.write(conf_pdbqt)
+                        cmd_vina_result = utils.run(cmd_vina_str_tmp, timeout=conf_timeout)
                 except Exception as e:
+                    if io_mode == 'memory':
+                        _remove_files(ligand_path, out_path)
                     if os.path.isfile(receptor_pdbqt_path):
                         with open(receptor_pdbqt_path, 'r') as f:
                             receptor_str = f.read()
                     else:
                         receptor_str = None
 
+                    temp_mol = deepcopy(out_mol)
+                    temp_mol.RemoveAllConformers()
+                    temp_mol.AddConformer(out_mol.GetConformer(conf.GetId()), assignId=True)
                     error = {
                         'Exception': e,
                         'Individual': Individual,
                         f'used_mol_conf_{conf.GetId()}': temp_mol,
-                        f'used_ligand_pdbqt_conf_{conf.GetId()}': PDBQTWriterLegacy.write_string(mol_setups[0])[0],
+                        f'used_ligand_pdbqt_conf_{conf.GetId()}': conf_pdbqt,
                         'receptor_str': receptor_str,
                         'boxcenter': boxcenter,
                         'boxsize': boxsize,
                     }
-                    utils.compressed_pickle(f'error/idx_{Individual.idx}_conf_{conf.GetId()}_error', error)
-                    vina_score_pdbqt = (np.inf, PDBQTWriterLegacy.write_string(mol_setups[0])[0])
-                    return vina_score_pdbqt
-
-                vina_score = np.inf
-                for line in cmd_vina_result.stdout.split('\n'):
-                    # Check over different vina versions
-                    if line.startswith('Affinity'):
-                        vina_score = float(line.split()[1])
-                        break
-                    elif 'Estimated Free Energy of Binding' in line:
-                        vina_score = float(line.split(':')[1].split()[0])
-                        break
+                    utils.compressed_pickle(f'error/idx_{Individual.idx}{error_tag}_conf_{conf.GetId()}_error', error)
+                    if isinstance(e, subprocess.TimeoutExpired):
+                        vina_score_pdbqt = (np.inf, 'VinaTimeout')
+                    else:
+                        vina_score_pdbqt = (np.inf, conf_pdbqt)
+                    return _docking_output(vina_score_pdbqt, keep_modes)
+
+                if backend == 'executable':
+                    vina_score = np.inf
+                    for line in cmd_vina_result.stdout.split('\n'):
+                        # Check over different vina versions
+                        if line.startswith('Affinity'):
+                            vina_score = float(line.split()[1])
+                            break
+                        elif 'Estimated Free Energy of Binding' in line:
+                            vina_score = float(line.split(':')[1].split()[0])
+                            break
                 if vina_score < vina_score_pdbqt[0]:
                     if constraint_type == 'local_only':
-                        if os.path.isfile(os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}_out.pdbqt')):
-                            with open(os.path.join(wd, f'{Individual.idx}_conf_{conf.GetId()}_out.pdbqt'), 'r') as f:
+                        if conf_out_pdbqt is not None:
+                            pdbqt = conf_out_pdbqt
+                        elif os.path.isfile(out_path):
+                            with open(out_path, 'r') as f:
                                 pdbqt = f.read()
                         else:
                             pdbqt = "NonExistedFileToRead"
                         vina_score_pdbqt = (vina_score, pdbqt)
                     else:
-                        vina_score_pdbqt = (vina_score, PDBQTWriterLegacy.write_string(mol_setups[0])[0])
+                        vina_score_pdbqt = (vina_score, conf_pdbqt)
+                if io_mode == 'memory':
+                    _remove_files(ligand_path, out_path)
+        elif deadline is not None and time.monotonic() >= deadline:
+            vina_score_pdbqt = (np.inf, "VinaTimeout")
         else:
             vina_score_pdbqt = (np.inf, "NonGenConformer")
     # "Normal" docking
     else:
-        cmd_vina_str += f" --ligand {os.path.join(wd, f'{Individual.idx}.pdbqt')} "\
-            f"--out {os.path.join(wd, f'{Individual.idx}_out.pdbqt')}"
-        with open(os.path.join(wd, f'{Individual.idx}.pdbqt'), 'w') as lig_pdbqt:
-            lig_pdbqt.write(Individual.pdbqt)
+        if num_conf > 1:
+            # Several starting conformers, the best pose of all of them is kept
+            try:
+                ligand_pdbqts = utils.confgen_ensemble(Individual.mol, num_conf=num_conf, randomseed=vina_seed,
+                                                       minimum_conf_rms=minimum_conf_rms)
+            except Exception as e:
+                if verbose:
+                    print(f"utils.confgen_ensemble fails inside moldrug.fitness._vinadock with {e}")
+                vina_score_pdbqt = (np.inf, "NonValidConformer")
+                return _docking_output(vina_score_pdbqt, keep_modes)
+            names = [f'{Individual.idx}_conf_{i}' for i in range(len(ligand_pdbqts))]
+        else:
+            ligand_pdbqts = [Individual.pdbqt]
+            names = [f'{Individual.idx}']
+        ligand_paths = [os.path.join(wd, f'{name}.pdbqt') for name in names]
+        out_paths = [os.path.join(wd, f'{name}_out.pdbqt') for name in names]
+        if len(names) == 1:
+            cmd_vina_str += f" --ligand {ligand_paths[0]} --out {out_paths[0]}"
+        else:
+            # vina writes <ligand name>_out.pdbqt for every ligand of the batch in --dir
+            cmd_vina_str += f" --batch {' '.join(ligand_paths)} --dir {wd}"
+        vina_outs = []
         try:
-            utils.run(cmd_vina_str)
+            if backend == 'python':
+                for ligand_pdbqt, out_path in zip(ligand_pdbqts, out_paths):
+                    vina_object.set_ligand_from_string(ligand_pdbqt)
+                    vina_object.dock(exhaustiveness=exhaustiveness, n_poses=num_modes)
+                    if io_mode == 'memory':
+                        vina_outs.append(vina_object.poses(n_poses=num_modes))
+                    else:
+                        vina_object.write_poses(out_path, n_poses=num_modes, overwrite=True)
+            else:
+                for ligand_pdbqt, ligand_path in zip(ligand_pdbqts, ligand_paths):
+                    with open(ligand_path, 'w') as lig_pdbqt:
+                        lig_pdbqt.write(ligand_pdbqt)
+                utils.run(cmd_vina_str, timeout=_time_left(deadline))
+                if io_mode == 'memory':
+                    for out_path in out_paths:
+                        with open(out_path, 'r') as f:
+                            vina_outs.append(f.read())
         except Exception as e:
+            if io_mode == 'memory':
+                _remove_files(*ligand_paths, *out_paths)
             receptor_str = None
             if receptor_pdbqt_path:
                 if os.path.isfile(receptor_pdbqt_path):
@@ -447,19 +925,39 @@ def _vinadock(
                 'boxcenter': boxcenter,
                 'boxsize': boxsize,
             }
-            utils.compressed_pickle(f'error/{Individual.idx}_error', error)
+            utils.compressed_pickle(f'error/{Individual.idx}{error_tag}_error', error)
             # warn(f"\nVina failed! Check: {Individual.idx}_error.pbz2 file in error.\n")
             if verbose:
                 for key in error:
                     print(f"{key}: {error[key]}")
-            vina_score_pdbqt = (np.inf, 'VinaFailed')
-            return vina_score_pdbqt
+            if isinstance(e, subprocess.TimeoutExpired):
+                vina_score_pdbqt = (np.inf, 'VinaTimeout')
+            else:
+                vina_score_pdbqt = (np.inf, 'VinaFailed')
+            return _docking_output(vina_score_pdbqt, keep_modes)
 
         # Getting the information
-        best_energy = utils.VINA_OUT(os.path.join(wd, f'{Individual.idx}_out.pdbqt')).BestEnergy()
-        vina_score_pdbqt = (best_energy.freeEnergy, ''.join(best_energy.chunk))
+        if io_mode == 'memory':
+            _remove_files(*ligand_paths, *out_paths)
+            vina_outputs = [utils.VinaOutput(vina_out) for vina_out in vina_outs]
+        else:
+            vina_outputs = [utils.VinaOutput.from_file(out_path) for out_path in out_paths]
+        # Only the text of the best model is extracted
+        best_output = min(vina_outputs, key=lambda x: x.energies[x.best()])
+        best = best_output.best()
+        vina_score_pdbqt = (float(best_output.energies[best]), best_output.model(best))
+        if keep_modes:
+            docking = utils.DockingResult(b''.join(vina_output.buffer for vina_output in vina_outputs))
 
-    return vina_score_pdbqt
+    if keep_modes and constraint and np.isfinite(vina_score_pdbqt[0]):
+        # Only the best pose of the constraint docking is kept
+        docking = utils.DockingResult.from_pose(vina_score_pdbqt[1], vina_score_pdbqt[0])
+
+    # Only the successful dockings are stored
+    if cache_dir and np.isfinite(vina_score_pdbqt[0]):
+        cache.put(cache_key, vina_score_pdbqt[0], docking.pdbqt if keep_modes and not constraint else vina_score_pdbqt[1],
+                  smiles=Individual.smiles)
+    return _docking_output(vina_score_pdbqt, keep_modes, docking)
 
 
 def Cost(
@@ -480,7 +978,16 @@ def Cost(
         constraint_receptor_pdb_path: str = None,
         constraint_num_conf: int = 100,
         constraint_minimum_conf_rms: int = 0.01,
-        desirability: Dict = None):
+        desirability: Dict = None,
+        cache_dir: Union[None, str] = None,
+        cache_max_size: float = 1024,
+        backend: str = 'executable',
+        io_mode: str = 'disk',
+        timeout: float = None,
+        prefilter: Dict = None,
+        num_conf: int = 1,
+        minimum_conf_rms: float = 0.5,
+        keep_modes: bool = False):
     """
     This is the main Cost function of the module. It use the concept of desirability functions.
     The response variables are:
@@ -546,6 +1053,39 @@ def Cost(
             from moldrug.fitness import __get_default_desirability
             import json
             print(json.dumps(__get_default_desirability(multireceptor=False), indent = 4))
+
+    cache_dir : Union[None, str], optional
+        Directory of a :meth:`moldrug.fitness.DockingCache` to reuse the docking results
+        of molecules already docked with the same receptor and parameters, by default None (no cache)
+    cache_max_size : float, optional
+        Maximum size (in MB) of the docking cache, by default 1024
+    backend : str, optional
+        How Vina is invoked: executable (vina_executable) or python (Vina python bindings,
+        the receptor and affinity maps are computed once per process and reused), by default 'executable'
+    io_mode : str, optional
+        disk (the Vina files are kept in wd) or memory (the files are staged on a RAM-backed
+        directory, parsed from memory and removed immediately), by default 'disk'
+    timeout : float, optional
+        Maximum wall-clock time (in seconds) for each docking job. Runaway vina processes are killed and the
+        Individual is considered as a failed docking (pdbqt = 'VinaTimeout'). Check :meth:`moldrug.fitness._vinadock`,
+        by default None (no limit)
+    prefilter : Dict, optional
+        Gates of :meth:`moldrug.utils.prefilter` checked before anything else, e.g.
+        {'MolWt': [None, 500], 'NumRotatableBonds': [None, 10], 'lipinski': 2, 'pains': True}.
+        The rejected molecules are not docked and get cost = np.inf, vina_score = np.inf, pdbqt = 'Prefiltered'
+        and the attribute prefiltered with the name of the failed gate. The results are kept by the process,
+        by default None (no filter)
+    num_conf : int, optional
+        Number of diverse starting conformers of the ligand for non constraint docking. If greater than 1,
+        they are generated from Individual.mol, docked in one vina call and the best pose is kept.
+        Check :meth:`moldrug.fitness._vinadock`, by default 1 (Individual.pdbqt is docked)
+    minimum_conf_rms : float, optional
+        RMSD (angstrom) to discard similar starting conformers when num_conf > 1, by default 0.5
+    keep_modes : bool, optional
+        If True, all the docked modes (energies, RMSD bounds, coordinates and the raw pdbqt output) are kept
+        on the attribute docking of the Individual as a :meth:`moldrug.utils.DockingResult`. It is not set
+        for the molecules that are not docked (e.g. prefilter), by default False
+
     Returns
     -------
     utils.Individual
@@ -570,6 +1110,16 @@ def Cost(
             boxcenter=box['boxcenter'], boxsize=box['boxsize'], exhaustiveness=4, ncores=4)
         print(NewI.cost, NewI.vina_score, NewI.qed, NewI.sa_score)
     """
+    # Cheap filter, the rejected molecules are not docked
+    if prefilter:
+        reason = _prefilter(Individual, prefilter)
+        if reason:
+            Individual.vina_score = np.inf
+            Individual.cost = np.inf
+            Individual.pdbqt = 'Prefiltered'
+            Individual.prefiltered = reason
+            return Individual
+
     if desirability is None:
         desirability = __get_default_desirability(multireceptor=False)
     else:
@@ -587,7 +1137,7 @@ def Cost(
     Individual.sa_score = sascorer.calculateScore(Chem.RemoveHs(Individual.mol))
 
     # Getting vina_score and update pdbqt
-    Individual.vina_score, Individual.pdbqt = _vinadock(
+    result = _vinadock(
         Individual=Individual,
         wd=wd,
         vina_executable=vina_executable,
@@ -604,7 +1154,18 @@ def Cost(
         constraint_ref=constraint_ref,
         constraint_receptor_pdb_path=constraint_receptor_pdb_path,
         constraint_num_conf=constraint_num_conf,
-        constraint_minimum_conf_rms=constraint_minimum_conf_rms)
+        constraint_minimum_conf_rms=constraint_minimum_conf_rms,
+        cache_dir=cache_dir,
+        cache_max_size=cache_max_size,
+        backend=backend,
+        io_mode=io_mode,
+        timeout=timeout,
+        num_conf=num_conf,
+        minimum_conf_rms=minimum_conf_rms,
+        keep_modes=keep_modes)
+    Individual.vina_score, Individual.pdbqt = result[:2]
+    if keep_modes:
+        Individual.docking = result[2]
     # Adding the cost using all the information of qed, sas and vina_cost
     # Construct the desirability
     # Quantitative estimation of drug-likeness (ranges from 0 to 1). We could use just the value perse,
@@ -651,7 +1212,16 @@ def CostOnlyVina(
         constraint_receptor_pdb_path: str = None,
         constraint_num_conf: int = 100,
         constraint_minimum_conf_rms: int = 0.01,
-        wt_cutoff: Union[None, float] = None):
+        wt_cutoff: Union[None, float] = None,
+        cache_dir: Union[None, str] = None,
+        cache_max_size: float = 1024,
+        backend: str = 'executable',
+        io_mode: str = 'disk',
+        timeout: float = None,
+        prefilter: Dict = None,
+        num_conf: int = 1,
+        minimum_conf_rms: float = 0.5,
+        keep_modes: bool = False):
     """
     This Cost function performs Docking and return the vina_score as Cost.
 
@@ -700,6 +1270,38 @@ def CostOnlyVina(
     wt_cutoff : Union[None, float], optional
         If some number is provided the molecules with a molecular weight higher
         than wt_cutoff will get as vina_score = cost = np.inf. Vina will not be invoked, by default None
+    cache_dir : Union[None, str], optional
+        Directory of a :meth:`moldrug.fitness.DockingCache` to reuse the docking results
+        of molecules already docked with the same receptor and parameters, by default None (no cache)
+    cache_max_size : float, optional
+        Maximum size (in MB) of the docking cache, by default 1024
+    backend : str, optional
+        How Vina is invoked: executable (vina_executable) or python (Vina python bindings,
+        the receptor and affinity maps are computed once per process and reused), by default 'executable'
+    io_mode : str, optional
+        disk (the Vina files are kept in wd) or memory (the files are staged on a RAM-backed
+        directory, parsed from memory and removed immediately), by default 'disk'
+    timeout : float, optional
+        Maximum wall-clock time (in seconds) for each docking job. Runaway vina processes are killed and the
+        Individual is considered as a failed docking (pdbqt = 'VinaTimeout'). Check :meth:`moldrug.fitness._vinadock`,
+        by default None (no limit)
+    prefilter : Dict, optional
+        Gates of :meth:`moldrug.utils.prefilter` checked before anything else, e.g.
+        {'MolWt': [None, 500], 'NumRotatableBonds': [None, 10], 'lipinski': 2, 'pains': True}.
+        The rejected molecules are not docked and get cost = np.inf, vina_score = np.inf, pdbqt = 'Prefiltered'
+        and the attribute prefiltered with the name of the failed gate. The results are kept by the process,
+        by default None (no filter)
+    num_conf : int, optional
+        Number of diverse starting conformers of the ligand for non constraint docking. If greater than 1,
+        they are generated from Individual.mol, docked in one vina call and the best pose is kept.
+        Check :meth:`moldrug.fitness._vinadock`, by default 1 (Individual.pdbqt is docked)
+    minimum_conf_rms : float, optional
+        RMSD (angstrom) to discard similar starting conformers when num_conf > 1, by default 0.5
+    keep_modes : bool, optional
+        If True, all the docked modes (energies, RMSD bounds, coordinates and the raw pdbqt output) are kept
+        on the attribute docking of the Individual as a :meth:`moldrug.utils.DockingResult`. It is not set
+        for the molecules that are not docked (e.g. prefilter), by default False
+
     Returns
     -------
     utils.Individual
@@ -723,6 +1325,16 @@ def CostOnlyVina(
             boxcenter=box['boxcenter'], boxsize=box['boxsize'], exhaustiveness=4,ncores=4)
         print(NewI.cost, NewI.vina_score)
     """
+    # Cheap filter, the rejected molecules are not docked
+    if prefilter:
+        reason = _prefilter(Individual, prefilter)
+        if reason:
+            Individual.vina_score = np.inf
+            Individual.cost = np.inf
+            Individual.pdbqt = 'Prefiltered'
+            Individual.prefiltered = reason
+            return Individual
+
     # If the molecule is heavy, don't perform docking and assign infinite to the cost attribute.
     # Add the pdbqt to pdbqts and np.inf to vina_scores
     if wt_cutoff:
@@ -733,7 +1345,7 @@ def CostOnlyVina(
             return Individual
 
     # Getting vina_score and update pdbqt
-    Individual.vina_score, Individual.pdbqt = _vinadock(
+    result = _vinadock(
         Individual=Individual,
         wd=wd,
         vina_executable=vina_executable,
@@ -750,11 +1362,92 @@ def CostOnlyVina(
         constraint_ref=constraint_ref,
         constraint_receptor_pdb_path=constraint_receptor_pdb_path,
         constraint_num_conf=constraint_num_conf,
-        constraint_minimum_conf_rms=constraint_minimum_conf_rms)
+        constraint_minimum_conf_rms=constraint_minimum_conf_rms,
+        cache_dir=cache_dir,
+        cache_max_size=cache_max_size,
+        backend=backend,
+        io_mode=io_mode,
+        timeout=timeout,
+        num_conf=num_conf,
+        minimum_conf_rms=minimum_conf_rms,
+        keep_modes=keep_modes)
+    Individual.vina_score, Individual.pdbqt = result[:2]
+    if keep_modes:
+        Individual.docking = result[2]
     Individual.cost = Individual.vina_score
     return Individual
 
 
+def _vina_desirability(vina_score: float, vina_score_type: str, desirability: Dict) -> tuple:
+    """Desirability of the vina score of one receptor for the multi receptor cost functions.
+
+    Parameters
+    ----------
+    vina_score : float
+        The vina score.
+    vina_score_type : str
+        min or max (only used for the error message).
+    desirability : Dict
+        The desirability definition of vina_score_type, e.g. {'w': 1, 'SmallerTheBest': {...}}
+
+    Returns
+    -------
+    tuple
+        (desirability, weight)
+
+    Raises
+    ------
+    RuntimeError
+        In case of a non implemented key in desirability.
+    """
+    for key in desirability:
+        if key == 'w':
+            w = desirability[key]
+        elif key in utils.DerringerSuichDesirability():
+            d = utils.DerringerSuichDesirability()[key](vina_score, **desirability[key])
+        else:
+            raise RuntimeError("Inside the desirability dictionary "
+                               f"you provided for the variable = vina_scores[{vina_score_type}] "
+                               f"a non implemented key = {key}. Only are possible: 'w' (standing for weight) and "
+                               "any possible Derringer-Suich "
+                               f"desirability function: {utils.DerringerSuichDesirability().keys()}.")
+    return d, w
+
+
+def _dock_receptors(dockings: List[partial], receptor_jobs: int = 1) -> List[tuple]:
+    """Run the docking jobs (:meth:`moldrug.fitness._vinadock` with all the keywords already set)
+    of an Individual against several receptors.
+
+    Parameters
+    ----------
+    dockings : List[partial]
+        One job for every receptor.
+    receptor_jobs : int, optional
+        How many receptors are docked at the same time (in threads of the current process, each one
+        waiting for its own vina process). Every job gets its own working directory
+        (wd/receptor_<receptor_id>, or wd/receptor_<i> without receptor_id).
+        The python backend always works one receptor after the other, by default 1
+
+    Returns
+    -------
+    List[tuple]
+        The (vina score, pdbqt string) of every job in the same order of dockings.
+    """
+    if receptor_jobs <= 1 or len(dockings) <= 1 or dockings[0].keywords.get('backend', 'executable') == 'python':
+        return [docking() for docking in dockings]
+    # The threads are kept by the process
+    key = (os.getpid(), receptor_jobs)
+    if key not in _receptor_executors:
+        _receptor_executors[key] = ThreadPoolExecutor(max_workers=receptor_jobs, thread_name_prefix='moldrug_receptor')
+        # The same as _memory_dir, also executed by the workers of multiprocessing
+        mp_util.Finalize(None, _receptor_executors[key].shutdown, exitpriority=0)
+    dockings = [
+        partial(docking, wd=os.path.join(docking.keywords.get('wd', '.vina_jobs'),
+                                         f"receptor_{docking.keywords.get('receptor_id', i)}"))
+        for i, docking in enumerate(dockings)]
+    return list(_receptor_executors[key].map(lambda docking: docking(), dockings))
+
+
 def CostMultiReceptors(
         Individual: utils.Individual,
         wd: str = '.vina_jobs',
@@ -774,7 +1467,18 @@ def CostMultiReceptors(
         constraint_receptor_pdb_path: List[str] = None,
         constraint_num_conf: int = 100,
         constraint_minimum_conf_rms: int = 0.01,
-        desirability: Dict = None):
+        desirability: Dict = None,
+        cache_dir: Union[None, str] = None,
+        cache_max_size: float = 1024,
+        backend: str = 'executable',
+        io_mode: str = 'disk',
+        timeout: float = None,
+        receptor_jobs: int = 1,
+        cost_threshold: float = None,
+        prefilter: Dict = None,
+        num_conf: int = 1,
+        minimum_conf_rms: float = 0.5,
+        keep_modes: bool = False):
     """
     This function is similar to :meth:`moldrug.fitness.Cost` but it will add the possibility
     to work with more than one receptor. It also use the concept of desirability and the response variables are:
@@ -855,6 +1559,50 @@ def CostMultiReceptors(
             import json
             print(json.dumps(__get_default_desirability(multireceptor=True), indent = 4))
 
+    cache_dir : Union[None, str], optional
+        Directory of a :meth:`moldrug.fitness.DockingCache` to reuse the docking results
+        of molecules already docked with the same receptor and parameters, by default None (no cache)
+    cache_max_size : float, optional
+        Maximum size (in MB) of the docking cache, by default 1024
+    backend : str, optional
+        How Vina is invoked: executable (vina_executable) or python (Vina python bindings,
+        the receptor and affinity maps are computed once per process and reused), by default 'executable'
+    io_mode : str, optional
+        disk (the Vina files are kept in wd) or memory (the files are staged on a RAM-backed
+        directory, parsed from memory and removed immediately), by default 'disk'
+    timeout : float, optional
+        Maximum wall-clock time (in seconds) for each docking job. Runaway vina processes are killed and the
+        Individual is considered as a failed docking (pdbqt = 'VinaTimeout'). Check :meth:`moldrug.fitness._vinadock`,
+        by default None (no limit)
+    receptor_jobs : int, optional
+        How many receptors are docked at the same time for the Individual (threads, each one running its own vina
+        process in wd/receptor_<i>). The results keep the order of receptor_pdbqt_path. Every vina process uses ncores,
+        so each worker of the GA can use up to receptor_jobs * ncores cpus. It has no effect with backend = 'python',
+        by default 1 (one receptor after the other)
+    cost_threshold : float, optional
+        Early exit. Before docking each receptor (or batch of receptor_jobs receptors) the lowest cost that the
+        Individual could still get is calculated (the remaining desirabilities equal to 1). If it is not lower than
+        cost_threshold, the rest of the receptors are not docked (vina_score = np.inf, pdbqt = 'EarlyExit') and this
+        lower bound is used as cost. :meth:`moldrug.utils.GA` with ``early_exit = True`` sets it to the cost of the
+        worst member of the population, by default None (all the receptors are docked)
+    prefilter : Dict, optional
+        Gates of :meth:`moldrug.utils.prefilter` checked before anything else, e.g.
+        {'MolWt': [None, 500], 'NumRotatableBonds': [None, 10], 'lipinski': 2, 'pains': True}.
+        The rejected molecules are not docked and get cost = np.inf, vina_score = np.inf, pdbqt = 'Prefiltered'
+        and the attribute prefiltered with the name of the failed gate. The results are kept by the process,
+        by default None (no filter)
+    num_conf : int, optional
+        Number of diverse starting conformers of the ligand for non constraint docking. If greater than 1,
+        they are generated from Individual.mol, docked in one vina call and the best pose is kept.
+        Check :meth:`moldrug.fitness._vinadock`, by default 1 (Individual.pdbqt is docked)
+    minimum_conf_rms : float, optional
+        RMSD (angstrom) to discard similar starting conformers when num_conf > 1, by default 0.5
+    keep_modes : bool, optional
+        If True, all the docked modes (energies, RMSD bounds, coordinates and the raw pdbqt output) are kept
+        on the attribute docking of the Individual as a list with one :meth:`moldrug.utils.DockingResult`
+        per receptor (None for the receptors that were not docked). It is not set for the molecules
+        that are not docked at all (e.g. prefilter), by default False
+
     Returns
     -------
     utils.Individual
@@ -886,6 +1634,16 @@ def CostMultiReceptors(
             vina_score_type = vina_score_type, boxcenter = boxcenter,boxsize = boxsize,exhaustiveness = 4,ncores = 4)
         print(NewI.cost, NewI.vina_score, NewI.qed, NewI.sa_score)
     """
+    # Cheap filter, the rejected molecules are not docked
+    if prefilter:
+        reason = _prefilter(Individual, prefilter)
+        if reason:
+            Individual.vina_score = [np.inf] * len(receptor_pdbqt_path)
+            Individual.cost = np.inf
+            Individual.pdbqt = ['Prefiltered'] * len(receptor_pdbqt_path)
+            Individual.prefiltered = reason
+            return Individual
+
     if desirability is None:
         desirability = __get_default_desirability(multireceptor=True)
     else:
@@ -903,13 +1661,40 @@ def CostMultiReceptors(
     # Getting synthetic accessibility score
     Individual.sa_score = sascorer.calculateScore(Chem.RemoveHs(Individual.mol))
 
+    # make a copy of the default values of desirability
+    # pops the region of vina_scores
+    desirability_to_work_with = desirability.copy()
+    vina_desirability_section = desirability_to_work_with.pop('vina_scores')
+    # Initialize base and exponent
+    base = 1
+    exponent = 0
+    # Runs for all properties different to vina_scores
+    for variable in desirability_to_work_with:
+        for key in desirability_to_work_with[variable]:
+            if key == 'w':
+                w = desirability_to_work_with[variable][key]
+            elif key in utils.DerringerSuichDesirability():
+                d = utils.DerringerSuichDesirability()[key](
+                    getattr(Individual, variable), **desirability_to_work_with[variable][key])
+            else:
+                raise RuntimeError(f"Inside the desirability dictionary you provided for the variable = {variable} "
+                                   f"a non implemented key = {key}. Only are possible: 'w' (standing for weight) and "
+                                   "any possible Derringer-Suich "
+                                   f"desirability function: {utils.DerringerSuichDesirability().keys()}. "
+                                   "Only in the case of vina_scores [min and max] keys")
+        base *= d**w
+        exponent += w
+
     # Getting Vina score
     pdbqt_list = []
+    docking_list = []
     Individual.vina_score = []
+    dockings = []
     for (i, _) in enumerate(receptor_pdbqt_path):
         # Getting vina_score and update pdbqt
         if constraint:
-            vina_score, pdbqt = _vinadock(
+            dockings.append(partial(
+                _vinadock,
                 Individual=Individual,
                 wd=wd,
                 vina_executable=vina_executable,
@@ -926,9 +1711,19 @@ def CostMultiReceptors(
                 constraint_ref=constraint_ref,
                 constraint_receptor_pdb_path=constraint_receptor_pdb_path[i],
                 constraint_num_conf=constraint_num_conf,
-                constraint_minimum_conf_rms=constraint_minimum_conf_rms)
+                constraint_minimum_conf_rms=constraint_minimum_conf_rms,
+                cache_dir=cache_dir,
+                cache_max_size=cache_max_size,
+                backend=backend,
+                io_mode=io_mode,
+                timeout=timeout,
+                num_conf=num_conf,
+                minimum_conf_rms=minimum_conf_rms,
+                keep_modes=keep_modes,
+                receptor_id=i))
         else:
-            vina_score, pdbqt = _vinadock(
+            dockings.append(partial(
+                _vinadock,
                 Individual=Individual,
                 wd=wd,
                 vina_executable=vina_executable,
@@ -939,35 +1734,50 @@ def CostMultiReceptors(
                 exhaustiveness=exhaustiveness,
                 ad4map=ad4map[i],
                 ncores=ncores,
-                num_modes=num_modes)
-        Individual.vina_score.append(vina_score)
-        pdbqt_list.append(pdbqt)
+                num_modes=num_modes,
+                cache_dir=cache_dir,
+                cache_max_size=cache_max_size,
+                backend=backend,
+                io_mode=io_mode,
+                timeout=timeout,
+                num_conf=num_conf,
+                minimum_conf_rms=minimum_conf_rms,
+                keep_modes=keep_modes,
+                receptor_id=i))
+    # Weight of the vina scores on the geometric mean
+    if vina_score_type == 'ensemble':
+        vina_exponent = vina_desirability_section['ensemble']['w']
+    else:
+        vina_exponent = sum(vina_desirability_section[vst]['w'] for vst in vina_score_type)
+    # With cost_threshold the receptors are docked in batches (of receptor_jobs)
+    batch = max(1, len(dockings) if cost_threshold is None else receptor_jobs)
+    for start in range(0, len(dockings), batch):
+        if cost_threshold is not None:
+            # The lowest cost that the Individual can still get (all the remaining desirabilities equal to 1)
+            best_cost = 1 - base**(1 / (exponent + vina_exponent))
+            if best_cost >= cost_threshold:
+                Individual.vina_score += [np.inf] * (len(dockings) - start)
+                Individual.pdbqt = pdbqt_list + ['EarlyExit'] * (len(dockings) - start)
+                if keep_modes:
+                    Individual.docking = docking_list + [None] * (len(dockings) - start)
+                Individual.cost = best_cost
+                return Individual
+        for result in _dock_receptors(dockings[start:start + batch], receptor_jobs):
+            vina_score, pdbqt = result[:2]
+            Individual.vina_score.append(vina_score)
+            pdbqt_list.append(pdbqt)
+            if keep_modes:
+                docking_list.append(result[2])
+            if vina_score_type != 'ensemble':
+                vst = vina_score_type[len(Individual.vina_score) - 1]
+                d, w = _vina_desirability(vina_score, vst, vina_desirability_section[vst])
+                base *= d**w
+                exponent += w
+                vina_exponent -= w
     # Update the pdbqt attribute
     Individual.pdbqt = pdbqt_list
-
-    # make a copy of the default values of desirability
-    # pops the region of vina_scores
-    desirability_to_work_with = desirability.copy()
-    vina_desirability_section = desirability_to_work_with.pop('vina_scores')
-    # Initialize base and exponent
-    base = 1
-    exponent = 0
-    # Runs for all properties different to vina_scores
-    for variable in desirability_to_work_with:
-        for key in desirability_to_work_with[variable]:
-            if key == 'w':
-                w = desirability_to_work_with[variable][key]
-            elif key in utils.DerringerSuichDesirability():
-                d = utils.DerringerSuichDesirability()[key](
-                    getattr(Individual, variable), **desirability_to_work_with[variable][key])
-            else:
-                raise RuntimeError(f"Inside the desirability dictionary you provided for the variable = {variable} "
-                                   f"a non implemented key = {key}. Only are possible: 'w' (standing for weight) and "
-                                   "any possible Derringer-Suich "
-                                   f"desirability function: {utils.DerringerSuichDesirability().keys()}. "
-                                   "Only in the case of vina_scores [min and max] keys")
-        base *= d**w
-        exponent += w
+    if keep_modes:
+        Individual.docking = docking_list
 
     # Check how to build the desirability
     if vina_score_type == 'ensemble':
@@ -993,22 +1803,6 @@ def CostMultiReceptors(
                                    f"desirability function: SmallerTheBest and LargerTheBest.")
         base *= d**w
         exponent += w
-    else:
-        # Run only for vina_scores
-        for vs, vst in zip(Individual.vina_score, vina_score_type):
-            for key in vina_desirability_section[vst]:
-                if key == 'w':
-                    w = vina_desirability_section[vst][key]
-                elif key in utils.DerringerSuichDesirability():
-                    d = utils.DerringerSuichDesirability()[key](vs, **vina_desirability_section[vst][key])
-                else:
-                    raise RuntimeError("Inside the desirability dictionary "
-                                       f"you provided for the variable = vina_scores[{vst}] "
-                                       f"a non implemented key = {key}. Only are possible: 'w' (standing for weight) and "
-                                       "any possible Derringer-Suich "
-                                       f"desirability function: {utils.DerringerSuichDesirability().keys()}.")
-            base *= d**w
-            exponent += w
 
     # We are using a geometric mean. And because we are minimizing we have to return
     Individual.cost = 1 - base**(1 / exponent)
@@ -1035,7 +1829,18 @@ def CostMultiReceptorsOnlyVina(
         constraint_num_conf: int = 100,
         constraint_minimum_conf_rms: int = 0.01,
         desirability: Dict = None,
-        wt_cutoff: Union[None, float] = None):
+        wt_cutoff: Union[None, float] = None,
+        cache_dir: Union[None, str] = None,
+        cache_max_size: float = 1024,
+        backend: str = 'executable',
+        io_mode: str = 'disk',
+        timeout: float = None,
+        receptor_jobs: int = 1,
+        cost_threshold: float = None,
+        prefilter: Dict = None,
+        num_conf: int = 1,
+        minimum_conf_rms: float = 0.5,
+        keep_modes: bool = False):
     """
     This function is similar to :meth:`moldrug.fitness.
     CostOnlyVina` but it will add the possibility to work with more than one receptor.
@@ -1127,6 +1932,50 @@ def CostMultiReceptorsOnlyVina(
         If some number is provided,
         the molecules with a molecular weight higher than wt_cutoff
         will get as vina_score = cost = np.inf. Vina will not be invoked, by default None
+    cache_dir : Union[None, str], optional
+        Directory of a :meth:`moldrug.fitness.DockingCache` to reuse the docking results
+        of molecules already docked with the same receptor and parameters, by default None (no cache)
+    cache_max_size : float, optional
+        Maximum size (in MB) of the docking cache, by default 1024
+    backend : str, optional
+        How Vina is invoked: executable (vina_executable) or python (Vina python bindings,
+        the receptor and affinity maps are computed once per process and reused), by default 'executable'
+    io_mode : str, optional
+        disk (the Vina files are kept in wd) or memory (the files are staged on a RAM-backed
+        directory, parsed from memory and removed immediately), by default 'disk'
+    timeout : float, optional
+        Maximum wall-clock time (in seconds) for each docking job. Runaway vina processes are killed and the
+        Individual is considered as a failed docking (pdbqt = 'VinaTimeout'). Check :meth:`moldrug.fitness._vinadock`,
+        by default None (no limit)
+    receptor_jobs : int, optional
+        How many receptors are docked at the same time for the Individual (threads, each one running its own vina
+        process in wd/receptor_<i>). The results keep the order of receptor_pdbqt_path. Every vina process uses ncores,
+        so each worker of the GA can use up to receptor_jobs * ncores cpus. It has no effect with backend = 'python',
+        by default 1 (one receptor after the other)
+    cost_threshold : float, optional
+        Early exit. Before docking each receptor (or batch of receptor_jobs receptors) the lowest cost that the
+        Individual could still get is calculated (the remaining desirabilities equal to 1). If it is not lower than
+        cost_threshold, the rest of the receptors are not docked (vina_score = np.inf, pdbqt = 'EarlyExit') and this
+        lower bound is used as cost. :meth:`moldrug.utils.GA` with ``early_exit = True`` sets it to the cost of the
+        worst member of the population. Not used with vina_score_type = 'ensemble',
+        by default None (all the receptors are docked)
+    prefilter : Dict, optional
+        Gates of :meth:`moldrug.utils.prefilter` checked before anything else, e.g.
+        {'MolWt': [None, 500], 'NumRotatableBonds': [None, 10], 'lipinski': 2, 'pains': True}.
+        The rejected molecules are not docked and get cost = np.inf, vina_score = np.inf, pdbqt = 'Prefiltered'
+        and the attribute prefiltered with the name of the failed gate. The results are kept by the process,
+        by default None (no filter)
+    num_conf : int, optional
+        Number of diverse starting conformers of the ligand for non constraint docking. If greater than 1,
+        they are generated from Individual.mol, docked in one vina call and the best pose is kept.
+        Check :meth:`moldrug.fitness._vinadock`, by default 1 (Individual.pdbqt is docked)
+    minimum_conf_rms : float, optional
+        RMSD (angstrom) to discard similar starting conformers when num_conf > 1, by default 0.5
+    keep_modes : bool, optional
+        If True, all the docked modes (energies, RMSD bounds, coordinates and the raw pdbqt output) are kept
+        on the attribute docking of the Individual as a list with one :meth:`moldrug.utils.DockingResult`
+        per receptor (None for the receptors that were not docked). It is not set for the molecules
+        that are not docked at all (e.g. prefilter), by default False
 
     Returns
     -------
@@ -1158,6 +2007,16 @@ def CostMultiReceptorsOnlyVina(
             exhaustiveness = 4,ncores = 4)
         print(NewI.cost, NewI.vina_score)
     """
+    # Cheap filter, the rejected molecules are not docked
+    if prefilter:
+        reason = _prefilter(Individual, prefilter)
+        if reason:
+            Individual.vina_score = [np.inf] * len(receptor_pdbqt_path)
+            Individual.cost = np.inf
+            Individual.pdbqt = ['Prefiltered'] * len(receptor_pdbqt_path)
+            Individual.prefiltered = reason
+            return Individual
+
     if desirability is None:
         desirability = __get_default_desirability(multireceptor=True)['vina_scores']
     else:
@@ -1186,11 +2045,14 @@ def CostMultiReceptorsOnlyVina(
 
     # Getting Vina score
     pdbqt_list = []
+    docking_list = []
     Individual.vina_score = []
+    dockings = []
     for (i, _) in enumerate(receptor_pdbqt_path):
         # Getting vina_score and update pdbqt
         if constraint:
-            vina_score, pdbqt = _vinadock(
+            dockings.append(partial(
+                _vinadock,
                 Individual=Individual,
                 wd=wd,
                 vina_executable=vina_executable,
@@ -1207,9 +2069,19 @@ def CostMultiReceptorsOnlyVina(
                 constraint_ref=constraint_ref,
                 constraint_receptor_pdb_path=constraint_receptor_pdb_path[i],
                 constraint_num_conf=constraint_num_conf,
-                constraint_minimum_conf_rms=constraint_minimum_conf_rms)
+                constraint_minimum_conf_rms=constraint_minimum_conf_rms,
+                cache_dir=cache_dir,
+                cache_max_size=cache_max_size,
+                backend=backend,
+                io_mode=io_mode,
+                timeout=timeout,
+                num_conf=num_conf,
+                minimum_conf_rms=minimum_conf_rms,
+                keep_modes=keep_modes,
+                receptor_id=i))
         else:
-            vina_score, pdbqt = _vinadock(
+            dockings.append(partial(
+                _vinadock,
                 Individual=Individual,
                 wd=wd,
                 vina_executable=vina_executable,
@@ -1220,11 +2092,53 @@ def CostMultiReceptorsOnlyVina(
                 exhaustiveness=exhaustiveness,
                 ad4map=ad4map[i],
                 ncores=ncores,
-                num_modes=num_modes)
-        Individual.vina_score.append(vina_score)
-        pdbqt_list.append(pdbqt)
+                num_modes=num_modes,
+                cache_dir=cache_dir,
+                cache_max_size=cache_max_size,
+                backend=backend,
+                io_mode=io_mode,
+                timeout=timeout,
+                num_conf=num_conf,
+                minimum_conf_rms=minimum_conf_rms,
+                keep_modes=keep_modes,
+                receptor_id=i))
+    # Initialize base and exponent
+    base = 1
+    exponent = 0
+    if vina_score_type != 'ensemble':
+        # Weight of the vina scores on the geometric mean
+        vina_exponent = sum(desirability[vst]['w'] for vst in vina_score_type)
+    # With cost_threshold the receptors are docked in batches (of receptor_jobs).
+    # For ensemble the cost is not bounded until the end, there is not early exit.
+    early_exit = cost_threshold is not None and vina_score_type != 'ensemble'
+    batch = max(1, receptor_jobs if early_exit else len(dockings))
+    for start in range(0, len(dockings), batch):
+        if early_exit:
+            # The lowest cost that the Individual can still get (all the remaining desirabilities equal to 1)
+            best_cost = 1 - base**(1 / (exponent + vina_exponent))
+            if best_cost >= cost_threshold:
+                Individual.vina_score += [np.inf] * (len(dockings) - start)
+                Individual.pdbqt = pdbqt_list + ['EarlyExit'] * (len(dockings) - start)
+                if keep_modes:
+                    Individual.docking = docking_list + [None] * (len(dockings) - start)
+                Individual.cost = best_cost
+                return Individual
+        for result in _dock_receptors(dockings[start:start + batch], receptor_jobs):
+            vina_score, pdbqt = result[:2]
+            Individual.vina_score.append(vina_score)
+            pdbqt_list.append(pdbqt)
+            if keep_modes:
+                docking_list.append(result[2])
+            if vina_score_type != 'ensemble':
+                vst = vina_score_type[len(Individual.vina_score) - 1]
+                d, w = _vina_desirability(vina_score, vst, desirability[vst])
+                base *= d**w
+                exponent += w
+                vina_exponent -= w
     # Update the pdbqt attribute
     Individual.pdbqt = pdbqt_list
+    if keep_modes:
+        Individual.docking = docking_list
 
     if vina_score_type == 'ensemble':
         # In this case the user is looking for a minimum (potent binder)
@@ -1237,26 +2151,6 @@ def CostMultiReceptorsOnlyVina(
                                "SmallerTheBest and LargerTheBest are possible")
         Individual.cost = vina_score_to_use
     else:
-        # Initialize base and exponent
-        base = 1
-        exponent = 0
-        # Run for vina_scores
-        for vs, vst in zip(Individual.vina_score, vina_score_type):
-            for key in desirability[vst]:
-                if key == 'w':
-                    w = desirability[vst][key]
-                elif key in utils.DerringerSuichDesirability():
-                    d = utils.DerringerSuichDesirability()[key](vs, **desirability[vst][key])
-                else:
-                    raise RuntimeError("Inside the desirability dictionary you provided "
-                                       f"for the variable = vina_scores[{vst}] "
-                                       f"a non implemented key = {key}. "
-                                       "Only are possible: 'w' (standing for weight) "
-                                       "and any possible Derringer-Suich "
-                                       f"desirability function: {utils.DerringerSuichDesirability().keys()}.")
-            base *= d**w
-            exponent += w
-
         # We are using a geometric mean. And because we are minimizing we have to return
         Individual.cost = 1 - base**(1 / exponent)
     return Individual
@@ -1,15 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import bz2
+import collections
 import collections.abc
 import datetime
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
 import multiprocessing as mp
 import os
+import pickle as std_pickle
+import queue
 import random
+import re
 import shutil
+import signal
+import sqlite3
+import struct
 import subprocess
 import tempfile
+import threading
 import time
+import types
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from inspect import signature
 from typing import Callable, Dict, Iterable, List, Union
@@ -23,7 +40,8 @@ from crem.crem import grow_mol, mutate_mol
 from meeko import (MoleculePreparation, PDBQTMolecule, PDBQTWriterLegacy,
                    RDKitMolCreate)
 from rdkit import Chem, RDLogger
-from rdkit.Chem import AllChem, DataStructs, Descriptors, Lipinski, rdFMCS
+from rdkit.Chem import (QED, AllChem, DataStructs, Descriptors, FilterCatalog,
+                        Lipinski, rdFMCS)
 
 from moldrug import __version__
 
@@ -36,7 +54,7 @@ RDLogger.DisableLog('rdApp.*')
 ################################################
 
 
-def run(command: str, shell: bool = True, executable: str = '/bin/bash'):
+def run(command: str, shell: bool = True, executable: str = '/bin/bash', timeout: float = None):
     """This function is just a useful wrapper around subprocess.run
 
     Parameters
@@ -47,6 +65,9 @@ def run(command: str, shell: bool = True, executable: str = '/bin/bash'):
         keyword of ``subprocess.Popen`` and ``subprocess.Popen``, by default True
     executable : str, optional
         keyword of ``subprocess.Popen`` and ``subprocess.Popen``, by default '/bin/bash'
+    timeout : float, optional
+        Maximum wall-clock time (in seconds). If it is exceeded, the command and all the processes
+        that it started (e.g. the programs called by the shell) are killed, by default None (no limit)
 
     Returns
     -------
@@ -57,10 +78,22 @@ def run(command: str, shell: bool = True, executable: str = '/bin/bash'):
     ------
     RuntimeError
         In case of non-zero exit status on the provided command.
+    subprocess.TimeoutExpired
+        If the command did not finish in timeout seconds.
     """
-
-    process = subprocess.run(command, shell=shell, executable=executable,
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # The command runs in its own process group in order to kill all its processes on timeout
+    with subprocess.Popen(command, shell=shell, executable=executable, start_new_session=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.communicate()
+            raise
+    process = subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
     returncode = process.returncode
     if returncode != 0:
         # print(f'Command {command} returned non-zero exit status {returncode}')
@@ -107,8 +140,157 @@ def confgen(mol: Chem.rdchem.Mol, return_mol: bool = False, randomseed: Union[in
         return pdbqt_string
 
 
+def conformers_to_pdbqt(mol: Chem.rdchem.Mol, conf_ids: List[int] = None) -> List[str]:
+    """Write the conformers of a molecule as pdbqt strings. The molecule is prepared only once with meeko
+    (atom typing and torsion tree) and the coordinates of every conformer are written with the same setup.
+    When meeko adds pseudo-atoms (e.g. the G/CG atoms of the broken bonds of macrocycles), their positions
+    depend on the conformer; in that case every conformer is prepared on its own.
+
+    Parameters
+    ----------
+    mol : Chem.rdchem.Mol
+        An RDKit molecule with explicit hydrogens and at least one conformer.
+    conf_ids : List[int], optional
+        The ids of the conformers to write, by default None (all of them)
+
+    Returns
+    -------
+    List[str]
+        The pdbqt strings in the order of ``conf_ids``.
+    """
+    if conf_ids is None:
+        conf_ids = [conf.GetId() for conf in mol.GetConformers()]
+    if not conf_ids:
+        return []
+    preparator = MoleculePreparation()
+    mol_setup = preparator.prepare(mol, conformer_id=conf_ids[0])[0]
+    pdbqts = [PDBQTWriterLegacy.write_string(mol_setup)[0]]
+    shared = len(mol_setup.coord) == mol.GetNumAtoms() and not mol_setup.ring_closure_info.get('bonds_removed')
+    for conf_id in conf_ids[1:]:
+        if shared:
+            for i, position in enumerate(mol.GetConformer(conf_id).GetPositions()):
+                mol_setup.set_coord(i, position)
+        else:
+            mol_setup = preparator.prepare(mol, conformer_id=conf_id)[0]
+        pdbqts.append(PDBQTWriterLegacy.write_string(mol_setup)[0])
+    return pdbqts
+
+
+def confgen_ensemble(mol: Chem.rdchem.Mol, num_conf: int = 10, randomseed: Union[int, None] = None,
+                     minimum_conf_rms: float = 0.5) -> List[str]:
+    """Create several diverse 3D models of a molecule and return them as pdbqt strings.
+    It is the multi-conformer version of :meth:`moldrug.utils.confgen`.
+
+    Parameters
+    ----------
+    mol : Chem.rdchem.Mol
+        A valid RDKit molecule.
+    num_conf : int, optional
+        Maximum number of conformers, by default 10
+    randomseed : Union[None, int], optional
+        Provide a seed for the random number generator so that the same coordinates
+        can be obtained for a molecule on multiple runs. If None, the RNG will not be seeded, by default None
+    minimum_conf_rms : float, optional
+        The conformers closer (RMSD in angstrom, heavy atoms) than this to a previous one are discarded, by default 0.5
+
+    Returns
+    -------
+    List[str]
+        The pdbqt strings (at most ``num_conf``).
+
+    Raises
+    ------
+    ValueError
+        If no conformer could be generated.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        from rdkit import Chem
+        pdbqts = utils.confgen_ensemble(Chem.MolFromSmiles('CC(=O)Nc1ccc(O)cc1'), num_conf=5, randomseed=1234)
+        print(len(pdbqts))
+    """
+    mol = Chem.AddHs(mol)
+    if randomseed is None:
+        randomSeed = -1
+    else:
+        randomSeed = randomseed
+
+    conf_ids = list(AllChem.EmbedMultipleConfs(mol, numConfs=num_conf, randomSeed=randomSeed,
+                                               pruneRmsThresh=minimum_conf_rms))
+    if not conf_ids:
+        raise ValueError(f"It was not possible to embed {Chem.MolToSmiles(Chem.RemoveHs(mol))}")
+    # The same as in confgen, the optimization is not used when randomseed is set
+    if not randomseed:
+        AllChem.MMFFOptimizeMoleculeConfs(mol, maxIters=500)
+    return conformers_to_pdbqt(mol, conf_ids)
+
+
+def confgen_many(mols: List[Chem.rdchem.Mol], njobs: int = 1, randomseed: Union[None, int, List] = None,
+                 return_errors: bool = False):
+    """Create the 3D models (pdbqt strings) of several molecules with :meth:`moldrug.utils.confgen`.
+    The molecules are distributed over a pool of threads; the embedding and the MMFF optimization
+    of RDKit release the GIL, so they run at the same time. The result of every molecule
+    is the same as the one of :meth:`moldrug.utils.confgen` with the same randomseed.
+
+    Parameters
+    ----------
+    mols : List[Chem.rdchem.Mol]
+        The RDKit molecules.
+    njobs : int, optional
+        Number of threads, by default 1
+    randomseed : Union[None, int, List], optional
+        The seed used for every molecule or a list with one seed per molecule, by default None
+    return_errors : bool, optional
+        If True, it also returns the exception raised for every molecule (None if it succeeded), by default False
+
+    Returns
+    -------
+    list or tuple
+        The pdbqt strings in the order of ``mols``, None for the molecules that failed.
+        If ``return_errors = True``, a tuple ``(pdbqts, errors)``.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        from rdkit import Chem
+        mols = [Chem.MolFromSmiles('CCO'), Chem.MolFromSmiles('c1ccccc1O')]
+        pdbqts = utils.confgen_many(mols, njobs=2, randomseed=1234)
+        print(pdbqts[0])
+    """
+    if isinstance(randomseed, (list, tuple)):
+        if len(randomseed) != len(mols):
+            raise ValueError(f"randomseed has {len(randomseed)} elements but there are {len(mols)} molecules")
+        seeds = randomseed
+    else:
+        seeds = [randomseed] * len(mols)
+
+    def _confgen(args):
+        mol, seed = args
+        try:
+            return confgen(mol, randomseed=seed), None
+        except Exception as error:
+            return None, error
+
+    if njobs > 1 and len(mols) > 1:
+        with ThreadPoolExecutor(max_workers=min(njobs, len(mols))) as executor:
+            results = list(executor.map(_confgen, zip(mols, seeds)))
+    else:
+        results = [_confgen(args) for args in zip(mols, seeds)]
+
+    pdbqts = [pdbqt for pdbqt, _ in results]
+    if return_errors:
+        return pdbqts, [error for _, error in results]
+    return pdbqts
+
+
 def update_reactant_zone(parent: Chem.rdchem.Mol, offspring: Chem.rdchem.Mol,
-                         parent_replace_ids: List[int] = None, parent_protected_ids: List[int] = None):
+                         parent_replace_ids: List[int] = None, parent_protected_ids: List[int] = None,
+                         timeout: int = None):
     """This function will find the difference between offspring and parent
     based on the Maximum Common Substructure (MCS).
     This difference will be consider offspring_replace_ids.
@@ -128,6 +310,10 @@ def update_reactant_zone(parent: Chem.rdchem.Mol, offspring: Chem.rdchem.Mol,
         A list of replaceable indexes in the parent, by default None
     parent_protected_ids : List[int], optional
         A list of protected indexes in the parent, by default None
+    timeout : int, optional
+        Maximum time (in seconds) for the MCS search, the best MCS found up to that moment is used,
+        by default None (the default of RDKit)
+
     Returns
     -------
     tuple[list[int]]
@@ -136,7 +322,10 @@ def update_reactant_zone(parent: Chem.rdchem.Mol, offspring: Chem.rdchem.Mol,
     """
 
     # Finding Maximum Common Substructure (MCS) and getting the SMARTS
-    mcs = rdFMCS.FindMCS([parent, offspring], matchValences=True, ringMatchesRingOnly=True)
+    if timeout is None:
+        mcs = rdFMCS.FindMCS([parent, offspring], matchValences=True, ringMatchesRingOnly=True)
+    else:
+        mcs = rdFMCS.FindMCS([parent, offspring], matchValences=True, ringMatchesRingOnly=True, timeout=timeout)
     mcs_mol = Chem.MolFromSmarts(mcs.smartsString)
 
     # Get the index corresponding to the MCS for both parent and offspring
@@ -307,6 +496,74 @@ def lipinski_profile(mol: Chem.rdchem.Mol):
     return profile
 
 
+_pains_catalog = None
+
+
+def prefilter(mol: Chem.rdchem.Mol, gates: Dict) -> Union[None, str]:
+    """Cheap filter of molecules that are not worth docking. The gates are checked
+    in the order given and the first failed one is returned.
+
+    Parameters
+    ----------
+    mol : Chem.rdchem.Mol
+        An RDKit molecule.
+    gates : Dict
+        The gates. The possible keys are:
+
+        * Any descriptor of :mod:`rdkit.Chem.Descriptors` (e.g. MolWt, NumRotatableBonds, HeavyAtomCount, TPSA),
+          ``qed`` or ``sa_score`` (calculated as in :meth:`moldrug.fitness.Cost`). The value is a list
+          [minimum, maximum] of the allowed range, None means no limit.
+        * lipinski: the maxviolation of :meth:`moldrug.utils.lipinski_filter`.
+        * pains: if True, the molecules with PAINS substructures are rejected.
+
+    Returns
+    -------
+    Union[None, str]
+        None if the molecule passed all the gates, otherwise the name of the failed gate.
+
+    Raises
+    ------
+    ValueError
+        In case of a non valid gate.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        from rdkit import Chem
+        mol = Chem.MolFromSmiles('CCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCCC')
+        print(utils.prefilter(mol, {'HeavyAtomCount': [None, 40], 'NumRotatableBonds': [None, 10]}))
+    """
+    global _pains_catalog
+    for gate, value in gates.items():
+        if gate == 'lipinski':
+            if not lipinski_filter(mol, maxviolation=value):
+                return gate
+        elif gate == 'pains':
+            if value:
+                if _pains_catalog is None:
+                    params = FilterCatalog.FilterCatalogParams()
+                    params.AddCatalog(FilterCatalog.FilterCatalogParams.FilterCatalogs.PAINS)
+                    _pains_catalog = FilterCatalog.FilterCatalog(params)
+                if _pains_catalog.HasMatch(mol):
+                    return gate
+        else:
+            if gate == 'qed':
+                prop = QED.weights_mean(Chem.RemoveHs(mol))
+            elif gate == 'sa_score':
+                prop = import_sascorer().calculateScore(Chem.RemoveHs(mol))
+            elif hasattr(Descriptors, gate):
+                prop = getattr(Descriptors, gate)(mol)
+            else:
+                raise ValueError(f"{gate} is not a valid gate. Use lipinski, pains, qed, sa_score "
+                                 "or a descriptor of rdkit.Chem.Descriptors")
+            minimum, maximum = value
+            if (minimum is not None and prop < minimum) or (maximum is not None and prop > maximum):
+                return gate
+    return None
+
+
 def LargerTheBest(Value: float, LowerLimit: float, Target: float, r: float = 1) -> float:
     """Desirability function used when larger values are the targets. If Value is higher
     or equal than the target it will return 1; if it is lower than LowerLimit it will return 0;
@@ -423,6 +680,70 @@ def DerringerSuichDesirability():
 
 
 # Saving data
+class _StandardPickler(std_pickle.Pickler):
+    # dill is only needed for the functions and classes that must be pickled by value:
+    # defined in __main__, lambdas and nested ones
+    def reducer_override(self, obj):
+        if isinstance(obj, (types.FunctionType, type)) and \
+                (obj.__module__ == '__main__' or '<' in obj.__qualname__):
+            raise std_pickle.PicklingError(f"{obj} needs dill")
+        return NotImplemented
+
+
+def _dumps(data: object) -> bytes:
+    # The C implementation of the standard pickle is much faster than dill
+    buffer = io.BytesIO()
+    try:
+        _StandardPickler(buffer, protocol=std_pickle.HIGHEST_PROTOCOL).dump(data)
+        return buffer.getvalue()
+    except (std_pickle.PicklingError, TypeError, AttributeError):
+        return pickle.dumps(data, protocol=std_pickle.HIGHEST_PROTOCOL)
+
+
+def _loads(data: bytes) -> object:
+    # Pickles created by dill can also be read with the standard pickle (dill only must be importable)
+    try:
+        return std_pickle.loads(data)
+    except Exception:
+        return pickle.loads(data)
+
+
+def _import_optional(module: str, package: str):
+    try:
+        return __import__(module, fromlist=['_'])
+    except ImportError as e:
+        raise ImportError(f"{package} is needed for this compression codec. Install it with: pip install {package}") from e
+
+
+# Extension, compress(data, level) and decompress(data) of each codec
+CODECS = {
+    'bz2': ('.pbz2',
+            lambda data, level: bz2.compress(data, compresslevel=level or 9),
+            bz2.decompress),
+    'gzip': ('.pgz',
+             lambda data, level: gzip.compress(data, compresslevel=6 if level is None else level),
+             gzip.decompress),
+    'lzma': ('.pxz',
+             lambda data, level: lzma.compress(data, preset=level),
+             lzma.decompress),
+    'zstd': ('.pzst',
+             lambda data, level: _import_optional('zstandard', 'zstandard').ZstdCompressor(
+                 level=3 if level is None else level).compress(data),
+             lambda data: _import_optional('zstandard', 'zstandard').ZstdDecompressor().decompress(data)),
+    'lz4': ('.plz4',
+            lambda data, level: _import_optional('lz4.frame', 'lz4').compress(data, compression_level=level or 0),
+            lambda data: _import_optional('lz4.frame', 'lz4').decompress(data)),
+}
+# The codec of a file is identified by the first bytes (magic number)
+_CODEC_MAGIC = {
+    b'BZh': 'bz2',
+    b'\x1f\x8b': 'gzip',
+    b'\xfd7zXZ\x00': 'lzma',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+    b'\x04\x22\x4d\x18': 'lz4',
+}
+
+
 def full_pickle(title: str, data: object):
     """Normal pickle.
 
@@ -434,7 +755,7 @@ def full_pickle(title: str, data: object):
         Any serializable python object
     """
     with open(f'{title}.pkl', 'wb') as pkl:
-        pickle.dump(data, pkl)
+        pkl.write(_dumps(data))
 
 
 def loosen(file: str):
@@ -451,40 +772,83 @@ def loosen(file: str):
         The python object.
     """
     with open(file, 'rb') as pkl:
-        data = pickle.load(pkl)
+        data = _loads(pkl.read())
     return data
 
 
-def compressed_pickle(title: str, data: object):
-    """Compress Python object. First cPickle it and then bz2.BZ2File compressed it.
+def compressed_pickle(title: str, data: object, codec: str = None, level: int = None) -> str:
+    """Compress Python object. First pickle it and then compress it.
+    The standard pickle is used when possible; dill only for objects that need it
+    (e.g. functions defined in __main__ or lambdas).
 
     Parameters
     ----------
     title : str
-         Name of the file without extensions, .pbz2 will be added by default
+        Name of the file. If it does not end with the extension of one of the codecs
+        (.pbz2, .pgz, .pxz, .pzst, .plz4), the extension of codec will be added.
     data : object
         Any serializable python object
+    codec : str, optional
+        One of the keys of ``moldrug.utils.CODECS``: bz2, gzip, lzma, zstd (needs ``pip install zstandard``)
+        or lz4 (needs ``pip install lz4``), by default None. If None, it is taken from the extension of title
+        and if title does not have a valid extension, bz2 is used.
+        bz2 compress the most, but it is very slow; zstd and lz4 are much faster.
+    level : int, optional
+        Compression level of the codec, by default None (bz2: 9, gzip: 6, lzma: 6, zstd: 3, lz4: 0).
+
+    Returns
+    -------
+    str
+        The name of the file.
+
+    Raises
+    ------
+    ValueError
+        If codec is not valid.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        file = utils.compressed_pickle('example', {'a': 1}, codec='gzip')
+        print(file, utils.decompress_pickle(file))
     """
-    with bz2.BZ2File(f'{title}.pbz2', 'w') as f:
-        pickle.dump(data, f)
+    extensions = {extension: name for name, (extension, *_) in CODECS.items()}
+    if codec is None:
+        codec = extensions.get(os.path.splitext(title)[1], 'bz2')
+    if codec not in CODECS:
+        raise ValueError(f"codec must be one of {list(CODECS)}. {codec} was provided")
+    extension, compress, _ = CODECS[codec]
+    if not title.endswith(extension):
+        title += extension
+    data = compress(_dumps(data), level)
+    with open(title, 'wb') as f:
+        f.write(data)
+    return title
 
 
 def decompress_pickle(file: str):
-    """Decompress CPickle objects compressed first with bz2 formats
+    """Decompress pickled objects created with :meth:`moldrug.utils.compressed_pickle`.
+    The codec is identified from the content of the file, the extension is not needed.
 
     Parameters
     ----------
     file : str
-         This is the cPickle files compressed with bz2.BZ2File. (as a convention with extension .pbz2, but not needed)
+         The compressed pickle file (e.g. .pbz2 files, the default of moldrug).
 
     Returns
     -------
     object
         The python object.
     """
-    data = bz2.BZ2File(file, 'rb')
-    data = pickle.load(data)
-    return data
+    with open(file, 'rb') as f:
+        data = f.read()
+    for magic, codec in _CODEC_MAGIC.items():
+        if data.startswith(magic):
+            data = CODECS[codec][2](data)
+            break
+    return _loads(data)
 
 
 def is_iter(obj):
@@ -507,23 +871,31 @@ def is_iter(obj):
         return False
 
 
+_sascorer = None
+
+
 def import_sascorer():
-    """Function to import sascorer from RDConfig.RDContribDir of RDKit
+    """Function to import sascorer from RDConfig.RDContribDir of RDKit.
+    The module is only loaded the first time that the function is called
+    (per process), the following calls return the same module.
 
     Returns
     -------
     module
         The sascorer module ready to use.
     """
-    # In order to import sascorer from RDConfig.RDContribDir
-    import importlib.util as importlib_util
+    global _sascorer
+    if _sascorer is None:
+        # In order to import sascorer from RDConfig.RDContribDir
+        import importlib.util as importlib_util
 
-    from rdkit.Chem import RDConfig
-    spec = importlib_util.spec_from_file_location(
-        'sascorer', os.path.join(RDConfig.RDContribDir, 'SA_Score', 'sascorer.py'))
-    sascorer = importlib_util.module_from_spec(spec)
-    spec.loader.exec_module(sascorer)
-    return sascorer
+        from rdkit.Chem import RDConfig
+        spec = importlib_util.spec_from_file_location(
+            'sascorer', os.path.join(RDConfig.RDContribDir, 'SA_Score', 'sascorer.py'))
+        sascorer = importlib_util.module_from_spec(spec)
+        spec.loader.exec_module(sascorer)
+        _sascorer = sascorer
+    return _sascorer
 
 
 def deep_update(target_dict: dict, update_dict: dict) -> dict:
@@ -572,6 +944,254 @@ def softmax(x, axis=None):
 ###########################################################################
 
 
+class VinaOutput:
+    """Fast parser of the pdbqt output of vina. The MODEL/ENDMDL boundaries and the
+    ``REMARK VINA RESULT`` lines of all the models are found with one scan of a single buffer
+    (bytes or a memory map of the file); no object is created per atom. The text and the coordinates
+    of a model are only extracted on demand.
+
+    Attributes
+    ----------
+    energies : numpy.ndarray
+        Vina score (kcal/mol) of every model, np.inf for the models without ``REMARK VINA RESULT``.
+    rmsd_lb : numpy.ndarray
+        RMSD lower bound (from the best mode) of every model.
+    rmsd_ub : numpy.ndarray
+        RMSD upper bound (from the best mode) of every model.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        vina_out = utils.VinaOutput(
+            "MODEL 1\\n"
+            "REMARK VINA RESULT:    -5.738      0.000      0.000\\n"
+            "ATOM      1  C   UNL     1      -1.224   1.276   0.607  1.00  0.00     0.210 C \\n"
+            "ENDMDL\\n")
+        print(len(vina_out), vina_out.energies, vina_out.best())
+        print(vina_out.coordinates(vina_out.best()))
+    """
+    # The patterns start with a literal (much faster search than ^ with re.MULTILINE);
+    # the matches that are not at the beginning of a line are discarded
+    _model_pattern = re.compile(rb'MODEL[^\n]*')
+    _endmdl_pattern = re.compile(rb'ENDMDL')
+    _result_pattern = re.compile(rb'REMARK VINA RESULT:[ \t]*(\S+)[ \t]+(\S+)[ \t]+(\S+)')
+    _atom_pattern = re.compile(rb'^(?:ATOM|HETATM)[^\n]*', re.MULTILINE)
+
+    @staticmethod
+    def _line_starts(pattern: re.Pattern, buffer) -> list:
+        return [match for match in pattern.finditer(buffer) if match.start() == 0 or buffer[match.start() - 1] == 10]
+
+    def __init__(self, buffer: Union[bytes, str, mmap.mmap]):
+        """
+        Parameters
+        ----------
+        buffer : Union[bytes, str, mmap.mmap]
+            The content of the vina output.
+        """
+        if isinstance(buffer, str):
+            buffer = buffer.encode()
+        self.buffer = buffer
+
+        model_matches = self._line_starts(self._model_pattern, buffer)
+        self._starts = np.array([match.start() for match in model_matches], dtype=np.int64)
+        self.runs = [int(match.group()[5:].strip() or 0) for match in model_matches]
+        endmdls = np.array([match.start() for match in self._line_starts(self._endmdl_pattern, buffer)], dtype=np.int64)
+        # The ENDMDL of every model (the end of the buffer if it is missing)
+        self._ends = np.full(len(self._starts), len(buffer), dtype=np.int64)
+        if len(endmdls):
+            position = np.searchsorted(endmdls, self._starts)
+            found = position < len(endmdls)
+            self._ends[found] = endmdls[position[found]]
+            # An ENDMDL after the next MODEL belongs to the next model
+            next_starts = np.append(self._starts[1:], len(buffer))
+            self._ends = np.minimum(self._ends, next_starts)
+
+        self.energies = np.full(len(self._starts), np.inf)
+        self.rmsd_lb = np.full(len(self._starts), np.nan)
+        self.rmsd_ub = np.full(len(self._starts), np.nan)
+        result_matches = self._line_starts(self._result_pattern, buffer)
+        if len(self._starts) and result_matches:
+            positions = np.array([match.start() for match in result_matches], dtype=np.int64)
+            values = np.array([match.groups() for match in result_matches]).astype(float)
+            # The model of every result line (only the lines between MODEL and ENDMDL are used)
+            i = np.searchsorted(self._starts, positions, side='right') - 1
+            inside = (i >= 0) & (positions < self._ends[np.maximum(i, 0)])
+            self.energies[i[inside]], self.rmsd_lb[i[inside]], self.rmsd_ub[i[inside]] = values[inside].T
+
+    @classmethod
+    def from_file(cls, file: str, use_mmap: bool = False):
+        """Parse a vina output file.
+
+        Parameters
+        ----------
+        file : str
+            Path to the file.
+        use_mmap : bool, optional
+            If True, the file is memory-mapped instead of read, useful for very large files, by default False
+
+        Returns
+        -------
+        VinaOutput
+            The parsed output.
+        """
+        with open(file, 'rb') as f:
+            if use_mmap and os.fstat(f.fileno()).st_size:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+        return cls(buffer)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def best(self) -> int:
+        """Index of the model with the lowest energy (the first one in case of ties).
+
+        Returns
+        -------
+        int
+            The index.
+        """
+        return int(np.argmin(self.energies))
+
+    def model(self, i: int) -> str:
+        """The pdbqt text of a model, from MODEL to ENDMDL (included).
+
+        Parameters
+        ----------
+        i : int
+            Index of the model.
+
+        Returns
+        -------
+        str
+            The text.
+        """
+        return self.buffer[self._starts[i]:self._ends[i]].decode() + "ENDMDL\n"
+
+    def coordinates(self, i: int) -> np.ndarray:
+        """Coordinates of the ATOM/HETATM records of a model.
+
+        Parameters
+        ----------
+        i : int
+            Index of the model.
+
+        Returns
+        -------
+        np.ndarray
+            An (n_atoms, 3) array of floats.
+        """
+        model = self.buffer[self._starts[i]:self._ends[i]]
+        # Fixed columns 31-54 of the PDB format, converted at once
+        fields = b''.join(match.group()[30:54].ljust(24) for match in self._atom_pattern.finditer(model))
+        return np.frombuffer(fields, dtype='S8').astype(float).reshape(-1, 3)
+
+
+class DockingResult:
+    """All the modes of a docking: energies, RMSD bounds and coordinates as NumPy arrays
+    and the raw pdbqt output (compressed with zlib). The cost functions of :mod:`moldrug.fitness`
+    store it on ``Individual.docking`` with ``keep_modes = True``.
+
+    Attributes
+    ----------
+    energies : numpy.ndarray
+        Vina score (kcal/mol) of every mode.
+    rmsd_lb : numpy.ndarray
+        RMSD lower bound (from the best mode) of every mode.
+    rmsd_ub : numpy.ndarray
+        RMSD upper bound (from the best mode) of every mode.
+    coordinates : numpy.ndarray
+        A (n_modes, n_atoms, 3) float32 array with the coordinates of the ATOM/HETATM records of every mode.
+    pdbqt : str (property)
+        The raw pdbqt output with all the modes.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        from rdkit import Chem
+        pose = utils.confgen(Chem.MolFromSmiles('CCO'), randomseed=1234)
+        result = utils.DockingResult.from_pose(pose, -3.2)
+        print(len(result), result.energies, result.coordinates.shape)
+    """
+    __slots__ = ('energies', 'rmsd_lb', 'rmsd_ub', 'coordinates', '_pdbqt')
+
+    def __init__(self, vina_output: Union[str, bytes, VinaOutput]):
+        """
+        Parameters
+        ----------
+        vina_output : Union[str, bytes, VinaOutput]
+            The vina output (several outputs could be concatenated, e.g. of different starting conformers).
+        """
+        if not isinstance(vina_output, VinaOutput):
+            vina_output = VinaOutput(vina_output)
+        self.energies = vina_output.energies
+        self.rmsd_lb = vina_output.rmsd_lb
+        self.rmsd_ub = vina_output.rmsd_ub
+        self.coordinates = np.array([vina_output.coordinates(i) for i in range(len(vina_output))], dtype=np.float32)
+        self._pdbqt = zlib.compress(bytes(vina_output.buffer))
+
+    @classmethod
+    def from_pose(cls, pdbqt: str, energy: float):
+        """Build a result with only one mode, e.g. the pose of a constraint docking.
+
+        Parameters
+        ----------
+        pdbqt : str
+            The pose.
+        energy : float
+            Its vina score.
+
+        Returns
+        -------
+        DockingResult
+            The result.
+        """
+        lines = [line for line in pdbqt.splitlines(keepends=True)
+                 if not line.startswith(('MODEL', 'ENDMDL', 'REMARK VINA RESULT'))]
+        return cls(f"MODEL 1\nREMARK VINA RESULT: {energy:>9.3f}      0.000      0.000\n"
+                   f"{''.join(lines).rstrip()}\nENDMDL\n")
+
+    @property
+    def pdbqt(self) -> str:
+        return zlib.decompress(self._pdbqt).decode()
+
+    def __len__(self) -> int:
+        return len(self.energies)
+
+    def best(self) -> int:
+        """Index of the mode with the lowest energy (the first one in case of ties).
+
+        Returns
+        -------
+        int
+            The index.
+        """
+        return int(np.argmin(self.energies))
+
+    def model(self, i: int) -> str:
+        """The pdbqt text of a mode.
+
+        Parameters
+        ----------
+        i : int
+            Index of the mode.
+
+        Returns
+        -------
+        str
+            The text.
+        """
+        return VinaOutput(zlib.decompress(self._pdbqt)).model(i)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(modes = {len(self)}, energies = {self.energies.tolist()})"
+
+
 class Atom:
     """This is a simple class to wrap a pdbqt Atom.
     It is based on https://userguide.mdanalysis.org/stable/formats/reference/pdbqt.html#writing-out.
@@ -602,7 +1222,7 @@ class CHUNK_VINA_OUT:
     """
     def __init__(self, chunk):
         self.chunk = chunk
-        self.atoms = []
+        self._atoms = None
         self.run = None
         self.freeEnergy = None
         self.RMSD1 = None
@@ -615,8 +1235,13 @@ class CHUNK_VINA_OUT:
                 self.run = int(line[5:])
             elif line.startswith("REMARK VINA RESULT:"):
                 (self.freeEnergy, self.RMSD1, self.RMSD2) = [float(number) for number in line.split(":")[-1].split()]
-            elif line.startswith("ATOM"):
-                self.atoms.append(Atom(line))
+
+    @property
+    def atoms(self):
+        # The Atom objects are only created if they are requested
+        if self._atoms is None:
+            self._atoms = [Atom(line) for line in self.chunk if line.startswith("ATOM")]
+        return self._atoms
 
     def get_atoms(self):
         """Return a list of all atoms.
@@ -637,33 +1262,51 @@ class CHUNK_VINA_OUT:
 class VINA_OUT:
     """
     Vina class to handle vina output. Think about use meeko in the future!
+    The file is parsed with :class:`moldrug.utils.VinaOutput`; the chunks are only created when they are requested.
     """
     def __init__(self, file):
         self.file = file
 
-        self.chunks = []
+        self._chunks = None
         self.parse()
 
+    @classmethod
+    def from_string(cls, string: str):
+        """Build the object from the content of a vina output
+        (e.g. a buffer already in memory) instead of a file.
+
+        Parameters
+        ----------
+        string : str
+            The pdbqt string produced by vina.
+
+        Returns
+        -------
+        VINA_OUT
+            The parsed output; its file attribute is None.
+        """
+        self = cls.__new__(cls)
+        self.file = None
+        self._chunks = None
+        self.output = VinaOutput(string)
+        return self
+
     def parse(self):
-        with open(self.file, "r") as input_file:
-            lines = input_file.readlines()
-        i = 0
-        while i < len(lines):
-
-            if lines[i].startswith("MODEL"):
-                j = i
-                tmp_chunk = []
-                while (not lines[j].startswith("ENDMDL")) and (j < len(lines)):
-                    tmp_chunk.append(lines[j])
-                    j += 1
-                    i += 1
-                tmp_chunk.append("ENDMDL\n")
-                self.chunks.append(CHUNK_VINA_OUT(tmp_chunk))
-
-            i += 1
+        self.output = VinaOutput.from_file(self.file)
+
+    @property
+    def chunks(self):
+        if self._chunks is None:
+            self._chunks = [self._chunk(i) for i in range(len(self.output))]
+        return self._chunks
+
+    def _chunk(self, i):
+        if self._chunks is not None:
+            return self._chunks[i]
+        return CHUNK_VINA_OUT(self.output.model(i).splitlines(keepends=True))
 
     def BestEnergy(self, write=False):
-        min_chunk = min(self.chunks, key=lambda x: x.freeEnergy)
+        min_chunk = self._chunk(self.output.best())
         if write:
             min_chunk.write("best_energy.pdbqt")
         return min_chunk
@@ -673,6 +1316,10 @@ class VINA_OUT:
 #################################
 
 
+# Lazy generation of Individual.pdbqt
+_confgen_lock = threading.Lock()
+
+
 class Individual:
     """
     Base class to work with GA, Local and all the fitness functions.
@@ -693,11 +1340,17 @@ class Individual:
     idx: Union[int, str]
         The identifier
     pdbqt: str
-        A pdbqt string representation of the molecule, used for docking with Vina. It is generated
-        during the initialization of the class
+        A pdbqt string representation of the molecule, used for docking with Vina. If it is not provided,
+        it is generated (3D embedding with :meth:`moldrug.utils.confgen`) on the first access,
+        so the Individuals that are never docked (e.g. repeated offspring) do not pay for it.
+        None if the generation failed
     smiles: str (property)
         The SMILES representation of the mol attribute without explicit hydrogens,
-        this attribute (property) is immutable.
+        this attribute (property) is immutable. It is computed only once and
+        recomputed only if the mol attribute is reassigned.
+    key: int (property)
+        A 64-bit integer derived from smiles. Unlike ``hash``, it is the same on every process and session,
+        so it is a compact identifier to store or to share between processes.
     cost: float
         This attribute is used to interact with the fitness functions of :mod:`moldrug.fitness`
 
@@ -724,6 +1377,8 @@ class Individual:
         print(array_2)
         # Show copy
         print(copy(i3), deepcopy(i3))
+        # Stable 64-bit identifier
+        print(i1.key == i2.key, i1.key)
     """
     def __init__(self, mol: Chem.rdchem.Mol, idx: Union[int, str] = 0, pdbqt: str = None,
                  cost: float = np.inf, randomseed: Union[int, None] = None) -> None:
@@ -737,7 +1392,7 @@ class Individual:
             An identification, by default 0
         pdbqt : str, optional
             A valid pdbqt string. If it is not provided it will be generated from mol through utils.confgen
-            and the mol attribute will be update with the 3D model, by default None
+            on the first access to the attribute, by default None
         cost : float, optional
             This attribute is used to perform operations between Individuals and
             should be used for the cost functions, by default np.inf
@@ -748,19 +1403,55 @@ class Individual:
         self.mol = mol
 
         if not pdbqt:
-            try:
-                self.pdbqt = confgen(self.mol, randomseed=randomseed)
-            except Exception:
-                self.pdbqt = None
+            # The 3D model is generated on the first access to pdbqt (see __getattr__)
+            self._confgen_randomseed = randomseed
         else:
             self.pdbqt = pdbqt
 
         self.cost = cost
         self.idx = idx
 
+    def __setattr__(self, name: str, value: object):
+        # The cached identifiers are only valid for the current molecule
+        if name == 'mol':
+            self.__dict__.pop('_smiles', None)
+            self.__dict__.pop('_key', None)
+            self.__dict__.pop('_reactant_zone', None)
+        elif name == 'pdbqt':
+            self.__dict__.pop('_confgen_randomseed', None)
+        super().__setattr__(name, value)
+
+    def __getattr__(self, name: str):
+        # Only called if the attribute does not exist, i.e. pdbqt was not generated yet
+        if name == 'pdbqt' and '_confgen_randomseed' in self.__dict__:
+            # The receptors of an Individual can be docked from several threads
+            with _confgen_lock:
+                if '_confgen_randomseed' in self.__dict__:
+                    randomseed = self.__dict__['_confgen_randomseed']
+                    try:
+                        pdbqt = confgen(self.mol, randomseed=randomseed)
+                    except Exception:
+                        pdbqt = None
+                    self.pdbqt = pdbqt
+            return self.__dict__['pdbqt']
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
     @property
     def smiles(self):
-        return Chem.MolToSmiles(Chem.RemoveHs(self.mol))
+        # Canonicalization is expensive and smiles is used on every hash and '=='
+        try:
+            return self.__dict__['_smiles']
+        except KeyError:
+            self.__dict__['_smiles'] = Chem.MolToSmiles(Chem.RemoveHs(self.mol))
+            return self.__dict__['_smiles']
+
+    @property
+    def key(self):
+        try:
+            return self.__dict__['_key']
+        except KeyError:
+            self.__dict__['_key'] = _smiles_key(self.smiles)
+            return self.__dict__['_key']
 
     def __repr__(self):
         return f"{self.__class__.__name__}(idx = {self.idx}, smiles = {self.smiles}, cost = {self.cost})"
@@ -769,7 +1460,7 @@ class Individual:
         return hash(self.smiles)
 
     def __eq__(self, other: object) -> bool:
-        if self.__class__ is other.__class__:
+        if self.__class__ is other.__class__ or isinstance(other, IndividualRecord):
             return self.smiles == other.smiles  # self.cost == other.cost and
         else:
             return False  # self.smiles == other
@@ -854,41 +1545,202 @@ class Individual:
         result = cls.__new__(cls)
         memo[id(self)] = result
         for k, v in self.__dict__.items():
-            setattr(result, k, deepcopy(v, memo))
+            # Not setattr, the cached smiles must not be invalidated
+            result.__dict__[k] = deepcopy(v, memo)
         return result
 
 
-def make_sdf(individuals: List[Individual], sdf_name: str = 'out'):
-    """This function create a sdf file from a list of Individuals based on their pdbqt attribute
-    This assume that the cost function update the pdbqt attribute after the docking with the conformations obtained
-    In the case of multiple receptor the attribute should be a list of valid pdbqt strings.
-    Here will export several sdf depending how many pdbqt string are in the pdbqt attribute.
+def _smiles_key(smiles: str) -> int:
+    # 64-bit identifier, stable between processes (hash of str is not)
+    return int.from_bytes(hashlib.blake2b(smiles.encode(), digest_size=8).digest(), 'little')
 
-    Parameters
+
+class IndividualRecord:
+    """Compact and read-only representation of an evaluated :meth:`moldrug.utils.Individual`.
+    It is used by :meth:`moldrug.utils.GA` to store ``SawIndividuals``, which grows during all the simulation.
+    It only keeps the SMILES, idx, cost, the extra attributes set by the cost function (e.g. vina_score, qed, genID,
+    kept_gens) and the pdbqt attribute (the pose) compressed with zlib. The RDKit molecule is not kept;
+    it is built from the SMILES on every access to mol.
+    Hash and '==' are compatible with Individual (based on the SMILES), so both can be mixed in sets.
+
+    Attributes
     ----------
-    individuals : list[Individual]
-        A list of individuals
-    sdf_name : str, optional
-        The name for the output file. Could be a ``path + sdf_name``.
-        The sdf extension will be added by the function, by default 'out'
+    smiles : str
+        The SMILES of the Individual.
+    idx : Union[int, str]
+        The identifier.
+    cost : float
+        The cost.
+    pdbqt : Union[None, str, List[str]] (property)
+        The decompressed pdbqt attribute of the Individual.
+    mol : Chem.rdchem.Mol (property)
+        A new molecule built from the SMILES (without conformers).
+    key : int (property)
+        The same as :meth:`moldrug.utils.Individual.key`.
 
     Example
     -------
     .. ipython:: python
 
-        import tempfile, os
         from moldrug import utils
         from rdkit import Chem
-        # Create some temporal dir
-        tmp_path = tempfile.TemporaryDirectory()
-        # Creating two individuals
-        I1 = utils.Individual(Chem.MolFromSmiles('CCCCl'))
-        I2 = utils.Individual(Chem.MolFromSmiles('CCOCCCF'))
-        # Creating the pdbqt attribute as a list with the pdbqt attribute (this is just a silly example)
-        I1.pdbqt = [I1.pdbqt, I1.pdbqt]
-        I2.pdbqt = [I2.pdbqt, I2.pdbqt]
-        utils.make_sdf([I1, I2], sdf_name = os.path.join(tmp_path.name, 'out'))
-        # Two files were created
+        individual = utils.Individual(Chem.MolFromSmiles('CCO'), cost=-3)
+        individual.vina_score = -3
+        record = utils.IndividualRecord(individual)
+        print(record, record.vina_score, record == individual, individual in set([record]))
+    """
+    __slots__ = ('smiles', 'idx', 'cost', '_pose', '_attrs')
+
+    def __init__(self, individual: Individual) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        individual : Individual
+            The Individual to represent. Mutable extra attributes (e.g. kept_gens) are shared, not copied.
+        """
+        self.smiles = individual.smiles
+        self.idx = individual.idx
+        self.cost = individual.cost
+        self._pose = self._compress(getattr(individual, 'pdbqt', None))
+        self._attrs = {key: value for key, value in individual.__dict__.items()
+                       if key not in ['mol', 'pdbqt', 'idx', 'cost'] and not key.startswith('_')}
+
+    @staticmethod
+    def _compress(pdbqt):
+        if isinstance(pdbqt, str):
+            return zlib.compress(pdbqt.encode())
+        elif isinstance(pdbqt, list):
+            return [IndividualRecord._compress(item) for item in pdbqt]
+        return pdbqt
+
+    @staticmethod
+    def _decompress(pose):
+        if isinstance(pose, bytes):
+            return zlib.decompress(pose).decode()
+        elif isinstance(pose, list):
+            return [IndividualRecord._decompress(item) for item in pose]
+        return pose
+
+    @property
+    def pdbqt(self):
+        return self._decompress(self._pose)
+
+    @property
+    def mol(self):
+        return Chem.MolFromSmiles(self.smiles)
+
+    @property
+    def key(self):
+        return _smiles_key(self.smiles)
+
+    def __getattr__(self, name: str):
+        # Only called for the extra attributes
+        try:
+            return object.__getattribute__(self, '_attrs')[name]
+        except (AttributeError, KeyError):
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def to_dict(self, return_mol: bool = False) -> dict:
+        """The same information as the ``__dict__`` of the original Individual.
+
+        Parameters
+        ----------
+        return_mol : bool, optional
+            If True, mol is included, by default False
+
+        Returns
+        -------
+        dict
+            The attributes.
+        """
+        dictionary = {'mol': self.mol} if return_mol else {}
+        dictionary.update({'pdbqt': self.pdbqt, 'cost': self.cost, 'idx': self.idx})
+        dictionary.update(self._attrs)
+        return dictionary
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(idx = {self.idx}, smiles = {self.smiles}, cost = {self.cost})"
+
+    def __hash__(self):
+        return hash(self.smiles)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (Individual, IndividualRecord)):
+            return self.smiles == other.smiles
+        return False
+
+    def __gt__(self, other: object) -> bool:
+        return self.cost > other.cost
+
+    def __ge__(self, other: object) -> bool:
+        return self.cost >= other.cost
+
+    def __lt__(self, other: object) -> bool:
+        return self.cost < other.cost
+
+    def __le__(self, other: object) -> bool:
+        return self.cost <= other.cost
+
+
+def _sdf_poses(individual: Individual, i: Union[int, None], all_modes: bool) -> tuple:
+    # The pdbqt to export (of the receptor i, None if pdbqt is not a list) and the vina scores of its modes.
+    # The modes are only exported if they were kept on the Individual (docking attribute)
+    pdbqt = individual.pdbqt if i is None else individual.pdbqt[i]
+    docking = getattr(individual, 'docking', None) if all_modes else None
+    if isinstance(docking, list):
+        docking = docking[i or 0]
+    if docking is None:
+        return pdbqt, None
+    return docking.pdbqt, docking.energies
+
+
+def _write_poses(writer: Chem.SDWriter, mol: Chem.rdchem.Mol, energies: Union[None, np.ndarray]):
+    # One record per conformer (mode) if the energies are given, otherwise only the first one
+    if energies is None:
+        writer.write(mol)
+        return
+    for mode, (conf, energy) in enumerate(zip(mol.GetConformers(), energies), start=1):
+        mol.SetProp("mode", str(mode))
+        mol.SetProp("vina_score", str(energy))
+        writer.write(mol, confId=conf.GetId())
+
+
+def make_sdf(individuals: List[Individual], sdf_name: str = 'out', all_modes: bool = False):
+    """This function create a sdf file from a list of Individuals based on their pdbqt attribute
+    This assume that the cost function update the pdbqt attribute after the docking with the conformations obtained
+    In the case of multiple receptor the attribute should be a list of valid pdbqt strings.
+    Here will export several sdf depending how many pdbqt string are in the pdbqt attribute.
+
+    Parameters
+    ----------
+    individuals : list[Individual]
+        A list of individuals
+    sdf_name : str, optional
+        The name for the output file. Could be a ``path + sdf_name``.
+        The sdf extension will be added by the function, by default 'out'
+    all_modes : bool, optional
+        If True, all the docked modes kept on the Individuals (cost functions with ``keep_modes = True``,
+        attribute docking) are exported, one record per mode with the properties mode and vina_score.
+        The Individuals without them export the pdbqt attribute as usual, by default False
+
+    Example
+    -------
+    .. ipython:: python
+
+        import tempfile, os
+        from moldrug import utils
+        from rdkit import Chem
+        # Create some temporal dir
+        tmp_path = tempfile.TemporaryDirectory()
+        # Creating two individuals
+        I1 = utils.Individual(Chem.MolFromSmiles('CCCCl'))
+        I2 = utils.Individual(Chem.MolFromSmiles('CCOCCCF'))
+        # Creating the pdbqt attribute as a list with the pdbqt attribute (this is just a silly example)
+        I1.pdbqt = [I1.pdbqt, I1.pdbqt]
+        I2.pdbqt = [I2.pdbqt, I2.pdbqt]
+        utils.make_sdf([I1, I2], sdf_name = os.path.join(tmp_path.name, 'out'))
+        # Two files were created
         # In the other hand, if the attribute pdbqt is not a list, only one file is going to be created
         # Set pdbqt to the original value
         I1.pdbqt = I1.pdbqt[0]
@@ -920,15 +1772,16 @@ def make_sdf(individuals: List[Individual], sdf_name: str = 'out'):
         for i in range(list(NumbOfpdbqt)[0]):
             with Chem.SDWriter(f"{sdf_name}_{i+1}.sdf") as w:
                 for individual in individuals:
+                    pdbqt, energies = _sdf_poses(individual, i, all_modes)
                     with open(pdbqt_tmp.name, 'w') as f:
-                        f.write(individual.pdbqt[i])
+                        f.write(pdbqt)
                     try:
                         pdbqt_mol = PDBQTMolecule.from_file(pdbqt_tmp.name, skip_typing=True)
                         mol = RDKitMolCreate.from_pdbqt_mol(pdbqt_mol)[0]
                         mol.SetProp("_Name",
                                     f"idx :: {individual.idx}, smiles :: {individual.smiles}, "
                                     f"cost :: {individual.cost}")
-                        w.write(mol)
+                        _write_poses(w, mol, energies)
                     except Exception:
                         # Should be that the pdbqt is not valid
                         print(f"{individual} does not have a valid pdbqt: {individual.pdbqt}.")
@@ -936,18 +1789,16 @@ def make_sdf(individuals: List[Individual], sdf_name: str = 'out'):
     else:
         with Chem.SDWriter(f"{sdf_name}.sdf") as w:
             for individual in individuals:
+                pdbqt, energies = _sdf_poses(individual, None if len(NumbOfpdbqt) == 0 else 0, all_modes)
                 with open(pdbqt_tmp.name, 'w') as f:
-                    if len(NumbOfpdbqt) == 0:
-                        f.write(individual.pdbqt)
-                    else:
-                        f.write(individual.pdbqt[0])
+                    f.write(pdbqt)
                 try:
                     pdbqt_mol = PDBQTMolecule.from_file(pdbqt_tmp.name, skip_typing=True)
                     mol = RDKitMolCreate.from_pdbqt_mol(pdbqt_mol)[0]
                     mol.SetProp("_Name",
                                 f"idx :: {individual.idx}, smiles :: {individual.smiles}, "
                                 f"cost :: {individual.cost}")
-                    w.write(mol)
+                    _write_poses(w, mol, energies)
                 except Exception:
                     # Should be that the pdbqt is not valid
                     print(f"{individual} does not have a valid pdbqt: {individual.pdbqt}.")
@@ -988,6 +1839,503 @@ def tar_errors(error_path: str = 'error'):
             print(f"{50*'=+'}\n")
         shutil.rmtree(error_path)
 
+
+# State of the processes of WorkerPool. It is set only once per process
+# (when the worker starts) by _init_worker.
+_worker_state = dict()
+
+
+def _init_worker(costfunc: Callable, costfunc_kwargs: Dict):
+    """Initializer of the processes of :meth:`moldrug.utils.WorkerPool`.
+    It stores the cost function and its keyword arguments in the worker,
+    in this way they are only transferred once.
+
+    Parameters
+    ----------
+    costfunc : Callable
+        The cost function.
+    costfunc_kwargs : Dict
+        The keyword arguments of costfunc.
+    """
+    _worker_state['costfunc'] = costfunc
+    _worker_state['costfunc_kwargs'] = costfunc_kwargs
+
+
+def _worker_costfunc(individual, costfunc_kwargs=None):
+    # The only thing that the worker receives on every task is the Individual
+    # (and optionally a few keyword arguments that change between tasks)
+    kwargs = _worker_state['costfunc_kwargs']
+    if costfunc_kwargs:
+        kwargs = {**kwargs, **costfunc_kwargs}
+    return _worker_state['costfunc'](individual, **kwargs)
+
+
+def _worker_indexed(task):
+    # The position of the item travels with the result, so it can be recovered in any order
+    i, item, function = task
+    return i, (_worker_costfunc if function is None else function)(item)
+
+
+class CremCache:
+    """Least Recently Used (LRU) cache of the molecules generated by CReM
+    (:meth:`crem.crem.mutate_mol` and :meth:`crem.crem.grow_mol`).
+    In a GA the population converges and the same parents are mutated many times; with this cache
+    the fragment database is only queried the first time. The entries are identified by the molecule
+    (canonical SMILES, or the SMILES with the same atom order if ``replace_ids`` or ``protected_ids`` are used),
+    the CReM function, the database and all the keyword arguments (but ``ncores``).
+    The entries are kept in memory and, if ``path`` is given, also in a SQLite database,
+    so they can be reused by other processes and runs.
+    Calls that are not deterministic (``max_replacements`` without ``seed``, ``sample_func``, ``filter_func``)
+    are not cached.
+
+    Attributes
+    ----------
+    path : Union[None, str]
+        The SQLite database.
+    max_size : float
+        Maximum size (in MB) of the stored data, in memory and in path.
+    hits : int
+        Number of calls resolved by the cache.
+    misses : int
+        Number of calls resolved by CReM.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        cache = utils.CremCache(max_size=64)
+        # Use it as crem.crem.mutate_mol: cache.mutate_mol(mol, crem_db_path, radius=3)
+        print(len(cache), cache.hits, cache.misses)
+    """
+    def __init__(self, path: str = None, max_size: float = 256) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        path : str, optional
+            SQLite database to make the cache persistent, by default None (only in memory)
+        max_size : float, optional
+            Maximum size (in MB) of the stored data, by default 256
+        """
+        self.path = os.path.abspath(path) if path else None
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # Connections can not be shared between processes, therefore it is created on the first use
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=120)
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS crem (key TEXT PRIMARY KEY, data BLOB, size INTEGER, last_access REAL)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS crem_last_access ON crem (last_access)")
+        return self._connection
+
+    @staticmethod
+    def key(function: str, mol: Chem.rdchem.Mol, db_name: str, **kwargs) -> Union[None, str]:
+        """Build the key of an entry.
+
+        Parameters
+        ----------
+        function : str
+            mutate_mol or grow_mol.
+        mol : Chem.rdchem.Mol
+            The molecule.
+        db_name : str
+            The CReM database.
+        **kwargs
+            The keyword arguments of the CReM function.
+
+        Returns
+        -------
+        Union[None, str]
+            A SHA-256 hex digest or None if the call can not be cached.
+        """
+        kwargs = {key: value for key, value in kwargs.items() if key != 'ncores'}
+        if kwargs.get('sample_func') or kwargs.get('filter_func') or \
+                (kwargs.get('max_replacements') is not None and kwargs.get('seed') is None):
+            return None
+        # The indexes are related to the order of the atoms
+        keep_order = bool(kwargs.get('replace_ids') or kwargs.get('protected_ids'))
+        stat = os.stat(db_name)
+        parameters = {
+            'function': function,
+            'smiles': Chem.MolToSmiles(mol, canonical=not keep_order),
+            'db': [os.path.abspath(db_name), stat.st_size, stat.st_mtime],
+            'kwargs': kwargs,
+        }
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> Union[None, list]:
+        """Retrieve an entry.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+
+        Returns
+        -------
+        Union[None, list]
+            None if the entry does not exist; otherwise the output of CReM.
+        """
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        elif self.path:
+            with self.connection as con:
+                row = con.execute("SELECT data FROM crem WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                con.execute("UPDATE crem SET last_access = ? WHERE key = ?", (time.time(), key))
+            data = row[0]
+            self._put_memory(key, data)
+        else:
+            return None
+        return _loads(zlib.decompress(data))
+
+    def put(self, key: str, output: list):
+        """Store an entry and remove the least recently used ones if max_size is exceeded.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry.
+        output : list
+            The output of CReM.
+        """
+        data = zlib.compress(_dumps(output))
+        self._put_memory(key, data)
+        if self.path:
+            with self.connection as con:
+                con.execute("INSERT OR REPLACE INTO crem VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+                excess = con.execute("SELECT TOTAL(size) FROM crem").fetchone()[0] - self.max_size * 1024**2
+                if excess > 0:
+                    to_delete = []
+                    for old_key, size in con.execute("SELECT key, size FROM crem ORDER BY last_access"):
+                        to_delete.append((old_key,))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    con.executemany("DELETE FROM crem WHERE key = ?", to_delete)
+
+    def _put_memory(self, key: str, data: bytes):
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.max_size * 1024**2 and len(self._memory) > 1:
+            self._memory_size -= len(self._memory.popitem(last=False)[1])
+
+    def _call(self, function: Callable, mol: Chem.rdchem.Mol, db_name: str, **kwargs) -> list:
+        key = self.key(function.__name__, mol, db_name, **kwargs)
+        if key is not None:
+            output = self.get(key)
+            if output is not None:
+                self.hits += 1
+                return output
+        self.misses += 1
+        output = list(function(mol, db_name, **kwargs))
+        if key is not None:
+            self.put(key, output)
+        return output
+
+    def mutate_mol(self, mol: Chem.rdchem.Mol, db_name: str, **kwargs) -> list:
+        """The same as :meth:`crem.crem.mutate_mol` but the output is a list.
+        """
+        return self._call(mutate_mol, mol, db_name, **kwargs)
+
+    def grow_mol(self, mol: Chem.rdchem.Mol, db_name: str, **kwargs) -> list:
+        """The same as :meth:`crem.crem.grow_mol` but the output is a list.
+        """
+        return self._call(grow_mol, mol, db_name, **kwargs)
+
+    def __len__(self):
+        if self.path:
+            return self.connection.execute("SELECT COUNT(*) FROM crem").fetchone()[0]
+        return len(self._memory)
+
+    def __getstate__(self):
+        # The connection is not picklable and the memory is only meaningful for the current process
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_memory'] = collections.OrderedDict()
+        state['_memory_size'] = 0
+        return state
+
+
+# CremCache used by the process, one per crem_cache argument
+_crem_caches = dict()
+
+
+def _get_crem_cache(crem_cache: Union[bool, str]) -> Union[None, CremCache]:
+    if not crem_cache:
+        return None
+    path = crem_cache if isinstance(crem_cache, str) else None
+    if path not in _crem_caches:
+        _crem_caches[path] = CremCache(path)
+    return _crem_caches[path]
+
+
+def _reactant_zone(individual: Individual, init_mol: Chem.rdchem.Mol, replace_ids: List[int] = None,
+                   protected_ids: List[int] = None, mcs_timeout: int = None) -> tuple:
+    """:meth:`moldrug.utils.update_reactant_zone` of individual respect to init_mol.
+    The result is cached on the Individual (roulette wheel selection picks the same parents many times),
+    it is recomputed only if the arguments or the molecule change.
+    """
+    key = (Chem.MolToSmiles(init_mol), replace_ids, protected_ids, mcs_timeout)
+    cached = individual.__dict__.get('_reactant_zone')
+    if cached is None or cached[0] != key:
+        cached = (key, update_reactant_zone(init_mol, individual.mol, parent_replace_ids=replace_ids,
+                                            parent_protected_ids=protected_ids, timeout=mcs_timeout))
+        individual._reactant_zone = cached
+    return cached[1]
+
+
+def _mutate(individual: Individual, crem_db_path: str, mutate_crem_kwargs: Dict, init_mol: Chem.rdchem.Mol,
+            get_similar: bool = False, AddHs: bool = False, randomseed: Union[None, int] = None,
+            crem_cache: Union[bool, str] = False, mcs_timeout: int = None,
+            precompute_reactant_zone: bool = False) -> Individual:
+    """Mutation operator of :meth:`moldrug.utils.GA` (see :meth:`moldrug.utils.GA.mutate`).
+    It is a function in order to be used in the processes of :meth:`moldrug.utils.WorkerPool`.
+    If precompute_reactant_zone is True, the reactant zone of the offspring is also calculated
+    (in this way it is done in the worker and not when the offspring is selected as parent).
+    """
+    # Here is were I have to check if replace_ids or protected_ids where provided.
+    mutate_crem_kwargs_to_work_with = mutate_crem_kwargs.copy()
+    use_reactant_zone = 'replace_ids' in mutate_crem_kwargs or 'protected_ids' in mutate_crem_kwargs
+    if use_reactant_zone:
+        replace_ids, protected_ids = _reactant_zone(
+            individual, init_mol, replace_ids=mutate_crem_kwargs.get('replace_ids'),
+            protected_ids=mutate_crem_kwargs.get('protected_ids'), mcs_timeout=mcs_timeout)
+        if 'replace_ids' in mutate_crem_kwargs:
+            mutate_crem_kwargs_to_work_with['replace_ids'] = replace_ids
+        if 'protected_ids' in mutate_crem_kwargs:
+            mutate_crem_kwargs_to_work_with['protected_ids'] = protected_ids
+
+    try:
+        cache = _get_crem_cache(crem_cache)
+        if cache is None:
+            mutants = list(mutate_mol(individual.mol, crem_db_path, **mutate_crem_kwargs_to_work_with))
+        else:
+            mutants = cache.mutate_mol(individual.mol, crem_db_path, **mutate_crem_kwargs_to_work_with)
+        # Bias the searching to similar molecules
+        if get_similar:
+            mol = get_similar_mols(mols=[mol for _, mol in mutants],
+                                   ref_mol=init_mol, pick=1, beta=0.01)[0]
+        else:
+            _, mol = random.choice(mutants)  # nosec
+    except Exception:
+        print(f'Note: The mutation on {individual} did not work, it will be returned the same individual')
+        mol = individual.mol
+    if AddHs:
+        mol = Chem.AddHs(mol)
+    offspring = Individual(mol, randomseed=randomseed)
+    if use_reactant_zone and precompute_reactant_zone:
+        _reactant_zone(offspring, init_mol, replace_ids=mutate_crem_kwargs.get('replace_ids'),
+                       protected_ids=mutate_crem_kwargs.get('protected_ids'), mcs_timeout=mcs_timeout)
+    return offspring
+
+
+def _confgen_individuals(individuals: List[Individual], njobs: int = 1):
+    # Generate at once (confgen_many) the pdbqt of the Individuals that do not have it yet
+    pending = [individual for individual in individuals if '_confgen_randomseed' in individual.__dict__]
+    pdbqts = confgen_many([individual.mol for individual in pending], njobs=njobs,
+                          randomseed=[individual._confgen_randomseed for individual in pending])
+    for individual, pdbqt in zip(pending, pdbqts):
+        individual.pdbqt = pdbqt
+
+
+def _worker_mutate(task):
+    # The mutation uses the random module, it is seeded on every task to get reproducible results
+    individual, seed, settings, embed = task
+    random.seed(seed)
+    offspring = _mutate(individual, precompute_reactant_zone=True, **settings)
+    if embed:
+        # The 3D model is also generated in the worker
+        offspring.pdbqt
+    return offspring
+
+
+class WorkerPool:
+    """A long-lived pool of processes to evaluate the cost function.
+    The cost function and its keyword arguments are sent only once to every worker
+    (during its initialization), after that, only the Individuals are transferred.
+    :meth:`moldrug.utils.GA` and :meth:`moldrug.utils.Local` create one of them
+    on every call, but it is also possible to create it outside and pass it to the call.
+    In this case the user is responsible for closing it.
+
+    Attributes
+    ----------
+    costfunc : Callable
+        The cost function.
+    costfunc_kwargs : dict
+        The keyword arguments of the cost function used by the workers,
+        ``wd`` is changed to a temporal directory if costfunc accepts it.
+    njobs : int
+        Number of processes.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        from rdkit import Chem
+
+        def costfunc(Individual):
+            Individual.cost = Individual.mol.GetNumAtoms()
+            return Individual
+
+        individuals = [utils.Individual(Chem.MolFromSmiles(smi)) for smi in ['CC', 'CCO']]
+        with utils.WorkerPool(costfunc, njobs=2) as pool:
+            print(list(pool.imap(individuals)))
+    """
+    def __init__(self, costfunc: Callable, costfunc_kwargs: Dict = None, njobs: int = 1) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        costfunc : Callable
+            The cost function to work with (any from :mod:`moldrug.fitness` or a valid user defined).
+        costfunc_kwargs : Dict, optional
+            The keyword arguments of the selected cost function, by default None
+        njobs : int, optional
+            The number of processes, by default 1
+        """
+        if costfunc_kwargs is None:
+            costfunc_kwargs = dict()
+        self.costfunc = costfunc
+        self.njobs = njobs
+        self.costfunc_kwargs, self._costfunc_jobs_tmp_dir = _make_kwargs_copy(costfunc, costfunc_kwargs)
+        self._pool = mp.Pool(njobs, initializer=_init_worker, initargs=(costfunc, self.costfunc_kwargs))
+
+    def imap(self, individuals: Iterable[Individual], function: Callable = None):
+        """Evaluate the cost function on individuals.
+
+        Parameters
+        ----------
+        individuals : Iterable[Individual]
+            The Individuals to evaluate.
+        function : Callable, optional
+            A function (that can be pickled) to run in the workers instead of the cost function, by default None
+
+        Returns
+        -------
+        Iterator
+            The evaluated Individuals in the same order of individuals.
+        """
+        return self._pool.imap(_worker_costfunc if function is None else function, individuals)
+
+    def imap_unordered(self, individuals: Iterable[Individual], function: Callable = None):
+        """Evaluate the cost function on individuals. The results are returned as soon as they
+        are ready, a slow Individual does not delay the following ones.
+
+        Parameters
+        ----------
+        individuals : Iterable[Individual]
+            The Individuals to evaluate.
+        function : Callable, optional
+            A function (that can be pickled) to run in the workers instead of the cost function, by default None
+
+        Returns
+        -------
+        Iterator
+            Tuples (position in individuals, evaluated Individual) in order of completion.
+
+        Example
+        -------
+        .. ipython:: python
+
+            from moldrug import utils
+            from rdkit import Chem
+
+            def costfunc(Individual):
+                Individual.cost = Individual.mol.GetNumAtoms()
+                return Individual
+
+            individuals = [utils.Individual(Chem.MolFromSmiles(smi)) for smi in ['CC', 'CCO']]
+            with utils.WorkerPool(costfunc, njobs=2) as pool:
+                print(sorted(pool.imap_unordered(individuals)))
+        """
+        return self._pool.imap_unordered(
+            _worker_indexed, ((i, individual, function) for i, individual in enumerate(individuals)))
+
+    def map(self, function: Callable, iterable: Iterable) -> List:
+        """Run any other function in the workers.
+
+        Parameters
+        ----------
+        function : Callable
+            A function that can be pickled (e.g. defined at module level).
+        iterable : Iterable
+            The arguments, function is called with each of them.
+
+        Returns
+        -------
+        List
+            The results in the same order of iterable.
+        """
+        return self._pool.map(function, iterable)
+
+    def apply_async(self, individual: Individual, callback: Callable = None, error_callback: Callable = None,
+                    costfunc_kwargs: Dict = None, function: Callable = None):
+        """Evaluate the cost function on one Individual without waiting for the result.
+
+        Parameters
+        ----------
+        individual : Individual
+            The Individual to evaluate.
+        callback : Callable, optional
+            Called (in a thread of the main process) with the evaluated Individual, by default None
+        error_callback : Callable, optional
+            Called with the exception if the evaluation fails, by default None
+        costfunc_kwargs : Dict, optional
+            Keyword arguments of the cost function only for this evaluation,
+            they update the ones of the pool, by default None
+        function : Callable, optional
+            A function (that can be pickled) to run in the worker instead of the cost function,
+            costfunc_kwargs is not used, by default None
+
+        Returns
+        -------
+        multiprocessing.pool.AsyncResult
+            The result of the evaluation.
+        """
+        if function is not None:
+            return self._pool.apply_async(function, (individual,), callback=callback, error_callback=error_callback)
+        return self._pool.apply_async(_worker_costfunc, (individual, costfunc_kwargs),
+                                      callback=callback, error_callback=error_callback)
+
+    def clean(self):
+        """Remove the files generated by the cost function in its working directory.
+        """
+        wd = self._costfunc_jobs_tmp_dir.name
+        for name in os.listdir(wd):
+            path = os.path.join(wd, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def close(self):
+        """Wait for the workers to finish and delete the temporal working directory.
+        """
+        self._pool.close()
+        self._pool.join()
+        self._costfunc_jobs_tmp_dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 ######################
 # Selection functions
 ######################
@@ -1012,13 +2360,76 @@ def roulette_wheel_selection(p: List[float]):
     return ind[0][0]
 
 
+def select_parents(costs: Iterable[float], n: int, method: str = 'roulette', beta: float = 0.001,
+                   rng: np.random.Generator = None, tournament_size: int = 2) -> np.ndarray:
+    """Select n parents from a population at once (the cost is minimized).
+
+    Parameters
+    ----------
+    costs : Iterable[float]
+        The costs of the population.
+    n : int
+        Number of parents to select (with replacement).
+    method : str, optional
+        The selection operator, by default 'roulette'.
+
+        * roulette: roulette wheel selection with probabilities ``softmax(-beta * costs)``.
+        * rank: roulette wheel selection with probabilities proportional to the rank
+          (the best has weight ``len(costs)`` and the worst 1). It does not depend on the scale of the cost.
+        * tournament: the best of ``tournament_size`` random members.
+    beta : float, optional
+        Selection pressure of roulette, by default 0.001
+    rng : np.random.Generator, optional
+        The random generator, by default None (a new one without seed)
+    tournament_size : int, optional
+        Number of members of each tournament, by default 2
+
+    Returns
+    -------
+    np.ndarray
+        The indexes of the selected parents.
+
+    Raises
+    ------
+    ValueError
+        In case of a non valid method.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        import numpy as np
+        rng = np.random.default_rng(123)
+        print(utils.select_parents([-1, -10, -5], 5, method='tournament', rng=rng))
+    """
+    costs = np.asarray(costs, dtype='float64')
+    if rng is None:
+        rng = np.random.default_rng()
+    if method == 'tournament':
+        contestants = rng.integers(len(costs), size=(n, tournament_size))
+        return contestants[np.arange(n), np.argmin(costs[contestants], axis=1)]
+    elif method == 'roulette':
+        weights = softmax(-beta * costs)
+        if np.isnan(weights).any():
+            weights = np.nan_to_num(weights)
+    elif method == 'rank':
+        weights = np.empty(len(costs))
+        weights[np.argsort(costs, kind='stable')] = np.arange(len(costs), 0, -1)
+    else:
+        raise ValueError(f"method must be roulette, rank or tournament. {method} was provided")
+    # The same as roulette_wheel_selection for all the parents with only one cumsum
+    cumsum = np.cumsum(weights)
+    return np.searchsorted(cumsum, cumsum[-1] * rng.random(n))
+
+
 def to_dataframe(individuals: List[Individual], return_mol: bool = False) -> pd.DataFrame:
     """Convert a list of individuals to a DataFrame
 
     Parameters
     ----------
     individuals : List[Individual]
-        The list of individuals
+        The list of individuals (:meth:`moldrug.utils.IndividualRecord` are also accepted)
     return_mol : bool, optional
         If True the attribute mol will bot be return, by default False
 
@@ -1029,7 +2440,11 @@ def to_dataframe(individuals: List[Individual], return_mol: bool = False) -> pd.
     """
     list_of_dictionaries = []
     for individual in individuals:
-        dictionary = individual.__dict__.copy()
+        if isinstance(individual, IndividualRecord):
+            list_of_dictionaries.append(individual.to_dict(return_mol=return_mol))
+            continue
+        # Private attributes (e.g. cached values) are not exported
+        dictionary = {key: value for key, value in individual.__dict__.items() if not key.startswith('_')}
         if not return_mol:
             del dictionary['mol']
         list_of_dictionaries.append(dictionary)
@@ -1126,7 +2541,7 @@ class Local:
         self.costfunc_kwargs = costfunc_kwargs
         self.pop = [self.InitIndividual]
 
-    def __call__(self, njobs: int = 1, pick: int = None):
+    def __call__(self, njobs: int = 1, pick: int = None, pool: WorkerPool = None, callback: Callable = None):
         """Call deffinition
 
         Parameters
@@ -1136,6 +2551,12 @@ class Local:
         pick : int, optional
             How many molecules take from the generated throgh the grow_mol CReM operation,
             by default None which means all generated.
+        pool : WorkerPool, optional
+            A pool created for ``self.costfunc`` to evaluate the cost function. If it is provided,
+            njobs is ignored and the pool will not be closed at the end, by default None
+        callback : Callable, optional
+            A function called (in this process) with every evaluated Individual as soon as its cost is ready.
+            The Individuals arrive in order of completion, by default None
         """
         # Check version of moldrug
         if self.__moldrug_version != __version__:
@@ -1149,39 +2570,39 @@ class Local:
             new_mols = [item[1] for item in new_mols]
 
         idx0 = len(self.pop)
-        for i, mol in enumerate(new_mols):
-            individual = Individual(mol, idx=idx0 + i, randomseed=self.randomseed)
-            if individual.pdbqt:
-                self.pop.append(individual)
+        individuals = [Individual(mol, idx=idx0 + i, randomseed=self.randomseed) for i, mol in enumerate(new_mols)]
+        # The 3D models are generated in batch. Constraint docking does not use them
+        if not self.costfunc_kwargs.get('constraint', False):
+            _confgen_individuals(individuals, njobs=njobs if pool is None else pool.njobs)
+            individuals = [individual for individual in individuals if individual.pdbqt]
+        self.pop.extend(individuals)
 
         # Calculating cost of each individual
-        # Creating the arguments
-        args_list = []
-        # Make a copy of the self.costfunc_kwargs
-        kwargs_copy, costfunc_jobs_tmp_dir = _make_kwargs_copy(self.costfunc, self.costfunc_kwargs)
-
-        for individual in self.pop:
-            args_list.append((individual, kwargs_copy))
-
+        own_pool = pool is None
+        if own_pool:
+            pool = WorkerPool(self.costfunc, self.costfunc_kwargs, njobs)
         print('Calculating cost function...')
-        pool = mp.Pool(njobs)
-        self.pop = [individual for individual in tqdm.tqdm(pool.imap(self.__costfunc__, args_list), total=len(args_list))]
-        pool.close()
-
-        # Clean directory
-        costfunc_jobs_tmp_dir.cleanup()
+        try:
+            # The results are collected in order of completion and placed back in their position
+            evaluated = [None] * len(self.pop)
+            for i, individual in tqdm.tqdm(pool.imap_unordered(self.pop), total=len(self.pop)):
+                evaluated[i] = individual
+                if callback is not None:
+                    callback(individual)
+            self.pop = evaluated
+        finally:
+            # Clean directory
+            if own_pool:
+                pool.close()
+            else:
+                pool.clean()
         # Tar errors
         tar_errors('error')
 
         # Printing how long was the simulation
         print(f"Finished at {datetime.datetime.now().strftime('%c')}.\n")
 
-    def __costfunc__(self, args_list):
-        Individual, kwargs = args_list
-        # This is just to use the progress bar on pool.imap
-        return self.costfunc(Individual, **kwargs)
-
-    def pickle(self, title: str, compress: bool = False):
+    def pickle(self, title: str, compress: bool = False, codec: str = None):
         """Method to pickle the whole Local class
 
         Parameters
@@ -1192,12 +2613,14 @@ class Local:
         compress : bool, optional
             Use compression, by default False. If True :meth:`moldrug.utils.compressed_pickle` will be used;
             if not :meth:`moldrug.utils.full_pickle` will be used instead.
+        codec : str, optional
+            The codec used if compress is True (see :meth:`moldrug.utils.compressed_pickle`), by default None (bz2)
         """
         cls = self.__class__
         result = cls.__new__(cls)
         result.__dict__.update(self.__dict__)
         if compress:
-            compressed_pickle(title, result)
+            compressed_pickle(title, result, codec=codec)
         else:
             full_pickle(title, result)
 
@@ -1257,8 +2680,12 @@ class GA:
     NumGens : int
         he number of generations performed by the class. Subsequent ``__call__``
         executions update this number acordennly.
-    SawIndividuals : set[:meth:`moldrug.utils.Individuals`]
-        All the Individulas saw during the optimizations.
+    SawIndividuals : set[:meth:`moldrug.utils.IndividualRecord`]
+        All the Individulas saw during the optimizations. They are stored as
+        :meth:`moldrug.utils.IndividualRecord` to save memory.
+    ExternalSawSmiles : set[str]
+        SMILES of molecules already evaluated somewhere else (e.g. by other islands of
+        :meth:`moldrug.utils.IslandGA`). They are not generated again.
     acceptance : dict
         A dictionary with key the Generation id and as value another dictionary
         with keys ``accepeted`` and ``generated`` with the number of accepted and genereated
@@ -1275,6 +2702,20 @@ class GA:
         The list of best cost for each generations.
     avg_cost : list[float]
         The list of average cost for each generations.
+    mode : str
+        generational or steady_state.
+    parallel_mutation : bool
+        Create the offspring in the pool of processes.
+    crem_cache : Union[bool, str]
+        Cache the output of CReM, in memory or (if it is a path) also on disk.
+    mcs_timeout : int
+        Maximum time (in seconds) of the MCS search to update the reactant zone.
+    selection : str
+        The selection operator: roulette, rank or tournament.
+    tournament_size : int
+        Number of members of each tournament.
+    early_exit : bool
+        Pass the cost of the worst member of the population as cost_threshold to the cost function.
 
     TODO:
 
@@ -1289,7 +2730,10 @@ class GA:
                  costfunc: Callable, costfunc_kwargs: Dict, crem_db_path: str, maxiter: int = 10, popsize: int = 20,
                  beta: float = 0.001, pc: float = 1, get_similar: bool = False, mutate_crem_kwargs: Union[None, Dict] = None,
                  save_pop_every_gen: int = 0, checkpoint: bool = False, deffnm: str = 'ga',
-                 AddHs: bool = False, randomseed: Union[None, int] = None) -> None:
+                 AddHs: bool = False, randomseed: Union[None, int] = None, mode: str = 'generational',
+                 parallel_mutation: bool = False, crem_cache: Union[bool, str] = False,
+                 mcs_timeout: int = None, selection: str = 'roulette', tournament_size: int = 2,
+                 early_exit: bool = False) -> None:
         """Constructor
 
         Parameters
@@ -1319,7 +2763,8 @@ class GA:
         save_pop_every_gen : int, optional
             Frequency to save the population, by default 0
         checkpoint : bool, optional
-            If True the whole class will be saved as cpt with the frequency of save_pop_every_gen.
+            If True the simulation is saved in the append-only log cpt.runlog (see :meth:`moldrug.utils.RunLog`)
+            with the frequency of save_pop_every_gen. Only what changed since the last save is written.
             This means that if save_pop_every_gen = 0 and checkpoint = True, no checkpoint will be
             output, by default False
         deffnm : str, optional
@@ -1328,6 +2773,44 @@ class GA:
            If True the explicit hydrogens will be added, by default False
         randomseed : Union[None, int], optional
            Set a random seed for reproducibility, by default None
+        mode : str, optional
+            How the population evolves, by default 'generational'.
+
+            * generational: on every generation ``nc`` offspring are created, evaluated all together and then
+              merged with the population. Each generation waits for its slowest evaluation.
+            * steady_state: a new offspring is submitted as soon as a worker is free, and every evaluated
+              offspring replaces the worst member of the population if it is better. The workers are always busy.
+              The same number of offspring are created and every ``nc`` of them are considered a generation
+              (for ``genID``, ``kept_gens``, ``acceptance``, ``best_cost``, ``avg_cost`` and the saving of the
+              population). The results are not reproducible with ``randomseed`` because they depend on the
+              order in which the evaluations finish.
+        parallel_mutation : bool, optional
+            If True, the offspring of each generation (CReM mutation and conformer generation) are created in the
+            processes used to evaluate the cost function instead of in serial in the main process; the main process
+            only filters the repeated ones, by default False. The mutations share the pool with the evaluations
+            (at most ``2 * njobs`` tasks at a time) and give the same offspring as the serial ones.
+            It is only used with ``mode = 'generational'``.
+            The results are reproducible with ``randomseed`` but different from the ones with
+            ``parallel_mutation = False``.
+        crem_cache : Union[bool, str], optional
+            Cache the output of CReM (see :meth:`moldrug.utils.CremCache`), by default False.
+            If True, every process keeps its own cache in memory. If it is a path, the cache is also
+            stored in this SQLite file and shared between processes and runs.
+        mcs_timeout : int, optional
+            Maximum time (in seconds) of the MCS search of :meth:`moldrug.utils.update_reactant_zone`, only used
+            if ``replace_ids`` or ``protected_ids`` are in mutate_crem_kwargs, by default None (the default of RDKit).
+            The reactant zone of each Individual is calculated only once.
+        selection : str, optional
+            The selection operator: roulette, rank or tournament (see :meth:`moldrug.utils.select_parents`),
+            by default 'roulette'. beta is only used by roulette.
+        tournament_size : int, optional
+            Number of members of each tournament of selection = 'tournament', by default 2
+        early_exit : bool, optional
+            If True, the cost of the worst member of the population is passed as ``cost_threshold`` to the
+            cost function together with every offspring. The cost function can stop the evaluation of
+            an offspring as soon as it knows that its cost will not be lower (it can not enter the population),
+            see :meth:`moldrug.fitness.CostMultiReceptors`. costfunc must accept ``cost_threshold``, by default False
+
         Raises
         ------
         TypeError
@@ -1336,10 +2819,18 @@ class GA:
             In case of incorrect definition of mutate_crem_kwargs. It must be None or a dict instance.
         ValueError
             In case of crem_db_path deos not exist.
+        ValueError
+            In case of a non valid mode.
+        ValueError
+            In case of a non valid selection.
+        ValueError
+            If early_exit is True but costfunc does not accept cost_threshold.
         """
         self.randomseed = randomseed
         if self.randomseed is not None:
             random.seed(randomseed)
+        # Used for the selection
+        self._rng = np.random.default_rng(randomseed)
 
         self.__moldrug_version__ = __version__
         if mutate_crem_kwargs is None:
@@ -1353,6 +2844,20 @@ class GA:
         else:
             raise FileNotFoundError(f"{crem_db_path = } does not exists or is not accesible")
 
+        if mode not in ['generational', 'steady_state']:
+            raise ValueError(f"mode must be generational or steady_state. {mode} was provided")
+        self.mode = mode
+        self.parallel_mutation = parallel_mutation
+        self.crem_cache = crem_cache
+        self.mcs_timeout = mcs_timeout
+        if selection not in ['roulette', 'rank', 'tournament']:
+            raise ValueError(f"selection must be roulette, rank or tournament. {selection} was provided")
+        self.selection = selection
+        self.tournament_size = tournament_size
+        if early_exit and 'cost_threshold' not in signature(costfunc).parameters:
+            raise ValueError("early_exit = True needs a costfunc with the keyword argument cost_threshold")
+        self.early_exit = early_exit
+
         self.maxiter = maxiter
         self.popsize = popsize
         self.beta = beta
@@ -1386,6 +2891,7 @@ class GA:
         self.NumCalls = 0
         self.NumGens = 0
         self.SawIndividuals = set()
+        self.ExternalSawSmiles = set()
         self.acceptance = dict()
 
         # work with the seed molecule or population
@@ -1408,13 +2914,21 @@ class GA:
         self.InitIndividual = Individual(self._seed_mol[0], idx=0, randomseed=self.randomseed)
         self.pop = []
 
-    def __call__(self, njobs: int = 1):
+    def __call__(self, njobs: int = 1, pool: WorkerPool = None, callback: Callable = None):
         """Call definition
 
         Parameters
         ----------
         njobs : int, optional
             The number of jobs for parallelization, the module multiprocessing will be used, by default 1,
+        pool : WorkerPool, optional
+            A pool created for ``self.costfunc`` to evaluate the cost function. If it is provided,
+            njobs is ignored and the pool will not be closed at the end, by default None.
+            If None, a new pool is created and used for all the generations of the call.
+        callback : Callable, optional
+            A function called (in this process) with every evaluated Individual as soon as its cost is ready,
+            e.g. to log, cache or write it to disk before the end of the generation.
+            The Individuals arrive in order of completion, by default None
 
         Raises
         ------
@@ -1435,229 +2949,167 @@ class GA:
         # We need to return the molecule, so we override the possible user definition respect to this keyword
         self.mutate_crem_kwargs['return_mol'] = True
 
-        # Initialize Population
-        # In case that the populating exist there is not need to initialize.
-        if len(self.pop) == 0:
-            GenInitStructs = []
-            # in case that the input has the popsize memebers there is not need to generate new structures
-            if len(self._seed_mol) < self.popsize:
-                for mol in self._seed_mol:
-                    tmp_GenInitStructs = list(mutate_mol(mol, self.crem_db_path, **self.mutate_crem_kwargs))
-                    tmp_GenInitStructs = [mol for (_, mol) in tmp_GenInitStructs]
-                    GenInitStructs += tmp_GenInitStructs
-                # Checking for possible scenarios
-                if len(GenInitStructs) == 0:
-                    raise RuntimeError("Something really strange happened. The seed_mol did not "
-                                       "generate any new molecule during the initialization of the population. "
-                                       "Check the provided crem parameters!")
-                if len(GenInitStructs) < (self.popsize - len(self._seed_mol)):
-                    print('The initial population has repeated elements')
-                    # temporal solution
-                    GenInitStructs += random.choices(GenInitStructs,
-                                                     k=self.popsize - len(GenInitStructs) - len(self._seed_mol))
-                elif len(GenInitStructs) > (self.popsize - 1):
-                    # Selected random sample from the generation
-                    GenInitStructs = random.sample(GenInitStructs, k=self.popsize - len(self._seed_mol))
-                else:
-                    # Everything is ok!
-                    pass
-
-            # Adding the inputs to the initial population
-            for i, mol in enumerate(self._seed_mol):
-                individual = Individual(mol, idx=i, randomseed=self.randomseed)
-                if individual.pdbqt:
-                    self.pop.append(individual)
-
-            # Completing the population with the generated structures
-            for i, mol in enumerate(GenInitStructs):
-                if self.AddHs:
-                    individual = Individual(Chem.AddHs(mol), idx=i + len(self._seed_mol), randomseed=self.randomseed)
-                else:
-                    individual = Individual(mol, idx=i + len(self._seed_mol), randomseed=self.randomseed)
-                if individual.pdbqt:
-                    self.pop.append(individual)
-
-            # Make sure that the population do not have more than popsize members and it is without repeated elements.
-            # That could happens if seed_mol has more molecules than popsize
-            self.pop = sorted(set(self.pop), key=lambda x: x.idx)[:self.popsize]
-
-            # Calculating cost of each individual
-            # Creating the arguments
-            args_list = []
-            # Make a copy of the self.costfunc_kwargs
-            # Make a copy of the self.costfunc_kwargs
-            kwargs_copy, costfunc_jobs_tmp_dir = _make_kwargs_copy(self.costfunc, self.costfunc_kwargs)
-
-            for individual in self.pop:
-                args_list.append((individual, kwargs_copy))
-
-            print(f'\n\nCreating the first population with {len(self.pop)} members:')
-            try:
-                pool = mp.Pool(njobs)
-                self.pop = [individual for individual in tqdm.tqdm(pool.imap(self.__costfunc__, args_list), total=len(args_list))]
-                pool.close()
-            except Exception as e1:
-                warn("Parallelization did not work. Trying with serial...")
-                try:
-                    self.pop = [self.__costfunc__(args) for args in tqdm.tqdm(args_list, total=len(args_list))]
-                except Exception as e2:
-                    raise RuntimeError("Serial did not work either. Here are the ucurred exceptions:\n"
-                                       f"=========Parellel=========:\n {e1}\n"
-                                       f"==========Serial==========:\n {e2}")
-            # Clean directory
-            costfunc_jobs_tmp_dir.cleanup()
-
-            # Adding generation information
-            for individual in self.pop:
-                individual.genID = self.NumGens
-                individual.kept_gens = set([self.NumGens])
-
-            self.acceptance[self.NumGens] = {
-                'accepted': len(self.pop[:]),
-                'generated': len(self.pop[:])
-            }
-
-            # Get the same order population in case cost is the same. Sorted by idx and then by cost
-            if self.randomseed:
-                self.pop = sorted(self.pop, key=lambda x: x.idx)
-            self.pop = sorted(self.pop)
-            # Print some information of the initial population
-            print(f"Initial Population: Best Individual: {self.pop[0]}")
-            print(f"Accepted rate: {self.acceptance[self.NumGens]['accepted']} / {self.acceptance[self.NumGens]['generated']}\n")
-            # Updating the info of the first individual (parent)
-            # to print at the end how well performed the method (cost function)
-            # Because How the population was initialized and because we are using pool.imap (ordered).
-            # The parent is the first Individual of self.pop.
-            # We have to use deepcopy because Individual is a mutable object
-            # Because above set were used, we have to sorter based on idx
-            self.InitIndividual = deepcopy(
-                min(
-                    sorted(self.pop, key=lambda x: x.idx)[:len(self._seed_mol)]
+        # Incremental checkpoint. A new log starts with everything seen so far
+        if not (self.checkpoint and self.save_pop_every_gen):
+            self._runlog = None
+        elif getattr(self, '_runlog', None) is None:
+            self._runlog = RunLog('cpt.runlog', reset=True)
+            self._runlog.pending_saw.extend(
+                individual if isinstance(individual, IndividualRecord) else IndividualRecord(individual)
+                for individual in self.SawIndividuals)
+
+        # The same pool is used for all the generations
+        own_pool = pool is None
+        if own_pool:
+            pool = WorkerPool(self.costfunc, self.costfunc_kwargs, njobs)
+        try:
+            # Initialize Population
+            # In case that the populating exist there is not need to initialize.
+            if len(self.pop) == 0:
+                GenInitStructs = []
+                # in case that the input has the popsize memebers there is not need to generate new structures
+                if len(self._seed_mol) < self.popsize:
+                    for mol in self._seed_mol:
+                        cache = _get_crem_cache(getattr(self, 'crem_cache', False))
+                        if cache is None:
+                            tmp_GenInitStructs = list(mutate_mol(mol, self.crem_db_path, **self.mutate_crem_kwargs))
+                        else:
+                            tmp_GenInitStructs = cache.mutate_mol(mol, self.crem_db_path, **self.mutate_crem_kwargs)
+                        tmp_GenInitStructs = [mol for (_, mol) in tmp_GenInitStructs]
+                        GenInitStructs += tmp_GenInitStructs
+                    # Checking for possible scenarios
+                    if len(GenInitStructs) == 0:
+                        raise RuntimeError("Something really strange happened. The seed_mol did not "
+                                           "generate any new molecule during the initialization of the population. "
+                                           "Check the provided crem parameters!")
+                    if len(GenInitStructs) < (self.popsize - len(self._seed_mol)):
+                        print('The initial population has repeated elements')
+                        # temporal solution
+                        GenInitStructs += random.choices(GenInitStructs,
+                                                         k=self.popsize - len(GenInitStructs) - len(self._seed_mol))
+                    elif len(GenInitStructs) > (self.popsize - 1):
+                        # Selected random sample from the generation
+                        GenInitStructs = random.sample(GenInitStructs, k=self.popsize - len(self._seed_mol))
+                    else:
+                        # Everything is ok!
+                        pass
+
+                # Adding the inputs to the initial population
+                # The repeated molecules are skipped before the generation of the 3D model
+                candidates = []
+                for i, mol in enumerate(self._seed_mol):
+                    individual = Individual(mol, idx=i, randomseed=self.randomseed)
+                    if individual not in candidates:
+                        candidates.append(individual)
+
+                # Completing the population with the generated structures
+                for i, mol in enumerate(GenInitStructs):
+                    if self.AddHs:
+                        individual = Individual(Chem.AddHs(mol), idx=i + len(self._seed_mol), randomseed=self.randomseed)
+                    else:
+                        individual = Individual(mol, idx=i + len(self._seed_mol), randomseed=self.randomseed)
+                    if individual not in candidates:
+                        candidates.append(individual)
+
+                # The 3D models are generated in batch
+                if not self._constraint():
+                    _confgen_individuals(candidates, njobs=pool.njobs)
+                self.pop.extend(individual for individual in candidates if self._dockable(individual))
+
+                # Make sure that the population do not have more than popsize members and it is without repeated elements.
+                # That could happens if seed_mol has more molecules than popsize
+                self.pop = sorted(set(self.pop), key=lambda x: x.idx)[:self.popsize]
+
+                # Adding generation information
+                for individual in self.pop:
+                    individual.genID = self.NumGens
+                    individual.kept_gens = set([self.NumGens])
+
+                # Calculating cost of each individual
+                print(f'\n\nCreating the first population with {len(self.pop)} members:')
+                self.pop = self._evaluate(pool, self.pop, callback)
+
+                self.acceptance[self.NumGens] = {
+                    'accepted': len(self.pop[:]),
+                    'generated': len(self.pop[:])
+                }
+
+                # Get the same order population in case cost is the same. Sorted by idx and then by cost
+                if self.randomseed:
+                    self.pop = sorted(self.pop, key=lambda x: x.idx)
+                self.pop = sorted(self.pop)
+                # Print some information of the initial population
+                print(f"Initial Population: Best Individual: {self.pop[0]}")
+                print(f"Accepted rate: {self.acceptance[self.NumGens]['accepted']} / "
+                      f"{self.acceptance[self.NumGens]['generated']}\n")
+                # Updating the info of the first individual (parent)
+                # to print at the end how well performed the method (cost function)
+                # Because How the population was initialized and because the evaluated Individuals keep their order.
+                # The parent is the first Individual of self.pop.
+                # We have to use deepcopy because Individual is a mutable object
+                # Because above set were used, we have to sorter based on idx
+                self.InitIndividual = deepcopy(
+                    min(
+                        sorted(self.pop, key=lambda x: x.idx)[:len(self._seed_mol)]
+                    )
                 )
-            )
-            # Best Cost of Iterations
-            self.best_cost = []
-            self.avg_cost = []
+                # Best Cost of Iterations
+                self.best_cost = []
+                self.avg_cost = []
 
-        # Saving tracking variables, the first population, outside the if to take into account second calls
-        # with different population provided by the user.
-        self.SawIndividuals.update(self.pop)
-
-        # Saving population in disk if it was required
-        if self.save_pop_every_gen:
-            compressed_pickle(f"{self.deffnm}_pop", (self.NumGens, sorted(self.pop)))
-            make_sdf(sorted(self.pop), sdf_name=f"{self.deffnm}_pop")
-            if self.checkpoint:
-                compressed_pickle('cpt', self)
-
-        # Main Loop
-        # Another control variable. In case that the __call__ method is used more than ones.
-        number_of_previous_generations = len(self.best_cost)
-        for it in range(self.maxiter):
-            # Saving Number of Generations
-            self.NumGens += 1
-
-            # Probabilities Selections
-            probs = softmax((-self.beta * np.array(self.pop)).astype('float64'))
-            if any(np.isnan(probs)):
-                probs = np.nan_to_num(probs)
-            
-            
-            # TODO: This cycle should run in this way only if no user generetor was provided
-            # with and if, else statment I could correct, and then the genereator functions is completlly up to the user,
-            # then I do not need to worry in how the selection is made,
-            # In this case self.nc will not have any validity unless the user use it with its evaluator
-            # the checking of SawIndivduals must be done after the user funcrion return the popc
-            # The other that I need to change is that if the if it is a new genereator the genereation of the initil population is different
-            # the other is that checking for redundancy may be complicated in the case, that molecules are, for example peptides,
-            # in this case other identifier like the aa sequnce should be ued intead. For that the user may need a different Individual instance
-            # a one more efficient, there are a lot of if here :`-)
-            popc = []
-            for _ in range(self.nc):
-                # Perform Roulette Wheel Selection
-                parent = self.pop[roulette_wheel_selection(probs)]
-
-                # Perform Mutation (this mutation is some kind of crossover but with CReM library)
-                children = self.mutate(parent)
-
-                # Save offspring population
-                # I will save only those offsprings that were not seen and that have a correct pdbqt file
-                if children not in self.SawIndividuals and children not in popc and children.pdbqt:
-                    children.genID = self.NumGens
-                    children.kept_gens = set()
-                    popc.append(children)
-
-            if popc:  # Only if there are new members
-                # Calculating cost of each offspring individual (Doing Docking)
-
-                # Creating the arguments
-                args_list = []
-                # Make a copy of the self.costfunc_kwargs
-                kwargs_copy, costfunc_jobs_tmp_dir = _make_kwargs_copy(self.costfunc, self.costfunc_kwargs)
-
-                NumbOfSawIndividuals = len(self.SawIndividuals)
-                for (i, individual) in enumerate(popc):
-                    # Add idx label to each individual
-                    individual.idx = i + NumbOfSawIndividuals
-                    # The problem here is that we are not being general for other possible Cost functions.
-                    args_list.append((individual, kwargs_copy))
-                print(f'Evaluating generation {self.NumGens} / {self.maxiter + number_of_previous_generations}:')
-
-                # Calculating cost fucntion in parallel
-                try:
-                    pool = mp.Pool(njobs)
-                    popc = [individual for individual in tqdm.tqdm(pool.imap(self.__costfunc__, args_list), total=len(args_list))]
-                    pool.close()
-                except Exception as e1:
-                    warn("Parallelization did not work. Trying with serial...")
-                    try:
-                        popc = [self.__costfunc__(args) for args in tqdm.tqdm(args_list, total=len(args_list))]
-                    except Exception as e2:
-                        raise RuntimeError("Serial did not work either. Here are the ucurred exceptions:\n"
-                                           f"=========Parellel=========:\n {e1}\n"
-                                           f"==========Serial==========:\n {e2}")
-
-                # Clean directory
-                costfunc_jobs_tmp_dir.cleanup()
-
-            # Merge, Sort and Select
-            self.pop += popc
-            if self.randomseed:
-                self.pop = sorted(self.pop, key=lambda x: x.idx)
-            self.pop = sorted(self.pop)
-            self.pop = self.pop[:self.popsize]
-
-            # Update the kept_gens attribute
-            self.acceptance[self.NumGens] = {
-                'accepted': 0,
-                'generated': len(popc)
-            }
-            for individual in self.pop:
-                if not individual.kept_gens:
-                    self.acceptance[self.NumGens]['accepted'] += 1
-                individual.kept_gens.add(self.NumGens)
-
-            # Store Best Cost
-            self.best_cost.append(self.pop[0].cost)
-
-            # Store Average cost
-            self.avg_cost.append(np.mean(self.pop))
-
-            # Saving tracking variables
-            self.SawIndividuals.update(popc)
+            # Saving tracking variables, the first population, outside the if to take into account second calls
+            # with different population provided by the user.
+            self._update_saw(self.pop)
 
             # Saving population in disk if it was required
             if self.save_pop_every_gen:
-                # Save every save_pop_every_gen and always the last population
-                if self.NumGens % self.save_pop_every_gen == 0 or it + 1 == self.maxiter:
-                    compressed_pickle(f"{self.deffnm}_pop", (self.NumGens, self.pop))
-                    make_sdf(self.pop, sdf_name=f"{self.deffnm}_pop")
-                    if self.checkpoint:
-                        compressed_pickle('cpt', self)
-
-            # Show Iteration Information
-            print(f"Generation {self.NumGens}: Best Individual: {self.pop[0]}.")
-            print(f"Accepted rate: {self.acceptance[self.NumGens]['accepted']} / {self.acceptance[self.NumGens]['generated']}\n")
+                compressed_pickle(f"{self.deffnm}_pop", (self.NumGens, sorted(self.pop)))
+                make_sdf(sorted(self.pop), sdf_name=f"{self.deffnm}_pop")
+                if self.checkpoint:
+                    self._runlog.write_header(self)
+                    self._runlog.flush(self)
+
+            # Main Loop
+            # Another control variable. In case that the __call__ method is used more than ones.
+            number_of_previous_generations = len(self.best_cost)
+            if getattr(self, 'mode', 'generational') == 'steady_state':
+                self._steady_state(pool, number_of_previous_generations, callback)
+            else:
+                for it in range(self.maxiter):
+                    # Saving Number of Generations
+                    self.NumGens += 1
+
+                    # Probabilities Selections
+
+                    # TODO: This cycle should run in this way only if no user generetor was provided
+                    # with and if, else statment I could correct, and then the genereator functions is completlly up to the user,
+                    # then I do not need to worry in how the selection is made,
+                    # In this case self.nc will not have any validity unless the user use it with its evaluator
+                    # the checking of SawIndivduals must be done after the user funcrion return the popc
+                    # The other that I need to change is that if the if it is a new genereator the genereation of the initil population is different
+                    # the other is that checking for redundancy may be complicated in the case, that molecules are, for example peptides,
+                    # in this case other identifier like the aa sequnce should be ued intead. For that the user may need a different Individual instance
+                    # a one more efficient, there are a lot of if here :`-)
+                    # Perform Selection and
+                    # Mutation (this mutation is some kind of crossover but with CReM library)
+                    parents = [self.pop[i] for i in self._select_parents(self.nc)]
+
+                    # Calculating cost of each offspring individual (Doing Docking)
+                    # while the rest of the offspring are still being created
+                    print(f'Evaluating generation {self.NumGens} / {self.maxiter + number_of_previous_generations}:')
+                    popc = self._evaluate_pipeline(pool, parents, callback)
+
+                    # Merge, Sort and Select
+                    self.pop += popc
+                    if self.randomseed:
+                        self.pop = sorted(self.pop, key=lambda x: x.idx)
+                    self.pop = sorted(self.pop)
+                    self.pop = self.pop[:self.popsize]
+
+                    self._end_generation(popc, last=it + 1 == self.maxiter)
+        finally:
+            if own_pool:
+                pool.close()
 
         # Printing summary information
         print(f"\n{50*'=+'}\n")
@@ -1676,10 +3128,358 @@ class GA:
         print(f"Total time ({self.maxiter} generations): {time.time() - ts:>5.2f} (s).\n"
               f"Finished at {datetime.datetime.now().strftime('%c')}.\n")
 
-    def __costfunc__(self, args_list):
-        individual, kwargs = args_list
-        # This is just to use the progress bar on pool.imap
-        return self.costfunc(individual, **kwargs)
+    def _end_generation(self, popc: List[Individual], last: bool = False):
+        """Update the tracking variables at the end of a generation, save (if needed)
+        and print the information of the generation. self.pop must be already updated.
+
+        Parameters
+        ----------
+        popc : List[Individual]
+            The evaluated offspring of the generation.
+        last : bool, optional
+            If it is the last generation of the call (the population is always saved), by default False
+        """
+        # Update the kept_gens attribute
+        self.acceptance[self.NumGens] = {
+            'accepted': 0,
+            'generated': len(popc)
+        }
+        for individual in self.pop:
+            if not individual.kept_gens:
+                self.acceptance[self.NumGens]['accepted'] += 1
+            individual.kept_gens.add(self.NumGens)
+
+        # Store Best Cost
+        self.best_cost.append(self.pop[0].cost)
+
+        # Store Average cost
+        self.avg_cost.append(np.mean(self.pop))
+
+        # Saving tracking variables
+        self._update_saw(popc)
+        if self._runlog is not None:
+            self._runlog.add_generation(self)
+
+        # Saving population in disk if it was required
+        if self.save_pop_every_gen:
+            # Save every save_pop_every_gen and always the last population
+            if self.NumGens % self.save_pop_every_gen == 0 or last:
+                compressed_pickle(f"{self.deffnm}_pop", (self.NumGens, self.pop))
+                make_sdf(self.pop, sdf_name=f"{self.deffnm}_pop")
+                if self.checkpoint:
+                    self._runlog.flush(self)
+
+        # Show Iteration Information
+        print(f"Generation {self.NumGens}: Best Individual: {self.pop[0]}.")
+        print(f"Accepted rate: {self.acceptance[self.NumGens]['accepted']} / "
+              f"{self.acceptance[self.NumGens]['generated']}\n")
+
+    def _steady_state(self, pool: WorkerPool, number_of_previous_generations: int = 0,
+                      callback: Callable = None):
+        """Main loop of mode = 'steady_state'. New offspring are submitted to the pool
+        as soon as a worker is free and each evaluated offspring replaces
+        the worst Individual of the population if it has a lower cost.
+        Every self.nc created offspring (evaluated or discarded as repeated) define a generation.
+
+        Parameters
+        ----------
+        pool : WorkerPool
+            The pool to use.
+        number_of_previous_generations : int, optional
+            Generations performed in previous calls (only used for printing), by default 0
+        callback : Callable, optional
+            Called with every evaluated offspring as soon as it is ready, by default None
+
+        Raises
+        ------
+        RuntimeError
+            If an Individual could not be evaluated neither in the pool nor in serial.
+        """
+        # The evaluated individuals (or the exceptions) arrive here from the result handler thread of the pool
+        finished = queue.Queue()
+        in_flight = set()
+        total = self.maxiter * self.nc
+        submitted, resolved = 0, 0
+        next_idx = len(self.SawIndividuals)
+        popc = []
+        print(f'Evaluating generation {self.NumGens + 1} / {self.maxiter + number_of_previous_generations}:')
+        while resolved < total:
+            # Keep all the workers busy
+            while submitted < total and len(in_flight) < pool.njobs:
+                submitted += 1
+                # Perform Selection
+                parent = self.pop[self._select_parents(1)[0]]
+                children = self.mutate(parent)
+                if not self._seen(children) and children not in in_flight and self._dockable(children):
+                    children.idx = next_idx
+                    next_idx += 1
+                    in_flight.add(children)
+                    pool.apply_async(
+                        children,
+                        callback=lambda individual: finished.put((individual, None)),
+                        error_callback=lambda e, individual=children: finished.put((individual, e)),
+                        costfunc_kwargs=self._costfunc_task_kwargs())
+                else:
+                    # Repeated or invalid offspring, there is nothing to evaluate
+                    resolved += 1
+                    popc = self._steady_state_resolve(popc, resolved, total, number_of_previous_generations)
+
+            if in_flight:
+                individual, exception = finished.get()
+                if exception is not None:
+                    warn(f"Parallel evaluation of {individual} failed. Trying with serial...")
+                    try:
+                        individual = pool.costfunc(individual, **{**pool.costfunc_kwargs, **self._costfunc_task_kwargs()})
+                    except Exception as e:
+                        raise RuntimeError("Serial did not work either. Here are the ucurred exceptions:\n"
+                                           f"=========Parellel=========:\n {exception}\n"
+                                           f"==========Serial==========:\n {e}")
+                in_flight.discard(individual)
+                individual.genID = self.NumGens + 1
+                individual.kept_gens = set()
+                self._update_saw([individual])
+                popc.append(individual)
+                if callback is not None:
+                    callback(individual)
+
+                # Replace the worst member of the population
+                if len(self.pop) < self.popsize:
+                    self.pop.append(individual)
+                elif individual.cost < self.pop[-1].cost:
+                    self.pop[-1] = individual
+                if self.randomseed:
+                    self.pop = sorted(self.pop, key=lambda x: x.idx)
+                self.pop = sorted(self.pop)
+
+                resolved += 1
+                popc = self._steady_state_resolve(popc, resolved, total, number_of_previous_generations)
+        # Clean directory
+        pool.clean()
+
+    def _steady_state_resolve(self, popc: List[Individual], resolved: int, total: int,
+                              number_of_previous_generations: int) -> List[Individual]:
+        # Close the generation every self.nc resolved offspring
+        if resolved % self.nc == 0 or resolved == total:
+            self.NumGens += 1
+            self._end_generation(popc, last=resolved == total)
+            popc = []
+            if resolved < total:
+                print(f'Evaluating generation {self.NumGens + 1} / {self.maxiter + number_of_previous_generations}:')
+        return popc
+
+    def _costfunc_task_kwargs(self) -> dict:
+        """Keyword arguments of the cost function that change during the simulation.
+        With early_exit, an offspring is only useful if its cost is lower than the worst member of the population.
+        """
+        if getattr(self, 'early_exit', False) and len(self.pop) >= self.popsize:
+            return {'cost_threshold': self.pop[-1].cost}
+        return {}
+
+    def _select_parents(self, n: int) -> np.ndarray:
+        """Select n parents from self.pop with :meth:`moldrug.utils.select_parents`.
+        """
+        # GA objects from previous versions of moldrug do not have them
+        if getattr(self, '_rng', None) is None:
+            self._rng = np.random.default_rng(self.randomseed)
+        costs = np.fromiter((individual.cost for individual in self.pop), dtype='float64', count=len(self.pop))
+        return select_parents(costs, n, method=getattr(self, 'selection', 'roulette'), beta=self.beta,
+                              rng=self._rng, tournament_size=getattr(self, 'tournament_size', 2))
+
+    def _update_saw(self, individuals: Iterable[Individual]):
+        """Add the new Individuals to SawIndividuals as :meth:`moldrug.utils.IndividualRecord`.
+        kept_gens is shared with the Individual, so it is also updated in SawIndividuals.
+        """
+        records = [IndividualRecord(individual) for individual in individuals
+                   if individual not in self.SawIndividuals]
+        self.SawIndividuals.update(records)
+        if getattr(self, '_runlog', None) is not None:
+            self._runlog.pending_saw.extend(records)
+
+    def _constraint(self) -> bool:
+        # Constraint docking generates its own conformers, the pdbqt of the Individuals is not used
+        return bool(self.costfunc_kwargs.get('constraint', False))
+
+    def _dockable(self, individual: Individual) -> bool:
+        """Check if the Individual can be evaluated. Accessing pdbqt generates the 3D model (only the first time),
+        therefore it must be called after the cheap checks.
+        """
+        return self._constraint() or bool(individual.pdbqt)
+
+    def _seen(self, individual: Individual) -> bool:
+        """Check if the Individual was already evaluated by this or another GA (see ExternalSawSmiles).
+        """
+        return individual in self.SawIndividuals or individual.smiles in getattr(self, 'ExternalSawSmiles', ())
+
+    def _evaluate(self, pool: WorkerPool, individuals: List[Individual],
+                  callback: Callable = None) -> List[Individual]:
+        """Evaluate the cost function on individuals with pool. The results are collected
+        in order of completion. If it fails, a serial evaluation of the remaining Individuals is tried.
+
+        Parameters
+        ----------
+        pool : WorkerPool
+            The pool to use.
+        individuals : List[Individual]
+            The Individuals to evaluate.
+        callback : Callable, optional
+            Called with every evaluated Individual as soon as it is ready, by default None
+
+        Returns
+        -------
+        List[Individual]
+            The evaluated Individuals in the same order.
+
+        Raises
+        ------
+        RuntimeError
+            If neither the parallel nor the serial evaluation worked.
+        """
+        evaluated = [None] * len(individuals)
+        try:
+            for i, individual in tqdm.tqdm(pool.imap_unordered(individuals), total=len(individuals)):
+                evaluated[i] = individual
+                if callback is not None:
+                    callback(individual)
+        except Exception as e1:
+            warn("Parallelization did not work. Trying with serial...")
+            try:
+                for i, individual in enumerate(tqdm.tqdm(individuals, total=len(individuals))):
+                    if evaluated[i] is None:
+                        evaluated[i] = pool.costfunc(individual, **pool.costfunc_kwargs)
+                        if callback is not None:
+                            callback(evaluated[i])
+            except Exception as e2:
+                raise RuntimeError("Serial did not work either. Here are the ucurred exceptions:\n"
+                                   f"=========Parellel=========:\n {e1}\n"
+                                   f"==========Serial==========:\n {e2}")
+        # Clean directory
+        pool.clean()
+        return evaluated
+
+    def _evaluate_pipeline(self, pool: WorkerPool, parents: List[Individual],
+                           callback: Callable = None) -> List[Individual]:
+        """Create the offspring of parents, filter them and evaluate them with pool. Every new offspring
+        is submitted to the pool as soon as it is created, so the creation of the next ones (in this process,
+        or in the pool with ``parallel_mutation``) overlaps with the evaluation of the previous ones.
+        At most ``2 * pool.njobs`` tasks (mutations and evaluations) wait in the pool, and a ready offspring
+        is always submitted before new mutations. The offspring are filtered and labeled in the order of parents
+        and the results are collected in order of completion. If a mutation fails in the pool it is repeated
+        in this process; if the evaluation of an offspring fails, a serial evaluation is tried.
+
+        Parameters
+        ----------
+        pool : WorkerPool
+            The pool to use.
+        parents : List[Individual]
+            The parents, one offspring is created from each of them.
+        callback : Callable, optional
+            Called with every evaluated offspring as soon as it is ready, by default None
+
+        Returns
+        -------
+        List[Individual]
+            The evaluated offspring (without repeated, already seen or without pdbqt) in the order of creation.
+
+        Raises
+        ------
+        RuntimeError
+            If neither the parallel nor the serial evaluation worked.
+        """
+        popc, evaluated = [], []
+        # The finished tasks (results or exceptions) arrive here from the result handler thread of the pool
+        finished = queue.Queue()
+        progress = tqdm.tqdm(total=self.nc)
+        # The population does not change until the end of the generation
+        task_kwargs = self._costfunc_task_kwargs()
+        window = 2 * pool.njobs
+        NumbOfSawIndividuals = len(self.SawIndividuals)
+        # Tasks (mutations and evaluations) waiting in the pool
+        in_flight = 0
+        # Offspring created in the pool, by position of the parent
+        mutated = {}
+
+        def collect():
+            nonlocal in_flight
+            kind, i, result, exception = finished.get()
+            in_flight -= 1
+            if kind == 'mutation':
+                if exception is not None:
+                    warn("Parallel mutation did not work. Trying with serial...")
+                    # Same seed, same offspring. The random state of this process is not changed
+                    state = random.getstate()
+                    result = _worker_mutate(tasks[i])
+                    random.setstate(state)
+                mutated[i] = result
+                return
+            if exception is not None:
+                warn(f"Parallel evaluation of {result} failed. Trying with serial...")
+                try:
+                    result = pool.costfunc(result, **{**pool.costfunc_kwargs, **task_kwargs})
+                except Exception as e:
+                    raise RuntimeError("Serial did not work either. Here are the ucurred exceptions:\n"
+                                       f"=========Parellel=========:\n {exception}\n"
+                                       f"==========Serial==========:\n {e}")
+            evaluated[i] = result
+            progress.update()
+            if callback is not None:
+                callback(result)
+
+        def submit(children):
+            nonlocal in_flight
+            # Save offspring population
+            # I will save only those offsprings that were not seen and that have a correct pdbqt file
+            if not self._seen(children) and children not in popc and self._dockable(children):
+                children.genID = self.NumGens
+                children.kept_gens = set()
+                # Add idx label to each individual
+                children.idx = len(popc) + NumbOfSawIndividuals
+                popc.append(children)
+                evaluated.append(None)
+                pool.apply_async(
+                    children,
+                    callback=lambda individual, i=len(popc) - 1: finished.put(('evaluation', i, individual, None)),
+                    error_callback=lambda e, i=len(popc) - 1, individual=children: finished.put(
+                        ('evaluation', i, individual, e)),
+                    costfunc_kwargs=task_kwargs)
+                in_flight += 1
+
+        if getattr(self, 'parallel_mutation', False):
+            tasks = self._mutation_tasks(parents)
+            next_task, next_offspring = 0, 0
+            while next_offspring < len(tasks) or in_flight:
+                # The ready offspring go first (in the order of parents)
+                while next_offspring in mutated:
+                    submit(mutated.pop(next_offspring))
+                    next_offspring += 1
+                while next_task < len(tasks) and in_flight < window:
+                    pool.apply_async(
+                        tasks[next_task],
+                        callback=lambda children, i=next_task: finished.put(('mutation', i, children, None)),
+                        error_callback=lambda e, i=next_task: finished.put(('mutation', i, None, e)),
+                        function=_worker_mutate)
+                    next_task += 1
+                    in_flight += 1
+                if in_flight:
+                    collect()
+        else:
+            # The same seeds as with parallel_mutation, so both give the same offspring
+            seeds = self._offspring_seeds(parents)
+            state = random.getstate()
+            for parent, seed in zip(parents, seeds):
+                random.seed(seed)
+                submit(self.mutate(parent))
+                # Bounded: wait before creating more offspring
+                while not finished.empty() or in_flight >= window:
+                    collect()
+            random.setstate(state)
+            while in_flight:
+                collect()
+        progress.total = len(popc)
+        progress.refresh()
+        progress.close()
+        # Clean directory
+        pool.clean()
+        return evaluated
 
     def mutate(self, individual: Individual):
         """Genetic operators
@@ -1694,37 +3494,55 @@ class GA:
         Individual
             A new Individual.
         """
+        return _mutate(individual, **self._mutation_settings())
+
+    def _mutation_settings(self) -> dict:
+        # Everything that _mutate needs from self, it is sent to the workers with parallel_mutation
+        return {
+            'crem_db_path': self.crem_db_path,
+            'mutate_crem_kwargs': self.mutate_crem_kwargs,
+            'init_mol': self.InitIndividual.mol,
+            'get_similar': self.get_similar,
+            'AddHs': self.AddHs,
+            'randomseed': self.randomseed,
+            'crem_cache': getattr(self, 'crem_cache', False),
+            'mcs_timeout': getattr(self, 'mcs_timeout', None),
+        }
 
-        # Here is were I have to check if replace_ids or protected_ids where provided.
-        mutate_crem_kwargs_to_work_with = self.mutate_crem_kwargs.copy()
-        if 'replace_ids' in self.mutate_crem_kwargs and 'protected_ids' in self.mutate_crem_kwargs:
-            mutate_crem_kwargs_to_work_with['replace_ids'], mutate_crem_kwargs_to_work_with['protected_ids'] = update_reactant_zone(
-                self.InitIndividual.mol, individual.mol, parent_replace_ids=self.mutate_crem_kwargs['replace_ids'],
-                parent_protected_ids=self.mutate_crem_kwargs['protected_ids'])
-        elif 'replace_ids' in self.mutate_crem_kwargs:
-            mutate_crem_kwargs_to_work_with['replace_ids'], _ = update_reactant_zone(
-                self.InitIndividual.mol, individual.mol, parent_replace_ids=self.mutate_crem_kwargs['replace_ids'])
-        elif 'protected_ids' in self.mutate_crem_kwargs:
-            _, mutate_crem_kwargs_to_work_with['protected_ids'] = update_reactant_zone(
-                self.InitIndividual.mol, individual.mol,
-                parent_protected_ids=self.mutate_crem_kwargs['protected_ids'])
+    def _mutation_tasks(self, parents: List[Individual]) -> List[tuple]:
+        """The tasks of :meth:`moldrug.utils._worker_mutate` to mutate parents in the workers of the pool
+        (CReM and the conformer generation of the offspring). Each mutation gets its own random seed
+        drawn from the random module, so the results are reproducible with randomseed.
 
-        try:
-            mutants = list(mutate_mol(individual.mol, self.crem_db_path, **mutate_crem_kwargs_to_work_with))
-            # Bias the searching to similar molecules
-            if self.get_similar:
-                mol = get_similar_mols(mols=[mol for _, mol in mutants],
-                                       ref_mol=self.InitIndividual.mol, pick=1, beta=0.01)[0]
-            else:
-                _, mol = random.choice(mutants)  # nosec
-        except Exception:
-            print(f'Note: The mutation on {individual} did not work, it will be returned the same individual')
-            mol = individual.mol
-        if self.AddHs:
-            mol = Chem.AddHs(mol)
-        return Individual(mol, randomseed=self.randomseed)
+        Parameters
+        ----------
+        parents : List[Individual]
+            The Individuals to mutate.
 
-    def pickle(self, title: str, compress: bool = False):
+        Returns
+        -------
+        List[tuple]
+            One task for every parent, in the same order.
+        """
+        settings = self._mutation_settings()
+        # Only the Individuals not created in the workers (e.g. the initial population) do not have it.
+        # Calculated here, it is kept on the Individual of self.pop
+        if 'replace_ids' in self.mutate_crem_kwargs or 'protected_ids' in self.mutate_crem_kwargs:
+            for parent in parents:
+                _reactant_zone(parent, settings['init_mol'], replace_ids=self.mutate_crem_kwargs.get('replace_ids'),
+                               protected_ids=self.mutate_crem_kwargs.get('protected_ids'),
+                               mcs_timeout=settings['mcs_timeout'])
+        # The workers are daemonic processes, CReM can not create its own pool inside them
+        settings['mutate_crem_kwargs'] = dict(settings['mutate_crem_kwargs'], ncores=1)
+        return [(parent, seed, settings, not self._constraint())
+                for parent, seed in zip(parents, self._offspring_seeds(parents))]
+
+    def _offspring_seeds(self, parents: List[Individual]) -> List[int]:
+        # One seed for the mutation of every parent, drawn from the random module (reproducible with randomseed).
+        # The random module is seeded with them, with and without parallel_mutation
+        return [random.getrandbits(32) for _ in parents]
+
+    def pickle(self, title: str, compress: bool = False, codec: str = None):
         """Method to pickle the whole GA class
 
         Parameters
@@ -1735,12 +3553,16 @@ class GA:
         compress : bool, optional
             Use compression, by default False. If True :meth:`moldrug.utils.compressed_pickle` will be used;
             if not :meth:`moldrug.utils.full_pickle` will be used instead.
+        codec : str, optional
+            The codec used if compress is True (see :meth:`moldrug.utils.compressed_pickle`), by default None (bz2)
         """
         cls = self.__class__
         result = cls.__new__(cls)
         result.__dict__.update(self.__dict__)
+        # The run log belongs to the running object
+        result.__dict__.pop('_runlog', None)
         if compress:
-            compressed_pickle(title, result)
+            compressed_pickle(title, result, codec=codec)
         else:
             full_pickle(title, result)
 
@@ -1755,5 +3577,490 @@ class GA:
         return to_dataframe(self.SawIndividuals, return_mol=return_mol)
 
 
+class RunLog:
+    """Append-only log used as checkpoint of :meth:`moldrug.utils.GA`.
+    Instead of pickling the whole GA object (which includes all the ``SawIndividuals``) on every save,
+    only what changed since the previous save is appended, so the cost of a checkpoint
+    does not grow with the length of the simulation. The log has two kinds of records:
+
+    * header: the GA object without ``SawIndividuals``. It is written at the beginning of every call
+      (the arguments could change between calls).
+    * update: the new evaluated Individuals (as :meth:`moldrug.utils.IndividualRecord`), the per-generation state
+      (acceptance, best and average cost and the Individuals kept in the population) and the current population.
+
+    Each record is a zlib compressed pickle prefixed with its size. An incomplete record at the end of the file
+    (e.g. the simulation was killed while writing) is ignored, so the log always goes back to the last complete save.
+
+    Example
+    -------
+    .. ipython:: python
+
+        from moldrug import utils
+        from rdkit import Chem
+        individual = utils.Individual(Chem.MolFromSmiles('CCO'), cost=-3)
+        log = utils.RunLog('example.runlog', reset=True)
+        log.append('update', {'saw': [utils.IndividualRecord(individual)]})
+        print(list(log.records()))
+    """
+    def __init__(self, file: str = 'cpt.runlog', reset: bool = False) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        file : str, optional
+            Path to the log, by default 'cpt.runlog'
+        reset : bool, optional
+            If True, an existing log is removed, by default False
+        """
+        self.file = file
+        if reset and os.path.isfile(self.file):
+            os.remove(self.file)
+        # Not yet written
+        self.pending_saw = []
+        self.pending_gens = []
+
+    def __getstate__(self):
+        # Only the path is meaningful outside of the running GA
+        return {'file': self.file}
+
+    def __setstate__(self, state):
+        self.__init__(state['file'])
+
+    def append(self, kind: str, data: object):
+        """Append one record to the log.
+
+        Parameters
+        ----------
+        kind : str
+            header or update.
+        data : object
+            The content of the record.
+        """
+        record = zlib.compress(_dumps((kind, data)))
+        with open(self.file, 'ab') as f:
+            f.write(struct.pack('<Q', len(record)) + record)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self):
+        """Iterate over the complete records of the log.
+
+        Yields
+        ------
+        tuple
+            (kind, data)
+        """
+        header_size = struct.calcsize('<Q')
+        # Size of the complete records
+        self.valid_size = 0
+        file_size = os.path.getsize(self.file)
+        with open(self.file, 'rb') as f:
+            while True:
+                header = f.read(header_size)
+                if len(header) < header_size:
+                    return
+                size = struct.unpack('<Q', header)[0]
+                if self.valid_size + header_size + size > file_size:
+                    return
+                record = f.read(size)
+                self.valid_size += header_size + size
+                yield _loads(zlib.decompress(record))
+
+    def write_header(self, ga: 'GA'):
+        """Append the GA object without SawIndividuals.
+
+        Parameters
+        ----------
+        ga : GA
+            The GA object.
+        """
+        cls = ga.__class__
+        header = cls.__new__(cls)
+        header.__dict__.update(ga.__dict__)
+        header.__dict__.pop('_runlog', None)
+        header.SawIndividuals = set()
+        self.append('header', header)
+
+    def add_generation(self, ga: 'GA'):
+        """Keep (in memory) the state of the last generation of ga until the next flush.
+
+        Parameters
+        ----------
+        ga : GA
+            The GA object.
+        """
+        self.pending_gens.append({
+            'NumGens': ga.NumGens,
+            'acceptance': ga.acceptance[ga.NumGens],
+            'best_cost': ga.best_cost[-1],
+            'avg_cost': ga.avg_cost[-1],
+            'kept': [individual.smiles for individual in ga.pop],
+        })
+
+    def flush(self, ga: 'GA'):
+        """Append the new Individuals, the pending generations, the current population of ga
+        and the state of its random generator (used for the selection).
+
+        Parameters
+        ----------
+        ga : GA
+            The GA object.
+        """
+        self.append('update', {
+            'NumGens': ga.NumGens,
+            'saw': self.pending_saw,
+            'gens': self.pending_gens,
+            'pop': ga.pop,
+            'rng': getattr(ga, '_rng', None),
+        })
+        self.pending_saw = []
+        self.pending_gens = []
+
+    def load(self) -> 'GA':
+        """Rebuild the GA object from the log.
+
+        Returns
+        -------
+        GA
+            The GA in the state of the last complete save. Further calls continue writing on this log.
+
+        Raises
+        ------
+        ValueError
+            If the log has not any header.
+        """
+        ga = None
+        saw = dict()
+        kept = []
+        for kind, data in self.records():
+            if kind == 'header':
+                ga = data
+            elif ga is not None:
+                for record in data['saw']:
+                    saw[record.smiles] = record
+                for gen in data['gens']:
+                    ga.acceptance[gen['NumGens']] = gen['acceptance']
+                    ga.best_cost.append(gen['best_cost'])
+                    ga.avg_cost.append(gen['avg_cost'])
+                    kept.append((gen['NumGens'], gen['kept']))
+                ga.NumGens = data['NumGens']
+                ga.pop = data['pop']
+                ga._rng = data.get('rng')
+        if ga is None:
+            raise ValueError(f"{self.file} does not have a header.")
+        # Remove the incomplete record (if any) before continue writing
+        if os.path.getsize(self.file) > self.valid_size:
+            os.truncate(self.file, self.valid_size)
+
+        for NumGens, smiles in kept:
+            for smi in smiles:
+                saw[smi].kept_gens.add(NumGens)
+        # As during the simulation, the population and SawIndividuals share kept_gens
+        for individual in ga.pop:
+            individual.kept_gens = saw[individual.smiles].kept_gens
+        ga.SawIndividuals = set(saw.values())
+        ga._runlog = self
+        return ga
+
+
+class Migration:
+    """File based channel to exchange Individuals between the islands of :meth:`moldrug.utils.IslandGA`.
+    Everything is written inside a directory, therefore it works for islands running
+    on the same machine or on different machines that share a file system.
+    The files are written atomically (temporal file + rename), so the islands never read incomplete data.
+
+    Directory layout:
+
+    * ``migrants/island_<i>_epoch_<e>.pbz2``: the Individuals sent by the island i after the epoch e.
+    * ``seen/island_<i>.smi``: the SMILES of all the molecules evaluated by the island i (one per line, only appended).
+    * ``results/island_<i>.pbz2``: the final GA of island i.
+
+    Attributes
+    ----------
+    directory : str
+        Absolute path of the directory used for the communication.
+    """
+    def __init__(self, directory: str) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        directory : str
+            The directory to use, it is created if needed.
+        """
+        self.directory = os.path.abspath(directory)
+        for sub_dir in ['migrants', 'seen', 'results']:
+            os.makedirs(os.path.join(self.directory, sub_dir), exist_ok=True)
+        # What was already read by this process
+        self._received = set()
+        self._seen_offsets = dict()
+
+    def clear(self):
+        """Remove the migrants, the seen SMILES and the results of a previous campaign,
+        otherwise they would be used by the islands of the new one.
+        """
+        for sub_dir in ['migrants', 'seen', 'results']:
+            for name in os.listdir(os.path.join(self.directory, sub_dir)):
+                os.remove(os.path.join(self.directory, sub_dir, name))
+        self._received = set()
+        self._seen_offsets = dict()
+
+    def _atomic_pickle(self, path: str, data: object):
+        # Hidden temporal file in the same directory, it is not listed by the readers
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}")
+        compressed_pickle(tmp_path, data)
+        os.replace(f"{tmp_path}.pbz2", f"{path}.pbz2")
+
+    def emigrate(self, island_id: int, epoch: int, individuals: List[Individual]):
+        """Send Individuals to the other islands.
+
+        Parameters
+        ----------
+        island_id : int
+            The island that sends.
+        epoch : int
+            The epoch (number of migrations performed by the island).
+        individuals : List[Individual]
+            The migrants.
+        """
+        self._atomic_pickle(os.path.join(self.directory, 'migrants', f"island_{island_id}_epoch_{epoch}"),
+                            list(individuals))
+
+    def immigrate(self, island_id: int) -> List[Individual]:
+        """Receive the Individuals sent by the other islands that were not received yet.
+        It does not wait for the other islands.
+
+        Parameters
+        ----------
+        island_id : int
+            The island that receives.
+
+        Returns
+        -------
+        List[Individual]
+            The migrants.
+        """
+        migrants = []
+        for name in sorted(os.listdir(os.path.join(self.directory, 'migrants'))):
+            if not name.startswith('island_') or name.startswith(f"island_{island_id}_") or name in self._received:
+                continue
+            migrants += decompress_pickle(os.path.join(self.directory, 'migrants', name))
+            self._received.add(name)
+        return migrants
+
+    def publish_seen(self, island_id: int, smiles: Iterable[str]):
+        """Share the SMILES of the molecules evaluated by an island.
+
+        Parameters
+        ----------
+        island_id : int
+            The island.
+        smiles : Iterable[str]
+            New SMILES evaluated by the island.
+        """
+        with open(os.path.join(self.directory, 'seen', f"island_{island_id}.smi"), 'a') as f:
+            f.writelines(f"{smi}\n" for smi in smiles)
+
+    def seen(self, island_id: int) -> set:
+        """The SMILES evaluated by the other islands that were not read yet.
+
+        Parameters
+        ----------
+        island_id : int
+            The island that reads.
+
+        Returns
+        -------
+        set
+            New SMILES.
+        """
+        new_smiles = set()
+        for name in os.listdir(os.path.join(self.directory, 'seen')):
+            if name == f"island_{island_id}.smi":
+                continue
+            with open(os.path.join(self.directory, 'seen', name), 'r') as f:
+                f.seek(self._seen_offsets.get(name, 0))
+                data = f.read()
+            # Only complete lines, the other island could be still writing
+            data = data[:data.rfind('\n') + 1]
+            self._seen_offsets[name] = self._seen_offsets.get(name, 0) + len(data.encode())
+            new_smiles.update(data.split())
+        return new_smiles
+
+    def save_result(self, island_id: int, ga: 'GA'):
+        self._atomic_pickle(os.path.join(self.directory, 'results', f"island_{island_id}"), ga)
+
+    def load_result(self, island_id: int) -> 'GA':
+        return decompress_pickle(os.path.join(self.directory, 'results', f"island_{island_id}.pbz2"))
+
+
+class IslandGA:
+    """Island model on top of :meth:`moldrug.utils.GA`. ``nislands`` populations evolve independently
+    and every ``migration_interval`` generations (an epoch) each island sends its best ``migrants`` Individuals
+    to the other islands, which merge them with their own population (keeping ``popsize`` members).
+    The islands also share the molecules that they evaluated, so the same molecule is not evaluated twice
+    in the campaign (as it is done by ``SawIndividuals`` in a single GA).
+
+    The communication is done through :meth:`moldrug.utils.Migration` (a directory). Calling the instance
+    runs all the islands as processes of this machine. To use several machines that share a file system,
+    create the same IslandGA on every machine and run a different island on each of them with
+    :meth:`moldrug.utils.IslandGA.island`; the migration is asynchronous, the islands never wait for each other.
+    In that case, clean the directory of a previous campaign (:meth:`moldrug.utils.Migration.clear`)
+    before starting the islands; calling the instance does it.
+
+    Attributes
+    ----------
+    nislands : int
+        Number of islands.
+    migration_interval : int
+        Generations between migrations.
+    migrants : int
+        Number of Individuals sent by each island on every migration.
+    migration_dir : str
+        The directory used by :meth:`moldrug.utils.Migration`.
+    ga_kwargs : dict
+        The keyword arguments used to create the GA of every island.
+    islands : list[:meth:`moldrug.utils.GA`]
+        The GA of each island, after the call.
+    pop : list[:meth:`moldrug.utils.Individuals`]
+        The best ``popsize`` Individuals of all the islands, after the call.
+    SawIndividuals : set[:meth:`moldrug.utils.IndividualRecord`]
+        All the Individuals evaluated by the islands, after the call.
+    """
+    def __init__(self, nislands: int = 2, migration_interval: int = 5, migrants: int = 2,
+                 migration_dir: str = 'islands', **ga_kwargs) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        nislands : int, optional
+            Number of islands, by default 2
+        migration_interval : int, optional
+            Generations between migrations, by default 5
+        migrants : int, optional
+            Number of Individuals that each island sends on every migration, by default 2
+        migration_dir : str, optional
+            Directory for the communication between islands, by default 'islands'
+        **ga_kwargs
+            Keyword arguments of :meth:`moldrug.utils.GA`. ``deffnm`` gets the suffix ``_island_<i>``,
+            ``randomseed`` (if provided) is increased by the island number, so every island is different,
+            and ``checkpoint`` is not used because all the islands would write the same file.
+        """
+        self.nislands = nislands
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.migration_dir = os.path.abspath(migration_dir)
+        self.ga_kwargs = ga_kwargs
+        self.islands = []
+        self.pop = []
+        self.SawIndividuals = set()
+
+    def _make_ga(self, island_id: int) -> GA:
+        ga_kwargs = self.ga_kwargs.copy()
+        ga_kwargs['deffnm'] = f"{ga_kwargs.get('deffnm', 'ga')}_island_{island_id}"
+        ga_kwargs['checkpoint'] = False
+        if ga_kwargs.get('randomseed') is not None:
+            ga_kwargs['randomseed'] += island_id
+        return GA(**ga_kwargs)
+
+    def island(self, island_id: int, njobs: int = 1) -> GA:
+        """Run one island. The final GA is also saved in ``migration_dir``.
+
+        Parameters
+        ----------
+        island_id : int
+            The island to run, from 0 to nislands - 1.
+        njobs : int, optional
+            The number of jobs used by the GA of the island, by default 1
+
+        Returns
+        -------
+        GA
+            The GA of the island.
+        """
+        migration = Migration(self.migration_dir)
+        ga = self._make_ga(island_id)
+        maxiter = ga.maxiter
+        published = set()
+        # The same pool is used for all the epochs
+        with WorkerPool(ga.costfunc, ga.costfunc_kwargs, njobs) as pool:
+            epoch = 0
+            while ga.NumGens < maxiter:
+                epoch += 1
+                ga.ExternalSawSmiles.update(migration.seen(island_id))
+                ga.maxiter = min(self.migration_interval, maxiter - ga.NumGens)
+                ga(pool=pool)
+
+                # Share what was evaluated and the best Individuals
+                migration.publish_seen(island_id, [individual.smiles for individual in ga.SawIndividuals
+                                                   if individual.smiles not in published])
+                published.update(individual.smiles for individual in ga.SawIndividuals)
+                migration.emigrate(island_id, epoch, ga.pop[:self.migrants])
+
+                # Receive Individuals from other islands
+                immigrants = [individual for individual in migration.immigrate(island_id) if individual not in ga.pop]
+                if immigrants:
+                    for individual in immigrants:
+                        individual.kept_gens = set([ga.NumGens])
+                    ga.pop = sorted(set(ga.pop + immigrants))[:ga.popsize]
+                    print(f"Island {island_id}: {len(immigrants)} immigrants received after generation {ga.NumGens}, "
+                          f"Best Individual: {ga.pop[0]}")
+        ga.maxiter = maxiter
+        migration.save_result(island_id, ga)
+        return ga
+
+    def __call__(self, njobs: int = 1):
+        """Run all the islands in parallel as processes of this machine.
+        Everything in ``migration_dir`` from a previous campaign is removed first.
+
+        Parameters
+        ----------
+        njobs : int, optional
+            Total number of jobs, they are distributed between the islands (at least one per island), by default 1
+
+        Raises
+        ------
+        RuntimeError
+            If some island did not finish successfully.
+        """
+        Migration(self.migration_dir).clear()
+        njobs_per_island = [njobs // self.nislands + (1 if i < njobs % self.nislands else 0)
+                            for i in range(self.nislands)]
+        # Non daemonic processes, every island creates its own pool
+        processes = [mp.Process(target=self.island, args=(i, max(1, njobs_per_island[i])))
+                     for i in range(self.nislands)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        failed = [i for i, process in enumerate(processes) if process.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"The islands {failed} did not finish successfully.")
+        self.collect()
+
+    def collect(self):
+        """Load the results of all the islands from ``migration_dir``
+        and update the attributes islands, pop and SawIndividuals.
+        Useful when the islands were run on different machines.
+        """
+        migration = Migration(self.migration_dir)
+        self.islands = [migration.load_result(i) for i in range(self.nislands)]
+        self.SawIndividuals = set()
+        for ga in self.islands:
+            self.SawIndividuals.update(ga.SawIndividuals)
+        popsize = self.islands[0].popsize
+        self.pop = sorted(set(individual for ga in self.islands for individual in ga.pop))[:popsize]
+
+    def to_dataframe(self, return_mol: bool = False):
+        """Create a DataFrame from self.SawIndividuals.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The DataFrame
+        """
+        return to_dataframe(self.SawIndividuals, return_mol=return_mol)
+
+
 if __name__ == '__main__':
     pass
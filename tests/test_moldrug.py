@@ -4,14 +4,20 @@ import copy
 import gzip
 import os
 import shutil
+import subprocess
 import sys
 import tempfile
+import time
+import warnings
 from multiprocessing import cpu_count
 
 import get_vina
+import numpy as np
 import requests
 import yaml
+from meeko import MoleculePreparation, PDBQTWriterLegacy
 from rdkit import Chem
+from rdkit.Chem import AllChem
 
 from moldrug import fitness, home, utils
 from moldrug.data import get_data
@@ -22,6 +28,9 @@ vina_executable = os.path.abspath('vina')
 if not os.path.isfile(vina_executable):
     get_vina.download()
 
+# The workers of the pools are other processes
+MAIN_PID = os.getpid()
+
 
 # Creating a temporal directory
 tmp_path = tempfile.TemporaryDirectory()
@@ -272,6 +281,603 @@ def test_fitness_module():
     os.remove('error.tar.gz')
 
 
+def _num_atoms_cost(Individual, factor=1, wd='.'):
+    Individual.cost = factor * Individual.mol.GetNumAtoms()
+    return Individual
+
+
+def test_WorkerPool():
+    individuals = [utils.Individual(Chem.MolFromSmiles(smi), idx=i) for i, smi in enumerate(['CC', 'CCO', 'CCCN'])]
+    with utils.WorkerPool(_num_atoms_cost, costfunc_kwargs={'factor': 2}, njobs=2) as pool:
+        # The same pool is reused
+        for _ in range(2):
+            evaluated = list(pool.imap(individuals))
+            pool.clean()
+    assert [individual.idx for individual in evaluated] == [0, 1, 2]
+    assert [individual.cost for individual in evaluated] == [4, 6, 8]
+    with utils.WorkerPool(_num_atoms_cost, njobs=2) as pool:
+        assert pool.map(abs, [-1, 2, -3]) == [1, 2, 3]
+
+
+def test_evaluation_callback():
+    individuals = [utils.Individual(Chem.MolFromSmiles(smi), idx=i) for i, smi in enumerate(['CC', 'CCO', 'CCCN'])]
+    with utils.WorkerPool(_num_atoms_cost, njobs=2) as pool:
+        evaluated = dict(pool.imap_unordered(individuals))
+    assert {i: individual.idx for i, individual in evaluated.items()} == {0: 0, 1: 1, 2: 2}
+
+    for mode in ['generational', 'steady_state']:
+        finished = []
+        out = utils.GA(
+            seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+            maxiter=2,
+            popsize=4,
+            crem_db_path=crem_db_path,
+            mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8},
+            costfunc=_num_atoms_cost,
+            costfunc_kwargs={},
+            mode=mode)
+        out(njobs=2, callback=finished.append)
+        # Every evaluated Individual was reported once
+        assert sorted(individual.idx for individual in finished) == sorted(
+            individual.idx for individual in out.SawIndividuals)
+        assert all(np.isfinite(individual.cost) for individual in finished)
+
+
+def test_GA_steady_state():
+    out = utils.GA(
+        seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+        maxiter=3,
+        popsize=4,
+        crem_db_path=crem_db_path,
+        mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8},
+        costfunc=_num_atoms_cost,
+        costfunc_kwargs={},
+        save_pop_every_gen=1,
+        deffnm='test_GA_steady_state',
+        mode='steady_state')
+    out(njobs=2)
+    assert out.NumGens == 3
+    assert len(out.best_cost) == len(out.avg_cost) == 3
+    assert list(out.acceptance) == [0, 1, 2, 3]
+    assert out.pop == sorted(out.pop)
+    assert all(individual.genID <= 3 and individual.kept_gens for individual in out.pop)
+    assert len(out.pop) == 4
+    assert all(isinstance(individual, utils.IndividualRecord) for individual in out.SawIndividuals)
+
+
+def _failing_in_workers_cost(Individual, wd='.'):
+    # The first offspring can only be evaluated in the main process
+    if Individual.idx == 4 and os.getpid() != MAIN_PID:
+        raise RuntimeError('Failing in the workers of the pool')
+    return _num_atoms_cost(Individual, wd=wd)
+
+
+def test_GA_parallel_mutation():
+    results = []
+    for parallel_mutation in [False, True, True]:
+        out = utils.GA(
+            seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+            maxiter=2,
+            popsize=4,
+            crem_db_path=crem_db_path,
+            mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8, 'ncores': 2},
+            costfunc=_failing_in_workers_cost,
+            costfunc_kwargs={},
+            randomseed=123,
+            parallel_mutation=parallel_mutation)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            out(njobs=2)
+        # The serial fallback was used
+        assert any('Trying with serial' in str(w.message) for w in caught)
+        assert out.NumGens == 2
+        assert all(individual.pdbqt for individual in out.SawIndividuals)
+        saw = sorted(out.SawIndividuals, key=lambda individual: individual.idx)
+        # Labeled in the order of creation
+        assert [individual.idx for individual in saw] == list(range(len(saw)))
+        assert [individual.genID for individual in saw] == sorted(individual.genID for individual in saw)
+        assert {individual.genID for individual in saw} <= {0, 1, 2}
+        assert all(individual.genID == 0 for individual in saw[:4])
+        assert saw[4].genID == 1 and saw[4].cost == saw[4].mol.GetNumAtoms()
+        results.append([(individual.smiles, individual.idx, individual.genID, individual.cost) for individual in saw])
+    # Reproducible and the same with and without parallel_mutation
+    assert results[0] == results[1] == results[2]
+
+
+def test_CremCache():
+    mol = Chem.MolFromSmiles(TEST_DATA['x0161']['smiles'])
+    kwargs = {'radius': 1, 'min_size': 0, 'max_size': 8, 'return_mol': True}
+    with tempfile.TemporaryDirectory() as tmp_path:
+        cache = utils.CremCache(os.path.join(tmp_path, 'crem.sqlite'))
+        expected = [smi for smi, _ in utils.mutate_mol(mol, crem_db_path, **kwargs)]
+        for _ in range(2):
+            assert [smi for smi, _ in cache.mutate_mol(mol, crem_db_path, **kwargs)] == expected
+        assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+        # Persistent
+        cache = utils.CremCache(os.path.join(tmp_path, 'crem.sqlite'))
+        assert [smi for smi, _ in cache.mutate_mol(mol, crem_db_path, ncores=2, **kwargs)] == expected
+        assert cache.hits == 1
+        # Not deterministic, not cached
+        cache.mutate_mol(mol, crem_db_path, max_replacements=2, **kwargs)
+        assert cache.misses == 1
+
+
+def test_reactant_zone_cache():
+    for parallel_mutation in [False, True]:
+        out = utils.GA(
+            seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+            maxiter=2,
+            popsize=4,
+            crem_db_path=crem_db_path,
+            mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8, 'replace_ids': [10, 11, 12, 13],
+                                'protected_ids': [5]},
+            costfunc=_num_atoms_cost,
+            costfunc_kwargs={},
+            randomseed=123,
+            parallel_mutation=parallel_mutation,
+            mcs_timeout=10)
+        out(njobs=2)
+        assert out.NumGens == 2
+        for individual in out.pop:
+            if '_reactant_zone' in individual.__dict__:
+                assert individual._reactant_zone[1] == utils.update_reactant_zone(
+                    out.InitIndividual.mol, individual.mol, parent_replace_ids=[10, 11, 12, 13], parent_protected_ids=[5])
+    # The cache is removed if the molecule changes
+    individual.mol = Chem.MolFromSmiles('CCO')
+    assert '_reactant_zone' not in individual.__dict__
+
+
+def test_select_parents():
+    costs = [3, -10, 0.5, -1]
+    for method in ['roulette', 'rank', 'tournament']:
+        a = utils.select_parents(costs, 50, method=method, beta=1, rng=np.random.default_rng(1))
+        b = utils.select_parents(costs, 50, method=method, beta=1, rng=np.random.default_rng(1))
+        assert (a == b).all() and len(a) == 50
+        assert ((0 <= a) & (a < len(costs))).all()
+        # The best is the most selected
+        assert np.bincount(a).argmax() == 1
+    # A tournament of all the population always select the best
+    assert (utils.select_parents(costs, 10, method='tournament', tournament_size=50) == 1).all()
+    try:
+        utils.select_parents(costs, 1, method='lottery')
+        raise AssertionError('ValueError was not raised')
+    except ValueError:
+        pass
+
+    out = utils.GA(
+        seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+        maxiter=2,
+        popsize=4,
+        crem_db_path=crem_db_path,
+        mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8},
+        costfunc=_num_atoms_cost,
+        costfunc_kwargs={},
+        selection='tournament')
+    out(njobs=2)
+    assert out.NumGens == 2
+
+
+def test_RunLog():
+    out = utils.GA(
+        seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+        maxiter=3,
+        popsize=4,
+        crem_db_path=crem_db_path,
+        mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8},
+        costfunc=_num_atoms_cost,
+        costfunc_kwargs={},
+        save_pop_every_gen=2,
+        checkpoint=True,
+        deffnm='test_RunLog',
+        randomseed=123)
+    out(njobs=2)
+    loaded = utils.RunLog('cpt.runlog').load()
+    assert loaded.NumGens == out.NumGens == 3
+    assert loaded.best_cost == out.best_cost
+    assert loaded.acceptance == out.acceptance
+    assert loaded.pop == out.pop
+    assert {record.smiles: record.kept_gens for record in loaded.SawIndividuals} == \
+        {record.smiles: record.kept_gens for record in out.SawIndividuals}
+
+    # An incomplete record at the end is ignored
+    with open('cpt.runlog', 'ab') as f:
+        f.write(b'incomplete')
+    loaded = utils.RunLog('cpt.runlog').load()
+    assert loaded.NumGens == 3
+
+    # Continue writing on the same log
+    loaded.maxiter = 1
+    loaded(njobs=2)
+    reloaded = utils.RunLog('cpt.runlog').load()
+    assert reloaded.NumGens == 4
+    assert len(reloaded.SawIndividuals) == len(loaded.SawIndividuals)
+    os.remove('cpt.runlog')
+
+
+def test_IslandGA():
+    islands = utils.IslandGA(
+        nislands=2,
+        migration_interval=1,
+        migrants=1,
+        migration_dir='test_IslandGA',
+        seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+        maxiter=2,
+        popsize=3,
+        crem_db_path=crem_db_path,
+        mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8},
+        costfunc=_num_atoms_cost,
+        costfunc_kwargs={},
+        deffnm='test_IslandGA',
+        randomseed=123)
+    for _ in range(2):
+        islands(njobs=2)
+        assert [ga.NumGens for ga in islands.islands] == [2, 2]
+        assert len(islands.pop) == 3
+        assert islands.pop[0].cost == min(individual.cost for individual in islands.SawIndividuals)
+        # What the islands know about the others
+        external_smiles = islands.islands[0].ExternalSawSmiles | islands.islands[1].ExternalSawSmiles
+        assert external_smiles <= set(individual.smiles for individual in islands.SawIndividuals)
+        assert 'CCCCCCCCCC' not in external_smiles
+        assert utils.Individual(Chem.MolFromSmiles('CCCCCCCCCC')) not in islands.pop
+
+        # Leftovers of the campaign of a third island, the next run on the same directory must not use them
+        migration = utils.Migration('test_IslandGA')
+        migration.publish_seen(2, ['CCCCCCCCCC'])
+        stale = utils.Individual(Chem.MolFromSmiles('CCCCCCCCCC'))
+        stale.cost = -np.inf
+        migration.emigrate(2, 1, [stale])
+    print(islands.to_dataframe())
+
+
+def test_DockingCache():
+    with tempfile.TemporaryDirectory() as tmp_path:
+        cache = fitness.DockingCache(tmp_path)
+        key = cache.key('CCO', exhaustiveness=8, boxsize=[10, 10, 10])
+        assert key == cache.key('CCO', boxsize=[10, 10, 10], exhaustiveness=8)
+        assert key != cache.key('CCO', exhaustiveness=4, boxsize=[10, 10, 10])
+        assert cache.get(key) is None
+        cache.put(key, -5.2, 'MODEL 1\nENDMDL\n', smiles='CCO')
+        assert cache.get(key) == (-5.2, 'MODEL 1\nENDMDL\n')
+        assert len(cache) == 1
+
+        # Least recently used entries are removed
+        cache.max_size = 1e-4
+        for i in range(10):
+            cache.put(cache.key('C' * (i + 1)), -float(i), os.urandom(64).hex())
+        assert 0 < len(cache) < 10
+        assert cache.get(key) is None
+        assert cache.get(cache.key('C' * 10)) is not None
+
+        # The total size is kept by the database, also with replaced entries and other connections
+        other = fitness.DockingCache(tmp_path)
+        other.put(cache.key('C' * 10), -9.0, os.urandom(32).hex())
+        for con in [cache.connection, other.connection]:
+            total = con.execute("SELECT total FROM docking_size").fetchone()[0]
+            assert total == con.execute("SELECT TOTAL(size) FROM docking").fetchone()[0]
+
+
+def test_vina_python_backend():
+    kwargs = dict(
+        wd=wd,
+        receptor_pdbqt_path=TEST_DATA['x0161']['protein']['pdbqt'],
+        boxcenter=TEST_DATA['x0161']['box']['boxcenter'],
+        boxsize=TEST_DATA['x0161']['box']['boxsize'],
+        exhaustiveness=1,
+        vina_seed=1234,
+        backend='python')
+    for smiles in ['CCO', 'CCN']:
+        individual = fitness.CostOnlyVina(utils.Individual(Chem.MolFromSmiles(smiles)), **kwargs)
+        assert individual.cost < 0
+    # The receptor was loaded only once
+    assert len(fitness._vina_objects) == 1
+    fitness.CostOnlyVina(
+        utils.Individual(Chem.MolFromSmiles(TEST_DATA['x0161']['smiles'])),
+        constraint=True,
+        constraint_type='score_only',
+        constraint_ref=Chem.MolFromMolFile(TEST_DATA['x0161']['ligand_3D']),
+        constraint_receptor_pdb_path=TEST_DATA['x0161']['protein']['pdb'],
+        **kwargs)
+
+
+def test_io_mode_memory():
+    memory_wd = os.path.join(wd, 'memory')
+    kwargs = dict(
+        wd=memory_wd,
+        vina_executable=vina_executable,
+        receptor_pdbqt_path=TEST_DATA['x0161']['protein']['pdbqt'],
+        boxcenter=TEST_DATA['x0161']['box']['boxcenter'],
+        boxsize=TEST_DATA['x0161']['box']['boxsize'],
+        exhaustiveness=1,
+        vina_seed=1234,
+        io_mode='memory')
+    individual = fitness.CostOnlyVina(utils.Individual(Chem.MolFromSmiles('CCO')), **kwargs)
+    assert individual.cost < 0
+    assert individual.pdbqt.startswith('MODEL')
+    for backend in ['executable', 'python']:
+        individual = fitness.CostOnlyVina(
+            utils.Individual(Chem.MolFromSmiles(TEST_DATA['x0161']['smiles'])),
+            constraint=True,
+            constraint_type='local_only',
+            constraint_ref=Chem.MolFromMolFile(TEST_DATA['x0161']['ligand_3D']),
+            constraint_receptor_pdb_path=TEST_DATA['x0161']['protein']['pdb'],
+            backend=backend,
+            **kwargs)
+        # The optimized pose was read
+        assert 'ATOM' in individual.pdbqt
+    # Nothing is written on wd and the staging directory is cleaned
+    assert not os.path.exists(memory_wd)
+    assert not os.listdir(fitness._memory_dir())
+
+
+def test_receptor_jobs():
+    kwargs = dict(
+        wd=os.path.join(wd, 'receptor_jobs'),
+        vina_executable=vina_executable,
+        receptor_pdbqt_path=[TEST_DATA['x0161']['protein']['pdbqt'], TEST_DATA['6lu7']['protein']['pdbqt']],
+        boxcenter=[TEST_DATA['x0161']['box']['boxcenter'], TEST_DATA['6lu7']['box']['boxcenter']],
+        boxsize=[TEST_DATA['x0161']['box']['boxsize'], TEST_DATA['6lu7']['box']['boxsize']],
+        vina_score_type=['min', 'max'],
+        exhaustiveness=1,
+        vina_seed=1234)
+    results = []
+    for receptor_jobs, io_mode in [(1, 'disk'), (2, 'disk'), (2, 'memory')]:
+        individual = fitness.CostMultiReceptorsOnlyVina(
+            utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234), receptor_jobs=receptor_jobs, io_mode=io_mode,
+            **kwargs)
+        results.append((individual.vina_score, individual.pdbqt))
+    # The same results in the order of the receptors
+    assert results[0] == results[1] == results[2]
+    assert os.path.isdir(os.path.join(wd, 'receptor_jobs', 'receptor_1'))
+
+    # Every receptor writes its own error report
+    failing_vina = os.path.join(wd, 'failing_vina')
+    with open(failing_vina, 'w') as f:
+        f.write('#!/bin/bash\nexit 1\n')
+    os.chmod(failing_vina, 0o755)
+    kwargs['vina_executable'] = failing_vina
+    individual = fitness.CostMultiReceptorsOnlyVina(
+        utils.Individual(Chem.MolFromSmiles('CCO'), idx=42), receptor_jobs=2, **kwargs)
+    assert individual.vina_score == [np.inf, np.inf]
+    for i in range(2):
+        assert os.path.isfile(os.path.join('error', f'42_receptor_{i}_error.pbz2'))
+
+
+def _threshold_cost(Individual, cost_threshold=None, wd='.'):
+    Individual.cost = Individual.mol.GetNumAtoms()
+    Individual.cost_threshold = cost_threshold
+    return Individual
+
+
+def test_early_exit():
+    kwargs = dict(
+        wd=os.path.join(wd, 'early_exit'),
+        vina_executable=vina_executable,
+        receptor_pdbqt_path=[TEST_DATA['x0161']['protein']['pdbqt'], TEST_DATA['6lu7']['protein']['pdbqt']],
+        boxcenter=[TEST_DATA['x0161']['box']['boxcenter'], TEST_DATA['6lu7']['box']['boxcenter']],
+        boxsize=[TEST_DATA['x0161']['box']['boxsize'], TEST_DATA['6lu7']['box']['boxsize']],
+        vina_score_type=['min', 'max'],
+        exhaustiveness=1,
+        vina_seed=1234)
+    for costfunc in [fitness.CostMultiReceptors, fitness.CostMultiReceptorsOnlyVina]:
+        reference = costfunc(utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234), **kwargs)
+        # The Individual can not reach a cost lower than 0, nothing is docked
+        individual = costfunc(utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234), cost_threshold=0, **kwargs)
+        assert individual.pdbqt == ['EarlyExit', 'EarlyExit']
+        assert 0 <= individual.cost <= reference.cost
+        # Every Individual can beat it, the results do not change
+        individual = costfunc(utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234), cost_threshold=1.1, **kwargs)
+        assert (individual.cost, individual.vina_score, individual.pdbqt) == \
+            (reference.cost, reference.vina_score, reference.pdbqt)
+
+    ga_kwargs = dict(
+        seed_mol=Chem.MolFromSmiles(TEST_DATA['x0161']['smiles']),
+        maxiter=2,
+        popsize=4,
+        crem_db_path=crem_db_path,
+        mutate_crem_kwargs={'radius': 1, 'min_size': 0, 'max_size': 8},
+        costfunc_kwargs={},
+        early_exit=True)
+    try:
+        utils.GA(costfunc=_num_atoms_cost, **ga_kwargs)
+        raise AssertionError('GA accepted early_exit with a costfunc without cost_threshold')
+    except ValueError:
+        pass
+    out = utils.GA(costfunc=_threshold_cost, **ga_kwargs)
+    out(njobs=2)
+    offspring = [individual for individual in out.SawIndividuals if individual.genID > 0]
+    assert offspring and all(individual.cost_threshold is not None for individual in offspring)
+
+
+def test_prefilter():
+    mol = Chem.MolFromSmiles('C' * 42)
+    assert utils.prefilter(mol, {'MolWt': [None, 1000], 'HeavyAtomCount': [None, 40]}) == 'HeavyAtomCount'
+    assert utils.prefilter(Chem.MolFromSmiles('c1ccc(N=Nc2ccccc2)cc1'), {'lipinski': 2, 'pains': True}) == 'pains'
+    assert utils.prefilter(Chem.MolFromSmiles('CCO'), {'qed': [0.1, None], 'sa_score': [None, 6]}) is None
+    try:
+        utils.prefilter(mol, {'NotADescriptor': [None, 1]})
+        raise AssertionError('prefilter accepted a non valid gate')
+    except ValueError:
+        pass
+
+    # The rejected molecules are not docked (vina_executable does not exist)
+    kwargs = dict(
+        wd=os.path.join(wd, 'prefilter'),
+        vina_executable='not_a_vina_executable',
+        prefilter={'HeavyAtomCount': [None, 40]})
+    individual = fitness.Cost(utils.Individual(mol), receptor_pdbqt_path=TEST_DATA['x0161']['protein']['pdbqt'],
+                              boxcenter=TEST_DATA['x0161']['box']['boxcenter'],
+                              boxsize=TEST_DATA['x0161']['box']['boxsize'], **kwargs)
+    assert individual.cost == np.inf
+    assert (individual.pdbqt, individual.prefiltered) == ('Prefiltered', 'HeavyAtomCount')
+    individual = fitness.CostMultiReceptorsOnlyVina(
+        utils.Individual(mol),
+        receptor_pdbqt_path=[TEST_DATA['x0161']['protein']['pdbqt'], TEST_DATA['6lu7']['protein']['pdbqt']],
+        boxcenter=[TEST_DATA['x0161']['box']['boxcenter'], TEST_DATA['6lu7']['box']['boxcenter']],
+        boxsize=[TEST_DATA['x0161']['box']['boxsize'], TEST_DATA['6lu7']['box']['boxsize']],
+        vina_score_type=['min', 'max'], **kwargs)
+    assert individual.cost == np.inf
+    assert individual.pdbqt == ['Prefiltered', 'Prefiltered']
+
+
+def test_lazy_pdbqt():
+    individual = utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234)
+    assert 'pdbqt' not in individual.__dict__
+    # copy and pickle keep it lazy
+    pickled = utils.decompress_pickle(utils.compressed_pickle(os.path.join(wd, 'lazy'), individual))
+    for other in [copy.deepcopy(individual), pickled]:
+        assert 'pdbqt' not in other.__dict__
+    pdbqt = individual.pdbqt
+    assert pdbqt and individual.__dict__['pdbqt'] == pdbqt
+    assert utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234).pdbqt == pdbqt
+    individual = utils.Individual(Chem.MolFromSmiles('CCO'))
+    individual.pdbqt = 'Given'
+    assert individual.pdbqt == 'Given' and '_confgen_randomseed' not in individual.__dict__
+
+
+def test_confgen_many():
+    mols = [Chem.MolFromSmiles(smiles) for smiles in ['CCO', 'c1ccccc1O', 'CC(=O)Nc1ccc(O)cc1']]
+    pdbqts = utils.confgen_many(mols, njobs=2, randomseed=1234)
+    assert pdbqts == [utils.confgen(mol, randomseed=1234) for mol in mols]
+    # Failures are reported per molecule
+    pdbqts, errors = utils.confgen_many([mols[0], None], njobs=2, randomseed=[1, 2], return_errors=True)
+    assert pdbqts[0] and pdbqts[1] is None
+    assert errors[0] is None and isinstance(errors[1], Exception)
+
+
+def test_multiple_conformers():
+    smiles = 'CC(=O)Nc1ccc(O)cc1'
+    pdbqts = utils.confgen_ensemble(Chem.MolFromSmiles(smiles), num_conf=4, randomseed=1234)
+    assert 1 <= len(pdbqts) <= 4
+    # The same as preparing every conformer, also for macrocycles (meeko adds pseudo-atoms)
+    for smi in [smiles, 'C1CCCCCCCCC(=O)NCCCCCC1']:
+        mol = Chem.AddHs(Chem.MolFromSmiles(smi))
+        conf_ids = list(AllChem.EmbedMultipleConfs(mol, numConfs=3, randomSeed=1234))
+        expected = [PDBQTWriterLegacy.write_string(MoleculePreparation().prepare(mol, conformer_id=conf_id)[0])[0]
+                    for conf_id in conf_ids]
+        assert utils.conformers_to_pdbqt(mol, conf_ids) == expected
+    kwargs = dict(
+        wd=os.path.join(wd, 'num_conf'),
+        vina_executable=vina_executable,
+        receptor_pdbqt_path=TEST_DATA['x0161']['protein']['pdbqt'],
+        boxcenter=TEST_DATA['x0161']['box']['boxcenter'],
+        boxsize=TEST_DATA['x0161']['box']['boxsize'],
+        exhaustiveness=1,
+        vina_seed=1234,
+        num_conf=4)
+    results = []
+    for backend, io_mode in [('executable', 'disk'), ('executable', 'memory'), ('python', 'memory')]:
+        individual = fitness.CostOnlyVina(utils.Individual(Chem.MolFromSmiles(smiles), idx=7),
+                                          backend=backend, io_mode=io_mode, **kwargs)
+        results.append((individual.vina_score, individual.pdbqt))
+    assert np.isfinite(results[0][0])
+    assert results[0] == results[1] == results[2]
+    # All the conformers were docked in the same vina call
+    for i in range(len(pdbqts)):
+        assert os.path.isfile(os.path.join(wd, 'num_conf', f'7_conf_{i}_out.pdbqt'))
+
+
+def test_vina_output():
+    atom = "ATOM  {:5d}  C   UNL     1    {:8.3f}{:8.3f}{:8.3f}  1.00  0.00     0.210 C \n"
+    string = ""
+    for model, energy in enumerate([-5.1, -6.2, -6.2], start=1):
+        string += f"MODEL {model}\nREMARK VINA RESULT:    {energy:.3f}      {model:.3f}      {2 * model:.3f}\n"
+        string += ''.join(atom.format(i, model + i, -i, 0.5) for i in range(1, 4)) + "ENDMDL\n"
+    vina_output = utils.VinaOutput(string)
+    assert len(vina_output) == 3 and vina_output.runs == [1, 2, 3]
+    assert vina_output.best() == 1
+    assert vina_output.energies.tolist() == [-5.1, -6.2, -6.2] and vina_output.rmsd_ub.tolist() == [2, 4, 6]
+    assert vina_output.coordinates(1).tolist() == [[3, -1, 0.5], [4, -2, 0.5], [5, -3, 0.5]]
+    # The same as the previous parser
+    vina_out = utils.VINA_OUT.from_string(string)
+    assert vina_output.model(1) == ''.join(vina_out.BestEnergy().chunk)
+    assert [''.join(chunk.chunk) for chunk in vina_out.chunks] == [vina_output.model(i) for i in range(3)]
+    assert vina_out.chunks[2].atoms[0].x == 4
+    path = os.path.join(wd, 'vina_output.pdbqt')
+    with open(path, 'w') as f:
+        f.write(string)
+    mapped = utils.VinaOutput.from_file(path, use_mmap=True)
+    assert mapped.model(2) == vina_output.model(2)
+
+
+def test_keep_modes():
+    kwargs = dict(
+        wd=os.path.join(wd, 'keep_modes'),
+        vina_executable=vina_executable,
+        receptor_pdbqt_path=TEST_DATA['x0161']['protein']['pdbqt'],
+        boxcenter=TEST_DATA['x0161']['box']['boxcenter'],
+        boxsize=TEST_DATA['x0161']['box']['boxsize'],
+        exhaustiveness=1,
+        num_modes=4,
+        vina_seed=1234,
+        cache_dir=os.path.join(wd, 'keep_modes_cache'),
+        keep_modes=True)
+    individuals = []
+    for _ in range(2):
+        # The second time from the cache
+        individual = fitness.CostOnlyVina(
+            utils.Individual(Chem.MolFromSmiles('CC(=O)Nc1ccc(O)cc1'), randomseed=1234), **kwargs)
+        docking = individual.docking
+        assert isinstance(docking, utils.DockingResult)
+        assert docking.energies[docking.best()] == individual.vina_score
+        assert docking.model(docking.best()) == individual.pdbqt
+        assert docking.coordinates.shape[:1] == docking.rmsd_lb.shape == (len(docking),)
+        individuals.append(individual)
+    assert individuals[0].docking.energies.tolist() == individuals[1].docking.energies.tolist()
+
+    sdf_name = os.path.join(wd, 'keep_modes')
+    utils.make_sdf(individuals[:1], sdf_name=sdf_name, all_modes=True)
+    mols = list(Chem.SDMolSupplier(f"{sdf_name}.sdf"))
+    assert [float(mol.GetProp('vina_score')) for mol in mols] == individuals[0].docking.energies.tolist()
+
+    kwargs.pop('num_modes')
+    kwargs.update(dict(
+        receptor_pdbqt_path=[TEST_DATA['x0161']['protein']['pdbqt'], TEST_DATA['6lu7']['protein']['pdbqt']],
+        boxcenter=[TEST_DATA['x0161']['box']['boxcenter'], TEST_DATA['6lu7']['box']['boxcenter']],
+        boxsize=[TEST_DATA['x0161']['box']['boxsize'], TEST_DATA['6lu7']['box']['boxsize']],
+        vina_score_type=['min', 'max']))
+    individual = fitness.CostMultiReceptorsOnlyVina(utils.Individual(Chem.MolFromSmiles('CCO'), randomseed=1234), **kwargs)
+    assert [docking.energies[docking.best()] for docking in individual.docking] == individual.vina_score
+
+
+def test_docking_timeout():
+    start = time.monotonic()
+    try:
+        utils.run('sleep 30 & sleep 30', timeout=1)
+        raise AssertionError('utils.run did not time out')
+    except subprocess.TimeoutExpired:
+        pass
+    assert time.monotonic() - start < 10
+
+    # A vina executable that hangs
+    slow_vina = os.path.join(wd, 'slow_vina')
+    with open(slow_vina, 'w') as f:
+        f.write('#!/bin/bash\nsleep 30\n')
+    os.chmod(slow_vina, 0o755)
+    kwargs = dict(
+        wd=os.path.join(wd, 'timeout'),
+        vina_executable=slow_vina,
+        receptor_pdbqt_path=TEST_DATA['x0161']['protein']['pdbqt'],
+        boxcenter=TEST_DATA['x0161']['box']['boxcenter'],
+        boxsize=TEST_DATA['x0161']['box']['boxsize'],
+        exhaustiveness=1,
+        timeout=1)
+    start = time.monotonic()
+    individual = fitness.CostOnlyVina(utils.Individual(Chem.MolFromSmiles('CCO')), **kwargs)
+    assert individual.cost == np.inf
+    assert individual.pdbqt == 'VinaTimeout'
+    individual = fitness.CostOnlyVina(
+        utils.Individual(Chem.MolFromSmiles(TEST_DATA['x0161']['smiles'])),
+        constraint=True,
+        constraint_type='local_only',
+        constraint_ref=Chem.MolFromMolFile(TEST_DATA['x0161']['ligand_3D']),
+        constraint_receptor_pdb_path=TEST_DATA['x0161']['protein']['pdb'],
+        constraint_num_conf=5,
+        **kwargs)
+    assert individual.cost == np.inf
+    assert individual.pdbqt == 'VinaTimeout'
+    assert time.monotonic() - start < 20
+
+
 def test_home():
     home.home(dataDir='data')
 
@@ -314,6 +920,55 @@ def test_Individual():
     assert I1 % I2 == 0
     assert divmod(I1, I2) == (5, 0)
     assert I1**I2 == 100
+    # Cached smiles and key
+    assert I1.smiles == 'CC'
+    assert I1.key == I5.key != I2.key
+    I1.mol = Chem.MolFromSmiles('CCN')
+    assert I1.smiles == 'CCN'
+    assert I1.key == utils.Individual(Chem.MolFromSmiles('NCC'), pdbqt=I1.pdbqt).key
+    assert I3.smiles == 'CC'
+    assert '_smiles' not in utils.to_dataframe([I1]).columns
+
+
+def test_IndividualRecord():
+    individual = utils.Individual(Chem.MolFromSmiles('CCO'), idx=3, cost=-2)
+    individual.vina_score = -2
+    individual.kept_gens = set([1])
+    record = utils.IndividualRecord(individual)
+    assert record == individual and individual == record
+    assert individual in set([record]) and record in set([individual])
+    assert record.pdbqt == individual.pdbqt
+    assert record.key == individual.key
+    assert Chem.MolToSmiles(record.mol) == 'CCO'
+    assert (record.idx, record.cost, record.vina_score) == (3, -2, -2)
+    # Shared with the Individual
+    individual.kept_gens.add(2)
+    assert record.kept_gens == {1, 2}
+    assert not hasattr(record, '__dict__')
+    record = copy.deepcopy(record)
+    assert record.pdbqt == individual.pdbqt
+    assert list(utils.to_dataframe([record]).columns) == ['pdbqt', 'cost', 'idx', 'vina_score', 'kept_gens']
+
+
+def test_compressed_pickle():
+    data = {'individual': utils.Individual(Chem.MolFromSmiles('CCO')), 'costfunc': lambda x: x}
+    path = os.path.join(wd, 'test_compressed_pickle')
+    for codec in ['bz2', 'gzip', 'lzma']:
+        file = utils.compressed_pickle(path, data, codec=codec)
+        assert file == f"{path}{utils.CODECS[codec][0]}"
+        loaded = utils.decompress_pickle(file)
+        assert loaded['individual'] == data['individual']
+        assert loaded['costfunc'](3) == 3
+        os.remove(file)
+    # Codec from the extension
+    assert utils.compressed_pickle(f"{path}.pgz", 1) == f"{path}.pgz"
+    assert utils.decompress_pickle(f"{path}.pgz") == 1
+    os.remove(f"{path}.pgz")
+    try:
+        utils.compressed_pickle(path, 1, codec='rar')
+        raise AssertionError('ValueError was not raised')
+    except ValueError:
+        pass
 
 
 def test_miscellanea():